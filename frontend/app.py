@@ -144,10 +144,17 @@ def dashboard():
     token = session["access_token"]
     user = session["user"]
 
-    transactions = api_get("/transactions", token) or []
-    notifications = api_get("/notifications", token) or []
+    # /transactions dan /users sekarang berhalaman: {"items": [...], "next_cursor": ...}
+    transactions = (api_get("/transactions", token) or {}).get("items", [])
+    # Satu halaman inbox, bukan seluruh tabel notifikasi
+    # (unread count ikut di respons inbox sebagai `unread_count`)
+    if user.get("role") == "admin":
+        notifications = (api_get("/notifications?limit=20", token) or {}).get("items", [])
+    else:
+        inbox = api_get(f"/notifications/users/{user.get('id')}?limit=20", token) or {}
+        notifications = inbox.get("items", [])
     reports = api_get("/reports", token) or []
-    users = api_get("/users", token) or []
+    users = (api_get("/users", token) or {}).get("items", [])
 
     if user.get("role") == "admin":
         return render_template("dashboard_admin.html",
@@ -325,7 +332,12 @@ def create_notification():
 @login_required
 def get_notifications():
     token = session["access_token"]
-    return jsonify(api_get("/notifications", token)), 200
+    user = session["user"]
+    before = request.args.get("before")
+    endpoint = f"/notifications/users/{user.get('id')}?limit=20"
+    if before:
+        endpoint += f"&before={before}"
+    return jsonify(api_get(endpoint, token)), 200
 
 # ------------------------------------------------------
 # SYNC REPORTS
@@ -1,33 +1,106 @@
-from flask import Flask, request, jsonify
+import time
+
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-from flask_restx import Api, Resource, fields
+from flask_restx import Api, Resource, fields, inputs, marshal, reqparse
+from sqlalchemy import false, insert, select
+from sqlalchemy.exc import IntegrityError
 from models import db, Notification
 from config import Config
+from auth import InvalidToken, TokenVerifier, load_identity
+from delivery import DeliveryWorkerPool, enqueue
+from inbox import add_unread, mark_read, mark_read_up_to, rebuild_unread_counters, unread_count
+from pagination import keyset_page, time_keyset_page
+from schema import migrate
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db.init_app(app)
 CORS(app)
+delivery_pool = DeliveryWorkerPool(app)
+token_verifier = TokenVerifier.from_service(
+    Config.USER_SERVICE_URL,
+    issuer=Config.JWT_ISSUER,
+    refresh_interval=Config.AUTH_REVOCATION_REFRESH_SECONDS
+)
+
+
+@app.before_request
+def authenticate():
+    load_identity(token_verifier, trust_headers=Config.AUTH_TRUST_HEADERS)
+
+
+@app.errorhandler(InvalidToken)
+def handle_invalid_token(error):
+    return jsonify({'message': str(error)}), 401, {'WWW-Authenticate': 'Bearer'}
 
 api = Api(app, doc="/api-docs/", version="1.0",
           title="Notification Service",
           description="Sends notifications for transactions and user events.")
 
+
+@api.errorhandler(InvalidToken)
+def handle_api_invalid_token(error):
+    return {'message': str(error)}, 401, {'WWW-Authenticate': 'Bearer'}
+
 notif_model = api.model("Notification", {
     'id': fields.Integer(readOnly=True),
     'user_id': fields.Integer(required=True),
+    'title': fields.String(required=False, default='Notification'),
     'message': fields.String(required=True),
+    'type': fields.String(required=False, default='INFO'),
+    'event_id': fields.String(required=False, description='Sender event id, duplicates are ignored'),
+    'is_read': fields.Boolean(readOnly=True),
+    'created_at': fields.DateTime(readOnly=True),
+})
+
+bulk_notif_model = api.model("BulkNotification", {
+    'notifications': fields.List(fields.Nested(notif_model), required=True),
+})
+
+mark_read_model = api.model("MarkRead", {
+    'up_to_id': fields.Integer(required=False, description='Mark unread notifications with id <= this as read (omit = all)'),
 })
 
 notif_ns = api.namespace("notifications", description="Notification operations")
 
+list_parser = reqparse.RequestParser()
+list_parser.add_argument('limit', type=int, location='args', help='Page size')
+list_parser.add_argument('after', type=int, location='args', help='Return notifications with id greater than this cursor')
+list_parser.add_argument('user_id', type=int, location='args')
+
+inbox_parser = reqparse.RequestParser()
+inbox_parser.add_argument('limit', type=int, location='args', help='Page size')
+inbox_parser.add_argument('before', type=str, location='args', help='Cursor from the previous page')
+inbox_parser.add_argument('unread', type=inputs.boolean, location='args', default=False,
+                          help='Only unread notifications')
+
 
 @notif_ns.route("/")
 class NotificationList(Resource):
 
-    @notif_ns.marshal_list_with(notif_model)
+    @notif_ns.expect(list_parser)
     def get(self):
-        return [n.to_dict() for n in Notification.query.all()]
+        """List notifications (keyset pagination by id)"""
+        args = list_parser.parse_args()
+        query = Notification.query
+        if args['user_id'] is not None:
+            require_inbox_owner(args['user_id'])
+            query = query.filter(Notification.user_id == args['user_id'])
+        elif g.user_id is not None and g.role != 'ADMIN':
+            # Daftar semua user hanya untuk ADMIN / panggilan internal
+            api.abort(403, 'user_id is required')
+
+        notifications, next_cursor = keyset_page(
+            query, Notification.id,
+            after=args['after'],
+            limit=args['limit'] or Config.PAGE_SIZE_DEFAULT,
+            max_limit=Config.PAGE_SIZE_MAX
+        )
+        return {
+            'items': marshal(notifications, notif_model),
+            'next_cursor': next_cursor
+        }
 
     @notif_ns.expect(notif_model)
     @notif_ns.marshal_with(notif_model, code=201)
@@ -36,13 +109,196 @@ class NotificationList(Resource):
         data = request.json
         notif = Notification(
             user_id=data['user_id'],
-            message=data['message']
+            title=data.get('title') or 'Notification',
+            message=data['message'],
+            type=data.get('type') or 'INFO',
+            event_id=data.get('event_id')
         )
         db.session.add(notif)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # event_id sudah pernah diterima: kembalikan yang lama
+            db.session.rollback()
+            notif = Notification.query.filter_by(event_id=data['event_id']).first()
+            return notif.to_dict(), 201
+
+        # Pengiriman ke channel dikerjakan worker, request hanya menulis job
+        enqueue([notif.to_dict()], Config.DELIVERY_CHANNELS)
+        add_unread([notif.user_id])
         db.session.commit()
+        delivery_pool.notify()
         return notif.to_dict(), 201
 
 
+def _existing_event_ids(event_ids):
+    if not event_ids:
+        return set()
+    return set(db.session.execute(
+        select(Notification.event_id).where(Notification.event_id.in_(event_ids))
+    ).scalars())
+
+
+@notif_ns.route("/bulk")
+class NotificationBulk(Resource):
+
+    @notif_ns.expect(bulk_notif_model)
+    def post(self):
+        """Create many notifications in one request (event_id duplicates are skipped)"""
+        data = request.get_json(silent=True) or {}
+        items = data.get('notifications')
+        if not isinstance(items, list):
+            return {'error': 'notifications must be a list'}, 400
+        if len(items) > Config.BULK_MAX_ITEMS:
+            return {'error': f'Limited to {Config.BULK_MAX_ITEMS} notifications'}, 413
+
+        rows, invalid = [], 0
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('user_id'), int) or not item.get('message'):
+                invalid += 1
+                continue
+            rows.append({
+                'user_id': item['user_id'],
+                'title': str(item.get('title') or 'Notification')[:150],
+                'message': str(item['message'])[:500],
+                'type': item.get('type') or 'INFO',
+                'event_id': item.get('event_id'),
+                'is_read': False,
+            })
+
+        # Dedupe di dalam batch dan terhadap yang sudah tersimpan
+        for _ in range(2):
+            seen = _existing_event_ids([r['event_id'] for r in rows if r['event_id']])
+            fresh = []
+            for row in rows:
+                if row['event_id'] and row['event_id'] in seen:
+                    continue
+                if row['event_id']:
+                    seen.add(row['event_id'])
+                fresh.append(row)
+            try:
+                if fresh:
+                    created = db.session.execute(
+                        insert(Notification).returning(
+                            Notification.id, Notification.user_id, Notification.title,
+                            Notification.message, Notification.type
+                        ),
+                        fresh
+                    ).mappings().all()
+                    enqueue(created, Config.DELIVERY_CHANNELS)
+                    add_unread([row['user_id'] for row in created])
+                db.session.commit()
+                break
+            except IntegrityError:
+                # Pengiriman paralel dengan event_id sama; ulangi dedupe sekali
+                db.session.rollback()
+        else:
+            return {'error': 'Concurrent delivery conflict, please retry'}, 409
+
+        if fresh:
+            delivery_pool.notify()
+        return {
+            'created': len(fresh),
+            'duplicates': len(rows) - len(fresh),
+            'invalid': invalid
+        }, 201
+
+
+# ============================================================
+#                 INBOX PER USER
+# ============================================================
+def require_inbox_owner(user_id):
+    """User hanya boleh membuka inbox-nya sendiri; ADMIN dan panggilan internal (tanpa identitas) bebas"""
+    if g.user_id is not None and g.user_id != user_id and g.role != 'ADMIN':
+        api.abort(403, 'Not allowed to access this inbox')
+
+
+@notif_ns.route("/users/<int:user_id>")
+@notif_ns.param("user_id", "User ID")
+class UserInbox(Resource):
+
+    @notif_ns.expect(inbox_parser)
+    def get(self, user_id):
+        """User inbox, newest first (keyset pagination via index (user_id, is_read, created_at))"""
+        require_inbox_owner(user_id)
+        args = inbox_parser.parse_args()
+        query = Notification.query.filter(Notification.user_id == user_id)
+        if args['unread']:
+            query = query.filter(Notification.is_read == false())
+
+        try:
+            notifications, next_cursor = time_keyset_page(
+                query, Notification.created_at, Notification.id,
+                before=args['before'],
+                limit=args['limit'] or Config.PAGE_SIZE_DEFAULT,
+                max_limit=Config.PAGE_SIZE_MAX
+            )
+        except ValueError as e:
+            api.abort(400, str(e))
+
+        return {
+            'items': marshal(notifications, notif_model),
+            'next_cursor': next_cursor,
+            'unread_count': unread_count(user_id)
+        }
+
+
+@notif_ns.route("/users/<int:user_id>/unread-count")
+@notif_ns.param("user_id", "User ID")
+class UserUnreadCount(Resource):
+
+    def get(self, user_id):
+        """Unread badge count (single-row read)"""
+        require_inbox_owner(user_id)
+        return {'user_id': user_id, 'unread_count': unread_count(user_id)}
+
+
+@notif_ns.route("/users/<int:user_id>/read")
+@notif_ns.param("user_id", "User ID")
+class UserMarkRead(Resource):
+
+    @notif_ns.expect(mark_read_model)
+    def post(self, user_id):
+        """Mark the user's notifications read up to an id (omit up_to_id = all)"""
+        require_inbox_owner(user_id)
+        data = request.get_json(silent=True) or {}
+        up_to_id = data.get('up_to_id')
+        if up_to_id is not None and not isinstance(up_to_id, int):
+            return {'error': 'up_to_id must be an integer'}, 400
+
+        marked = mark_read_up_to(user_id, up_to_id)
+        return {'marked': marked, 'unread_count': unread_count(user_id)}
+
+
+@notif_ns.route("/<int:notification_id>/read")
+@notif_ns.param("notification_id", "Notification ID")
+class NotificationRead(Resource):
+
+    @notif_ns.marshal_with(notif_model)
+    def post(self, notification_id):
+        """Mark a single notification read"""
+        notif = db.session.get(Notification, notification_id)
+        if notif is None:
+            api.abort(404, 'Notification not found')
+        require_inbox_owner(notif.user_id)
+        return mark_read(notification_id).to_dict()
+
+
+# ============================
+# DELIVERY QUEUE (INTERNAL)
+# ============================
+
+@app.route("/internal/delivery/stats")
+def delivery_stats():
+    return jsonify(delivery_pool.stats())
+
+
+@app.route("/internal/delivery/dead/retry", methods=["POST"])
+def delivery_retry_dead():
+    """Masukkan lagi job dead-letter ke antrean (opsional ?channel=)"""
+    return jsonify({'requeued': delivery_pool.retry_dead(request.args.get('channel'))})
+
+
 @app.route("/health")
 def health():
     return jsonify({'status': 'healthy', 'service': Config.SERVICE_NAME})
@@ -52,10 +308,44 @@ def health():
 def create_db():
     with app.app_context():
         db.create_all()
+        for change in migrate():
+            print(f'Migrated: {change}')
         print("Database created for Notification Service.")
 
 
+@app.cli.command("rebuild-unread-counters")
+def rebuild_unread_counters_command():
+    """Hitung ulang unread_counters dari tabel notification (backfill data lama)"""
+    with app.app_context():
+        users = rebuild_unread_counters()
+        print(f"Rebuilt unread counters for {users} user(s)")
+
+
+@app.cli.command("run-delivery-workers")
+def run_delivery_workers():
+    """Worker pool pengiriman di proses terpisah (jalan terus)"""
+    delivery_pool.start()
+    print(f"Started {delivery_pool.workers} delivery worker(s), Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        delivery_pool.stop()
+
+
+@app.cli.command("prune-deliveries")
+def prune_deliveries():
+    """Hapus job SENT yang lebih tua dari DELIVERY_RETENTION_DAYS"""
+    with app.app_context():
+        count = delivery_pool.prune(Config.DELIVERY_RETENTION_DAYS)
+        print(f"Pruned {count} delivered job(s)")
+
+
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        # Upgrade DB lama: event_id + index, lalu unread_counters dari data lama
+        migrate()
+    if Config.DELIVERY_WORKERS_ENABLED:
+        delivery_pool.start()
     app.run(host="0.0.0.0", port=Config.PORT, debug=True)
@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+
+import jwt
+import requests
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = 'EdDSA'
+
+
+class InvalidToken(Exception):
+    pass
+
+
+# ============================================================
+#                 TOKEN VERIFIER (access token user-service)
+# ============================================================
+# Salinan verifier dari user-service/tokens.py (service tidak berbagi kode).
+# Access token EdDSA diverifikasi lokal pakai public key dari
+# USER_SERVICE_URL/.well-known/jwks.json; daftar pencabutan disinkron
+# inkremental paling sering tiap `refresh_interval` detik.
+# Token lain (JWT HS256 dari api-gateway) tidak diverifikasi di sini:
+# gateway sudah memverifikasinya dan meneruskan identitas lewat X-User-*.
+
+class TokenVerifier:
+
+    def __init__(self, key_source, revocation_source, issuer='user-service', refresh_interval=10.0, leeway=5):
+        self.key_source = key_source
+        self.revocation_source = revocation_source
+        self.issuer = issuer
+        self.refresh_interval = refresh_interval
+        self.leeway = leeway
+        self._revoked = {}
+        self._since = 0
+        self._next_sync = 0.0
+        self._sync_lock = threading.Lock()
+
+    @classmethod
+    def from_service(cls, base_url, issuer='user-service', refresh_interval=10.0, timeout=2.0):
+        base_url = base_url.rstrip('/')
+        jwks = jwt.PyJWKClient(f'{base_url}/.well-known/jwks.json', cache_keys=True, timeout=timeout)
+        session = requests.Session()
+        keys = {}
+
+        def key_source(kid):
+            if kid not in keys:
+                try:
+                    keys[kid] = jwks.get_signing_key(kid).key
+                except jwt.PyJWKClientError:
+                    return None
+            return keys[kid]
+
+        def revocation_source(since):
+            response = session.get(f'{base_url}/internal/auth/revocations', params={'since': since}, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+        return cls(key_source, revocation_source, issuer=issuer, refresh_interval=refresh_interval)
+
+    def _sync(self):
+        if time.monotonic() < self._next_sync:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                feed = self.revocation_source(self._since)
+            except Exception:
+                logger.exception('Token revocation sync failed')
+                self._next_sync = time.monotonic() + self.refresh_interval
+                return
+
+            revoked = dict(self._revoked)
+            revoked.update({int(user_id): not_before for user_id, not_before in feed['revocations'].items()})
+            horizon = feed['now'] - feed['ttl'] - self.leeway
+            self._revoked = {user_id: nb for user_id, nb in revoked.items() if nb >= horizon}
+            self._since = feed['now']
+            self._next_sync = time.monotonic() + self.refresh_interval
+        finally:
+            self._sync_lock.release()
+
+    def claims(self, token):
+        """Claims token user-service; None untuk token lain (mis. token api-gateway)"""
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+        if header.get('alg') != ALGORITHM:
+            return None
+        return self.verify(token)
+
+    def verify(self, token):
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+            key = self.key_source(kid)
+            if key is None:
+                raise InvalidToken('Unknown signing key')
+            claims = jwt.decode(
+                token, key,
+                algorithms=[ALGORITHM],
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={'require': ['exp', 'iat', 'sub']},
+            )
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+        self._sync()
+        not_before = self._revoked.get(int(claims['sub']))
+        if not_before is not None and claims['iat'] <= not_before:
+            raise InvalidToken('Token has been revoked')
+        return claims
+
+
+# ============================================================
+#                 IDENTITAS PEMANGGIL
+# ============================================================
+def load_identity(verifier, trust_headers=True):
+    """
+    Isi g.user_id / g.role dari Bearer token user-service, atau dari header
+    gateway (X-User-Id / X-User-Role) kalau trust_headers. Keduanya None
+    untuk panggilan internal antar service. InvalidToken kalau token EdDSA
+    tidak valid / dicabut.
+    """
+    g.user_id = g.role = None
+    auth = request.headers.get('Authorization', '')
+    claims = verifier.claims(auth[7:]) if auth.startswith('Bearer ') else None
+    if claims is not None:
+        g.user_id, g.role = int(claims['sub']), claims.get('role')
+    elif trust_headers and request.headers.get('X-User-Id'):
+        try:
+            g.user_id = int(request.headers['X-User-Id'])
+        except ValueError:
+            raise InvalidToken('Invalid X-User-Id header')
+        g.role = request.headers.get('X-User-Role')
+    if g.role:
+        g.role = g.role.upper()
@@ -14,3 +14,34 @@ class Config:
 
     # URL Service lain (optional)
     USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://localhost:3001')
+
+    # === AUTH ===
+    # Access token EdDSA dari user-service diverifikasi lokal (JWKS + daftar pencabutan);
+    # token api-gateway diteruskan, identitasnya dari header X-User-Id / X-User-Role
+    JWT_ISSUER = os.getenv('JWT_ISSUER', 'user-service')
+    AUTH_REVOCATION_REFRESH_SECONDS = float(os.getenv('AUTH_REVOCATION_REFRESH_SECONDS', 10))
+    AUTH_TRUST_HEADERS = os.getenv('AUTH_TRUST_HEADERS', 'true').lower() == 'true'
+
+    # Batas item per request POST /notifications/bulk
+    BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', 1000))
+
+    # Ukuran halaman list / inbox (keyset)
+    PAGE_SIZE_DEFAULT = int(os.getenv('PAGE_SIZE_DEFAULT', 20))
+    PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', 100))
+
+    # === DELIVERY QUEUE ===
+    # Satu job per notifikasi per channel; channel tanpa backend nyata = stand-in lokal
+    DELIVERY_CHANNELS = [c.strip() for c in os.getenv('DELIVERY_CHANNELS', 'push').split(',') if c.strip()]
+    DELIVERY_WORKERS_ENABLED = os.getenv('DELIVERY_WORKERS_ENABLED', 'true').lower() == 'true'
+    DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', 4))
+    DELIVERY_BATCH_SIZE = int(os.getenv('DELIVERY_BATCH_SIZE', 50))
+    DELIVERY_POLL_INTERVAL = float(os.getenv('DELIVERY_POLL_INTERVAL', 0.5))
+    DELIVERY_LEASE_SECONDS = int(os.getenv('DELIVERY_LEASE_SECONDS', 60))
+    DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', 8))
+    DELIVERY_BACKOFF_SECONDS = float(os.getenv('DELIVERY_BACKOFF_SECONDS', 2.0))
+    DELIVERY_MAX_BACKOFF_SECONDS = float(os.getenv('DELIVERY_MAX_BACKOFF_SECONDS', 600))
+    DELIVERY_RETENTION_DAYS = int(os.getenv('DELIVERY_RETENTION_DAYS', 7))
+    DELIVERY_WEBHOOK_URL = os.getenv('DELIVERY_WEBHOOK_URL', '')
+    DELIVERY_SEND_TIMEOUT = float(os.getenv('DELIVERY_SEND_TIMEOUT', 5.0))
+    DELIVERY_STANDIN_LATENCY_MS = float(os.getenv('DELIVERY_STANDIN_LATENCY_MS', 0))
+    DELIVERY_STANDIN_FAILURE_RATE = float(os.getenv('DELIVERY_STANDIN_FAILURE_RATE', 0))
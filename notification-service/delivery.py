@@ -0,0 +1,407 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import bindparam, func, insert, select, update
+
+from models import db, DeliveryJob
+
+
+# ============================================================
+#                 DELIVERY QUEUE + WORKER POOL
+# ============================================================
+# Request hanya menulis baris delivery_jobs (satu per channel) di commit yang
+# sama dengan Notification. Worker pool (thread) mengambil batch job PENDING
+# yang jatuh tempo, mengirim lewat channel-nya, lalu menandai SENT; gagal =
+# retry dengan exponential backoff + jitter, lalu DEAD (dead-letter) setelah
+# DELIVERY_MAX_ATTEMPTS. Klaim memakai lease di next_attempt_at:
+# - Postgres: SELECT ... FOR UPDATE SKIP LOCKED, worker tidak saling tunggu
+# - SQLite  : FOR UPDATE diabaikan; UPDATE bersyarat (next_attempt_at <= now)
+#             memastikan satu job hanya diklaim satu worker
+# Nilai lease (waktu habisnya) sekaligus token klaim:
+# - panjangnya DELIVERY_LEASE_SECONDS + jumlah job x DELIVERY_SEND_TIMEOUT,
+#   dan worker berhenti mengirim sebelum lease habis (sisa job dilepas)
+# - update SENT / retry / DEAD bersyarat next_attempt_at = lease, jadi worker
+#   yang lease-nya sudah diambil alih tidak menimpa hasil worker lain
+# Pengiriman at-least-once: job yang lease-nya habis (worker mati) diambil ulang.
+
+def _payload(notification):
+    return json.dumps({
+        'notification_id': notification['id'],
+        'user_id': notification['user_id'],
+        'title': notification['title'],
+        'message': notification['message'],
+        'type': notification['type'],
+    })
+
+
+def enqueue(notifications, channels):
+    """Tulis job untuk notifikasi yang sudah di-flush (dict id/user_id/title/message/type); tanpa commit"""
+    if not notifications or not channels:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(DeliveryJob), [
+        {
+            'notification_id': notification['id'],
+            'channel': channel,
+            'payload': _payload(notification),
+            'status': 'PENDING',
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now,
+        }
+        for notification in notifications
+        for channel in channels
+    ])
+
+
+# ------------------------------
+# CHANNELS
+# ------------------------------
+class StandInChannel:
+    """Channel lokal (email / push) untuk development: simulasi latency + gagal acak"""
+
+    def __init__(self, name, latency=0.0, failure_rate=0.0):
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.delivered = deque(maxlen=1000)     # untuk dicek manual / debugging
+
+    def send(self, payload):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError(f'{self.name} stand-in failure')
+        self.delivered.append(payload)
+
+
+class WebhookChannel:
+    """POST payload JSON ke DELIVERY_WEBHOOK_URL lewat Session keep-alive"""
+
+    def __init__(self, url, timeout=5.0, pool_size=10):
+        self.name = 'webhook'
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=pool_size))
+
+    def send(self, payload):
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        if response.status_code >= 300:
+            raise RuntimeError(f'webhook returned HTTP {response.status_code}')
+
+
+def build_channels(config):
+    """Channel dari DELIVERY_CHANNELS; webhook tanpa DELIVERY_WEBHOOK_URL memakai stand-in"""
+    channels = {}
+    for name in config.get('DELIVERY_CHANNELS', ['push']):
+        if name == 'webhook' and config.get('DELIVERY_WEBHOOK_URL'):
+            channels[name] = WebhookChannel(
+                config['DELIVERY_WEBHOOK_URL'], config.get('DELIVERY_SEND_TIMEOUT', 5.0),
+                config.get('DELIVERY_WORKERS', 4)
+            )
+        else:
+            channels[name] = StandInChannel(
+                name, config.get('DELIVERY_STANDIN_LATENCY_MS', 0) / 1000.0,
+                config.get('DELIVERY_STANDIN_FAILURE_RATE', 0.0)
+            )
+    return channels
+
+
+# ------------------------------
+# COUNTERS
+# ------------------------------
+class ChannelCounters:
+    """Total per channel + throughput 60 detik terakhir (bucket per detik)"""
+
+    WINDOW = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._buckets = {}
+
+    def record(self, channel, outcome, count=1):
+        now = int(time.time())
+        with self._lock:
+            totals = self._totals.setdefault(channel, {'sent': 0, 'retried': 0, 'dead': 0})
+            totals[outcome] += count
+            if outcome == 'sent':
+                buckets = self._buckets.setdefault(channel, [[0, 0] for _ in range(self.WINDOW)])
+                bucket = buckets[now % self.WINDOW]
+                if bucket[0] != now:
+                    bucket[0], bucket[1] = now, 0
+                bucket[1] += count
+
+    def snapshot(self):
+        now = int(time.time())
+        with self._lock:
+            result = {}
+            for channel, totals in self._totals.items():
+                recent = sum(
+                    count for second, count in self._buckets.get(channel, ())
+                    if now - second < self.WINDOW
+                )
+                result[channel] = dict(totals, sent_per_sec=round(recent / self.WINDOW, 2))
+            return result
+
+
+# ------------------------------
+# WORKER POOL
+# ------------------------------
+class DeliveryWorkerPool:
+
+    def __init__(self, app=None, channels=None):
+        self.channels = channels
+        self.counters = ChannelCounters()
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('DELIVERY_WORKERS', 4)
+        self.batch_size = app.config.get('DELIVERY_BATCH_SIZE', 50)
+        self.poll_interval = app.config.get('DELIVERY_POLL_INTERVAL', 0.5)
+        self.lease = timedelta(seconds=app.config.get('DELIVERY_LEASE_SECONDS', 60))
+        self.send_timeout = timedelta(seconds=app.config.get('DELIVERY_SEND_TIMEOUT', 5.0))
+        self.max_attempts = app.config.get('DELIVERY_MAX_ATTEMPTS', 8)
+        self.backoff = app.config.get('DELIVERY_BACKOFF_SECONDS', 2.0)
+        self.max_backoff = app.config.get('DELIVERY_MAX_BACKOFF_SECONDS', 600.0)
+        if self.channels is None:
+            self.channels = build_channels(app.config)
+
+    def notify(self):
+        """Bangunkan worker setelah enqueue (tanpa menunggu poll berikutnya)"""
+        self._wakeup.set()
+
+    # ------------------------------
+    # CLAIM (lease lewat next_attempt_at)
+    # ------------------------------
+    def _claim(self):
+        """Return (jobs, lease): lease = next_attempt_at yang dipasang, token klaim batch ini"""
+        now = datetime.utcnow()
+        ids = db.session.execute(
+            select(DeliveryJob.id)
+            .where(DeliveryJob.status == 'PENDING', DeliveryJob.next_attempt_at <= now)
+            .order_by(DeliveryJob.next_attempt_at, DeliveryJob.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not ids:
+            db.session.rollback()
+            return [], None
+
+        # Kondisi next_attempt_at <= now diulang: worker lain yang sudah
+        # mengklaim job yang sama membuatnya tidak lolos lagi (fallback SQLite)
+        lease = now + self.lease + self.send_timeout * len(ids)
+        stmt = (
+            update(DeliveryJob)
+            .where(DeliveryJob.id.in_(ids), DeliveryJob.next_attempt_at <= now)
+            .values(next_attempt_at=lease)
+            .execution_options(synchronize_session=False)
+        )
+        if getattr(db.engine.dialect, 'update_returning', False):
+            claimed = set(db.session.execute(stmt.returning(DeliveryJob.id)).scalars())
+        else:
+            db.session.execute(stmt)
+            # Tanpa RETURNING: yang benar-benar terklaim = yang membawa lease ini
+            claimed = set(db.session.execute(
+                select(DeliveryJob.id)
+                .where(DeliveryJob.id.in_(ids), DeliveryJob.next_attempt_at == lease)
+            ).scalars())
+        db.session.commit()
+        if not claimed:
+            return [], None
+
+        jobs = db.session.execute(
+            select(DeliveryJob.id, DeliveryJob.channel, DeliveryJob.attempts, DeliveryJob.payload)
+            .where(DeliveryJob.id.in_(claimed))
+            .order_by(DeliveryJob.id)
+        ).all()
+        return jobs, lease
+
+    # ------------------------------
+    # DELIVER
+    # ------------------------------
+    def process_once(self):
+        """Klaim + kirim satu batch; return jumlah job yang diproses"""
+        jobs, lease = self._claim()
+        if not jobs:
+            return 0
+
+        sent, failed, unsent = [], [], []
+        for job_id, channel, attempts, payload in jobs:
+            if datetime.utcnow() + self.send_timeout > lease:
+                # Lease hampir habis: jangan kirim lagi, sisa job dilepas di bawah
+                unsent.append(job_id)
+                continue
+            target = self.channels.get(channel)
+            try:
+                if target is None:
+                    raise RuntimeError(f'Unknown channel {channel}')
+                target.send(json.loads(payload))
+            except Exception as e:
+                failed.append((job_id, channel, attempts, str(e)[:255]))
+            else:
+                sent.append((job_id, channel))
+
+        if sent:
+            db.session.execute(
+                update(DeliveryJob)
+                .where(
+                    DeliveryJob.id.in_([job_id for job_id, _ in sent]),
+                    DeliveryJob.status == 'PENDING',
+                    DeliveryJob.next_attempt_at == lease,
+                )
+                .values(status='SENT', sent_at=datetime.utcnow(), attempts=DeliveryJob.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+        if failed:
+            self._failed(failed, lease)
+        if unsent:
+            db.session.execute(
+                update(DeliveryJob)
+                .where(DeliveryJob.id.in_(unsent), DeliveryJob.next_attempt_at == lease)
+                .values(next_attempt_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+
+        for _, channel in sent:
+            self.counters.record(channel, 'sent')
+        return len(jobs)
+
+    def _failed(self, failed, lease):
+        now = datetime.utcnow()
+        rows = []
+        for job_id, channel, attempts, error in failed:
+            attempts += 1
+            dead = attempts >= self.max_attempts
+            delay = min(self.backoff * (2 ** (attempts - 1)), self.max_backoff) * random.uniform(0.5, 1.5)
+            rows.append({
+                'job_id': job_id,
+                'new_attempts': attempts,
+                'new_status': 'DEAD' if dead else 'PENDING',
+                'retry_at': now + timedelta(seconds=delay),
+                'error': error,
+                'lease': lease,
+            })
+            self.counters.record(channel, 'dead' if dead else 'retried')
+
+        table = DeliveryJob.__table__
+        db.session.execute(
+            table.update()
+            .where(
+                table.c.id == bindparam('job_id'),
+                table.c.status == 'PENDING',
+                table.c.next_attempt_at == bindparam('lease'),
+            )
+            .values(
+                attempts=bindparam('new_attempts'),
+                status=bindparam('new_status'),
+                next_attempt_at=bindparam('retry_at'),
+                last_error=bindparam('error'),
+            ),
+            rows
+        )
+
+    def drain(self):
+        """Proses semua job yang jatuh tempo di thread ini; return total job diproses"""
+        total = 0
+        while True:
+            processed = self.process_once()
+            if not processed:
+                return total
+            total += processed
+
+    # ------------------------------
+    # THREADS
+    # ------------------------------
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                if self.process_once():
+                    continue
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Notification delivery failed')
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            self._stop.clear()
+
+            def target():
+                with self.app.app_context():
+                    self.run_forever()
+
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=target, name=f'delivery-worker-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            return self._threads
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    # ------------------------------
+    # STATS / DEAD-LETTER
+    # ------------------------------
+    def queue_depth(self):
+        """Jumlah job PENDING / DEAD per channel (SENT tidak dihitung, tabelnya terus tumbuh)"""
+        rows = db.session.execute(
+            select(DeliveryJob.status, DeliveryJob.channel, func.count())
+            .where(DeliveryJob.status.in_(('PENDING', 'DEAD')))
+            .group_by(DeliveryJob.status, DeliveryJob.channel)
+        ).all()
+        depth = {}
+        for status, channel, count in rows:
+            depth.setdefault(channel, {'PENDING': 0, 'DEAD': 0})[status] = count
+        return depth
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'alive': sum(1 for t in self._threads if t.is_alive()),
+            'channels': self.counters.snapshot(),
+            'queue': self.queue_depth(),
+        }
+
+    def retry_dead(self, channel=None):
+        """Kembalikan job DEAD ke antrean (attempts di-reset); return jumlah job"""
+        stmt = (
+            update(DeliveryJob)
+            .where(DeliveryJob.status == 'DEAD')
+            .values(status='PENDING', attempts=0, next_attempt_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if channel:
+            stmt = stmt.where(DeliveryJob.channel == channel)
+        count = db.session.execute(stmt).rowcount
+        db.session.commit()
+        self.notify()
+        return count
+
+    def prune(self, older_than_days):
+        """Hapus job SENT yang lebih tua dari `older_than_days` hari"""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        count = DeliveryJob.query.filter(
+            DeliveryJob.status == 'SENT', DeliveryJob.created_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return count
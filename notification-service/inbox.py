@@ -0,0 +1,120 @@
+from collections import Counter
+
+from sqlalchemy import case, false, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Notification, UnreadCounter
+
+
+# ============================================================
+#                 INBOX + UNREAD COUNTER
+# ============================================================
+# Badge unread dibaca dari satu baris unread_counters (primary key), bukan
+# COUNT(*) di tabel notification. Counter diubah di transaksi yang sama
+# dengan perubahan Notification:
+# - insert notifikasi   -> unread + n per user (upsert, urut user_id)
+# - mark read           -> UPDATE bersyarat is_read = false, counter dikurangi
+#                          sebanyak baris yang benar-benar berubah (rowcount),
+#                          jadi mark read ganda / bersamaan tidak dobel hitung
+# Data lama (sebelum tabel counter ada) diisi dengan rebuild_unread_counters().
+
+def _upsert_statement():
+    table = UnreadCounter.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(table)
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(table)
+    else:
+        return None
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={'unread': table.c.unread + stmt.excluded.unread}
+    )
+
+
+def add_unread(user_ids):
+    """Naikkan counter untuk notifikasi baru (satu user_id per notifikasi); tanpa commit"""
+    counts = Counter(user_ids)
+    if not counts:
+        return
+    # Urut user_id: dua bulk insert bersamaan mengunci baris counter dengan urutan sama
+    rows = [{'user_id': user_id, 'unread': n} for user_id, n in sorted(counts.items())]
+    stmt = _upsert_statement()
+    if stmt is not None:
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        updated = db.session.execute(
+            update(UnreadCounter)
+            .where(UnreadCounter.user_id == row['user_id'])
+            .values(unread=UnreadCounter.unread + row['unread'])
+        ).rowcount
+        if not updated:
+            db.session.execute(insert(UnreadCounter), [row])
+
+
+def _subtract_unread(user_id, n):
+    if n <= 0:
+        return
+    db.session.execute(
+        update(UnreadCounter)
+        .where(UnreadCounter.user_id == user_id)
+        .values(unread=case((UnreadCounter.unread > n, UnreadCounter.unread - n), else_=0))
+    )
+
+
+def unread_count(user_id):
+    return db.session.execute(
+        select(UnreadCounter.unread).where(UnreadCounter.user_id == user_id)
+    ).scalar() or 0
+
+
+def mark_read(notification_id):
+    """Tandai satu notifikasi dibaca; return notifikasi atau None kalau tidak ada. Commit."""
+    notif = db.session.get(Notification, notification_id)
+    if notif is None:
+        return None
+    changed = db.session.execute(
+        update(Notification)
+        .where(Notification.id == notification_id, Notification.is_read == false())
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    _subtract_unread(notif.user_id, changed)
+    db.session.commit()
+    db.session.refresh(notif)
+    return notif
+
+
+def mark_read_up_to(user_id, up_to_id=None):
+    """Tandai semua notifikasi unread user dengan id <= up_to_id (None = semua); return jumlah. Commit."""
+    stmt = (
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read == false())
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    )
+    if up_to_id is not None:
+        stmt = stmt.where(Notification.id <= up_to_id)
+    changed = db.session.execute(stmt).rowcount
+    _subtract_unread(user_id, changed)
+    db.session.commit()
+    return changed
+
+
+def rebuild_unread_counters():
+    """Hitung ulang semua counter dari tabel notification (backfill / perbaikan); return jumlah user"""
+    rows = db.session.execute(
+        select(Notification.user_id, func.count())
+        .where(Notification.is_read == false())
+        .group_by(Notification.user_id)
+    ).all()
+    db.session.execute(UnreadCounter.__table__.delete())
+    if rows:
+        db.session.execute(insert(UnreadCounter), [
+            {'user_id': user_id, 'unread': count} for user_id, count in rows
+        ])
+    db.session.commit()
+    return len(rows)
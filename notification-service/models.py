@@ -4,12 +4,22 @@ from datetime import datetime
 db = SQLAlchemy()
 
 class Notification(db.Model):
+    __table_args__ = (
+        # Inbox per user (semua / hanya unread), terbaru dulu, tanpa full scan
+        db.Index('ix_notification_user_id_is_read_created_at', 'user_id', 'is_read', 'created_at', 'id'),
+        db.Index('ix_notification_user_id_created_at', 'user_id', 'created_at', 'id'),
+        # Index (bukan UNIQUE di kolom) supaya bisa ditambahkan ke tabel lama setelah ADD COLUMN
+        db.Index('ix_notification_event_id', 'event_id', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)  # External User ID
     title = db.Column(db.String(150), nullable=False)
     message = db.Column(db.String(500), nullable=False)
     type = db.Column(db.String(50), default='INFO')  # INFO, TRANSACTION, WARNING
     is_read = db.Column(db.Boolean, default=False)
+    # ID event pengirim (mis. transaction:123) untuk dedupe pengiriman ulang
+    event_id = db.Column(db.String(64), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
@@ -20,5 +30,50 @@ class Notification(db.Model):
             'message': self.message,
             'type': self.type,
             'is_read': self.is_read,
+            'event_id': self.event_id,
             'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        }
+
+
+class UnreadCounter(db.Model):
+    """Jumlah notifikasi belum dibaca per user, diupdate di transaksi yang sama dengan Notification"""
+    __tablename__ = 'unread_counters'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DeliveryJob(db.Model):
+    """Antrean pengiriman notifikasi per channel (webhook / email / push)"""
+    __tablename__ = 'delivery_jobs'
+    __table_args__ = (
+        db.Index('ix_delivery_jobs_status_next_attempt_at', 'status', 'next_attempt_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, nullable=False, index=True)
+    channel = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+
+    # PENDING -> SENT, atau DEAD setelah DELIVERY_MAX_ATTEMPTS
+    status = db.Column(db.String(20), nullable=False, default='PENDING')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Juga dipakai sebagai lease: job yang sedang dikirim digeser ke depan
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(255), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'notification_id': self.notification_id,
+            'channel': self.channel,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat(),
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
@@ -0,0 +1,63 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+# ============================
+#   KEYSET PAGINATION HELPERS
+# ============================
+
+def keyset_page(query, id_column, after=None, limit=100, max_limit=1000):
+    """Ambil satu halaman dengan id > after, return (rows, next_cursor)"""
+    limit = max(1, min(limit, max_limit))
+    if after is not None:
+        query = query.filter(id_column > after)
+
+    # Ambil satu baris ekstra untuk tahu apakah masih ada halaman berikutnya
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], id_column.key)
+    return rows, next_cursor
+
+
+# ============================
+#   TIME-ORDERED KEYSET (NEWEST FIRST)
+# ============================
+
+def encode_cursor(created_at, row_id):
+    raw = f'{created_at.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id); ValueError kalau cursor tidak valid"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def time_keyset_page(query, time_column, id_column, before=None, limit=100, max_limit=1000):
+    """
+    Halaman terbaru-dulu (ORDER BY time DESC, id DESC), cocok dengan index
+    (filter_column, time). `before` = cursor dari halaman sebelumnya.
+    """
+    limit = max(1, min(limit, max_limit))
+    if before:
+        cursor_time, cursor_id = decode_cursor(before)
+        query = query.filter(or_(
+            time_column < cursor_time,
+            and_(time_column == cursor_time, id_column < cursor_id),
+        ))
+
+    rows = query.order_by(time_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
@@ -0,0 +1,79 @@
+from sqlalchemy import inspect, text, update
+
+from models import db, Notification, UnreadCounter
+from inbox import rebuild_unread_counters
+
+
+# ============================
+#   MIGRASI DB LAMA
+# ============================
+# db.create_all() hanya membuat tabel baru. instance/notification.db lama
+# belum punya kolom event_id (dedupe) maupun index inbox, dan belum ada
+# isi unread_counters. Urutannya penting: kolom + index dulu (query
+# Notification memilih event_id), baru counter dihitung dari data lama.
+
+def missing_columns():
+    """Return list Column yang ada di model tapi belum ada di database"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        missing.extend(c for c in table.columns if c.name not in existing)
+    return missing
+
+
+def add_missing_columns():
+    """ALTER TABLE untuk setiap kolom yang hilang; return list nama tabel.kolom"""
+    dialect = db.engine.dialect
+    added = []
+    with db.engine.begin() as conn:
+        for column in missing_columns():
+            ddl = f'ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column.type.compile(dialect)}'
+            if column.server_default is not None:
+                default = column.server_default.arg
+                default = default.text if hasattr(default, 'text') else "'" + default.replace("'", "''") + "'"
+                ddl += f' DEFAULT {default}'
+            if not column.nullable and column.server_default is not None:
+                ddl += ' NOT NULL'
+            conn.execute(text(ddl))
+            added.append(f'{column.table.name}.{column.name}')
+    return added
+
+
+def create_missing_indexes():
+    """Buat index model yang belum ada di tabel lama (termasuk unique event_id); return nama index"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+    return created
+
+
+def migrate():
+    """Kolom, index, backfill is_read, lalu unread_counters kalau masih kosong; return list perubahan"""
+    changes = add_missing_columns() + create_missing_indexes()
+
+    # Baris lama dengan is_read NULL tidak terhitung unread / tidak bisa di-mark read
+    backfilled = db.session.execute(
+        update(Notification).where(Notification.is_read.is_(None)).values(is_read=False)
+    ).rowcount
+    db.session.commit()
+    if backfilled:
+        changes.append(f'notification.is_read backfilled ({backfilled} rows)')
+
+    if db.session.query(Notification.id).first() and not db.session.query(UnreadCounter.user_id).first():
+        users = rebuild_unread_counters()
+        changes.append(f'unread_counters rebuilt ({users} users)')
+    return changes
@@ -0,0 +1,151 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from delivery import DeliveryWorkerPool, enqueue
+from models import db, DeliveryJob
+
+
+class RecordingChannel:
+    def __init__(self, fail=False, delay=0.0, on_send=None):
+        self.fail = fail
+        self.delay = delay
+        self.on_send = on_send
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, payload):
+        if self.on_send is not None:
+            self.on_send(payload)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('channel down')
+        with self._lock:
+            self.sent.append(payload['notification_id'])
+
+
+def _enqueue(count, channels=('push',)):
+    enqueue([
+        {'id': i, 'user_id': 1, 'title': 't', 'message': f'm{i}', 'type': 'INFO'}
+        for i in range(1, count + 1)
+    ], list(channels))
+    db.session.commit()
+
+
+@pytest.fixture
+def make_pool(app):
+    def make(channel, **settings):
+        pool = DeliveryWorkerPool(app, channels={'push': channel})
+        for name, value in settings.items():
+            setattr(pool, name, value)
+        return pool
+    return make
+
+
+def _jobs():
+    db.session.expire_all()
+    return DeliveryJob.query.order_by(DeliveryJob.id).all()
+
+
+def test_sent_jobs_are_marked_once(make_pool):
+    channel = RecordingChannel()
+    pool = make_pool(channel)
+    _enqueue(3)
+
+    assert pool.drain() == 3
+    assert channel.sent == [1, 2, 3]
+    assert [(job.status, job.attempts) for job in _jobs()] == [('SENT', 1)] * 3
+    assert pool.drain() == 0
+
+
+def test_claimed_jobs_are_leased(make_pool):
+    pool = make_pool(RecordingChannel())
+    _enqueue(2)
+
+    jobs, lease = pool._claim()
+
+    assert len(jobs) == 2
+    assert lease > datetime.utcnow() + pool.lease
+    assert pool._claim() == ([], None)
+    # Worker mati: setelah lease habis job diambil ulang (at-least-once)
+    DeliveryJob.query.update({'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    assert len(pool._claim()[0]) == 2
+
+
+def test_failures_back_off_then_go_dead(make_pool):
+    pool = make_pool(RecordingChannel(fail=True), max_attempts=2, backoff=30.0)
+    _enqueue(1)
+
+    assert pool.process_once() == 1
+    job = _jobs()[0]
+    assert (job.status, job.attempts, job.last_error) == ('PENDING', 1, 'channel down')
+    assert job.next_attempt_at > datetime.utcnow()
+    assert pool.process_once() == 0
+
+    DeliveryJob.query.update({'next_attempt_at': datetime.utcnow()})
+    db.session.commit()
+    pool.process_once()
+    assert (_jobs()[0].status, _jobs()[0].attempts) == ('DEAD', 2)
+
+    assert pool.retry_dead() == 1
+    assert (_jobs()[0].status, _jobs()[0].attempts) == ('PENDING', 0)
+
+
+def test_worker_with_stolen_lease_does_not_overwrite(app, make_pool):
+    stolen = {}
+
+    def steal(payload):
+        # Lease worker pertama dianggap habis; worker kedua mengklaim job yang sama
+        DeliveryJob.query.update({'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        jobs, stolen['lease'] = other._claim()
+        stolen['jobs'] = len(jobs)
+
+    other = make_pool(RecordingChannel())
+    pool = make_pool(RecordingChannel(on_send=steal))
+    _enqueue(1)
+
+    pool.process_once()
+
+    job = _jobs()[0]
+    assert stolen['jobs'] == 1
+    assert job.status == 'PENDING'
+    assert job.next_attempt_at == stolen['lease']
+
+
+def test_unsent_jobs_are_released_before_lease_expires(make_pool):
+    channel = RecordingChannel(delay=0.2)
+    pool = make_pool(channel, lease=timedelta(0), send_timeout=timedelta(seconds=0.15))
+    _enqueue(3)
+
+    assert pool.process_once() == 3
+
+    assert channel.sent == [1, 2]
+    jobs = _jobs()
+    assert [job.status for job in jobs] == ['SENT', 'SENT', 'PENDING']
+    assert jobs[2].next_attempt_at <= datetime.utcnow()
+    assert jobs[2].attempts == 0
+
+
+def test_concurrent_workers_send_each_job_once(app, make_pool):
+    channel = RecordingChannel()
+    pool = make_pool(channel, batch_size=10)
+    _enqueue(200)
+
+    def worker():
+        with app.app_context():
+            pool.drain()
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(channel.sent) == list(range(1, 201))
+    assert {job.status for job in _jobs()} == {'SENT'}
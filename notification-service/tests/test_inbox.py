@@ -0,0 +1,108 @@
+import threading
+
+from inbox import rebuild_unread_counters, unread_count
+from models import db, Notification, UnreadCounter
+
+USER = {'X-User-Id': '5', 'X-User-Role': 'user'}
+
+
+def _notify(client, user_id, count=1, event_prefix=None):
+    items = [
+        {'user_id': user_id, 'message': f'm{i}', 'event_id': f'{event_prefix}-{i}' if event_prefix else None}
+        for i in range(count)
+    ]
+    return client.post('/notifications/bulk', json={'notifications': items})
+
+
+def _counter(user_id):
+    db.session.expire_all()
+    return unread_count(user_id)
+
+
+def test_counter_follows_inserts_and_event_id_dedupe(client):
+    client.post('/notifications/', json={'user_id': 5, 'message': 'hello'})
+    assert _notify(client, 5, 3, event_prefix='trx').get_json()['created'] == 3
+    assert _notify(client, 5, 3, event_prefix='trx').get_json()['duplicates'] == 3
+    _notify(client, 6, 2)
+
+    assert _counter(5) == 4
+    assert _counter(6) == 2
+    assert client.get('/notifications/users/5/unread-count', headers=USER).get_json()['unread_count'] == 4
+
+
+def test_mark_read_is_counted_once(client):
+    _notify(client, 5, 3)
+    first = Notification.query.filter_by(user_id=5).order_by(Notification.id).first()
+
+    assert client.post(f'/notifications/{first.id}/read', headers=USER).status_code == 200
+    assert client.post(f'/notifications/{first.id}/read', headers=USER).status_code == 200
+    assert _counter(5) == 2
+
+    response = client.post('/notifications/users/5/read', json={}, headers=USER).get_json()
+    assert response == {'marked': 2, 'unread_count': 0}
+    assert client.post('/notifications/users/5/read', json={}, headers=USER).get_json()['marked'] == 0
+
+
+def test_concurrent_mark_read_does_not_double_count(app):
+    client = app.test_client()
+    _notify(client, 5, 10)
+    statuses = []
+
+    def worker():
+        with app.app_context():
+            response = app.test_client().post('/notifications/users/5/read', json={}, headers=USER)
+            statuses.append(response.status_code)
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert statuses == [200] * 4
+    assert _counter(5) == 0
+    assert Notification.query.filter_by(is_read=False).count() == 0
+
+
+def test_rebuild_matches_table(client):
+    _notify(client, 5, 3)
+    _notify(client, 6, 1)
+    UnreadCounter.query.delete()
+    db.session.commit()
+
+    assert rebuild_unread_counters() == 2
+    assert (_counter(5), _counter(6)) == (3, 1)
+
+
+def test_inbox_pages_newest_first(client):
+    _notify(client, 5, 5)
+
+    page = client.get('/notifications/users/5?limit=2', headers=USER).get_json()
+    older = client.get(f"/notifications/users/5?limit=2&before={page['next_cursor']}", headers=USER).get_json()
+
+    assert [n['message'] for n in page['items']] == ['m4', 'm3']
+    assert [n['message'] for n in older['items']] == ['m2', 'm1']
+    assert page['unread_count'] == 5
+
+
+def test_inbox_is_private_to_its_owner(client):
+    _notify(client, 5, 1)
+    notification_id = Notification.query.first().id
+    other = {'X-User-Id': '6', 'X-User-Role': 'user'}
+    admin = {'X-User-Id': '1', 'X-User-Role': 'admin'}
+
+    assert client.get('/notifications/users/5', headers=other).status_code == 403
+    assert client.get('/notifications/users/5/unread-count', headers=other).status_code == 403
+    assert client.post('/notifications/users/5/read', json={}, headers=other).status_code == 403
+    assert client.post(f'/notifications/{notification_id}/read', headers=other).status_code == 403
+    assert client.get('/notifications/?user_id=5', headers=other).status_code == 403
+    assert client.get('/notifications/', headers=other).status_code == 403
+    assert _counter(5) == 1
+
+    # ADMIN dan panggilan internal (tanpa identitas) tetap boleh
+    assert client.get('/notifications/users/5', headers=admin).status_code == 200
+    assert client.get('/notifications/users/5').status_code == 200
+    assert len(client.get('/notifications/?user_id=5', headers=USER).get_json()['items']) == 1
+    assert len(client.get('/notifications/', headers=admin).get_json()['items']) == 1
+    assert len(client.get('/notifications/').get_json()['items']) == 1
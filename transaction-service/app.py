@@ -1,8 +1,24 @@
-from flask import Flask, request, jsonify
-from flask_restx import Api, Resource, fields
+from flask import Flask, request, jsonify, g
+from flask_restx import Api, Resource, fields, inputs, marshal, reqparse
 from flask_cors import CORS
 from config import Config
-from models import db, Transaction, Wallet
+from models import db, Transaction, BulkTransferJob, BulkTransferItem, OutboxEvent
+from pagination import keyset_page, stream_ndjson, time_keyset_page
+from export import export_response
+from rollups import rebuild_rollups, report
+from group_commit import TransactionWriter, WriteTimeout, reconcile_unresolved
+from wallet_client import build_wallet_client, WalletServiceError, InsufficientBalance, WalletNotFound
+from user_client import UserClient, UserServiceError
+from ledger import balance_at, snapshot_all, backfill_opening_balances
+from schema import add_missing_columns, backfill_counterparty_wallets, ensure_autoincrement, report_missing_indexes
+from idempotency import IdempotencyStore
+from bulk_transfer import (
+    create_job, run_job, start_job, pause_job, json_rows, csv_rows, TooManyRows, InvalidCsv
+)
+from partitions import ArchiveStore, closed_months
+from columnar import ColumnarStore, AnalyticsUnavailable, GROUP_KEYS, METRICS
+from velocity import VelocityEngine
+from outbox import OutboxDispatcher
 from datetime import datetime
 
 app = Flask(__name__)
@@ -10,6 +26,20 @@ app.config.from_object(Config)
 
 db.init_app(app)
 CORS(app)
+wallet_client = build_wallet_client(Config)
+transaction_writer = TransactionWriter(app, wallets=wallet_client)
+user_client = UserClient(
+    Config.USER_SERVICE_URL,
+    pool_size=Config.USER_CLIENT_POOL_SIZE,
+    cache_size=Config.USER_CLIENT_CACHE_SIZE,
+    cache_ttl=Config.USER_CLIENT_CACHE_TTL,
+    coalesce_window=Config.USER_CLIENT_COALESCE_MS / 1000.0,
+)
+idempotency = IdempotencyStore(app)
+archive_store = ArchiveStore(Config.TRANSACTION_ARCHIVE_DIR)
+analytics_store = ColumnarStore(Config.ANALYTICS_DIR, Config.ANALYTICS_GAP_RETENTION_SECONDS)
+velocity = VelocityEngine(app)
+outbox_dispatcher = OutboxDispatcher(app)
 
 api = Api(
     app,
@@ -21,6 +51,26 @@ api = Api(
 
 transaction_ns = api.namespace("transactions", description="Transaction operations")
 
+
+@api.errorhandler(WalletServiceError)
+def handle_wallet_service_error(error):
+    return {"error": "Wallet service unavailable", "detail": str(error)}, 503
+
+
+@api.errorhandler(UserServiceError)
+def handle_user_service_error(error):
+    return {"error": "User service unavailable", "detail": str(error)}, 503
+
+
+@api.errorhandler(WriteTimeout)
+def handle_write_timeout(error):
+    # Write masih antre / diproses: hasil akhirnya dicek lewat status_url, jangan kirim ulang tanpa Idempotency-Key
+    return {
+        "message": "Transaction is still being processed",
+        "write_id": error.write_id,
+        "status_url": api.url_for(WriteStatus, write_id=error.write_id)
+    }, 202
+
 # ============================
 #   SWAGGER MODELS 
 # ============================
@@ -33,10 +83,113 @@ transaction_model = api.model("Transaction", {
     "status": fields.String(),
     "reference_id": fields.String(),
     "description": fields.String(),
+    "counterparty_wallet_id": fields.Integer(),
     "created_at": fields.String(),
     "updated_at": fields.String(),
 })
 
+transaction_user_model = api.model("TransactionUser", {
+    "id": fields.Integer(),
+    "name": fields.String(),
+    "email": fields.String(),
+    "role": fields.String(),
+    "status": fields.String(),
+})
+
+transaction_with_user_model = api.inherit("TransactionWithUser", transaction_model, {
+    "user": fields.Nested(transaction_user_model, allow_null=True, description="Only with include_user=true"),
+})
+
+transaction_page_model = api.model("TransactionPage", {
+    "items": fields.List(fields.Nested(transaction_with_user_model)),
+    "next_cursor": fields.Integer(description="Pass as `after` to fetch the next page"),
+})
+
+transaction_list_parser = reqparse.RequestParser()
+transaction_list_parser.add_argument("limit", type=int, location="args", help="Page size")
+transaction_list_parser.add_argument("after", type=int, location="args", help="Return transactions with id greater than this cursor")
+transaction_list_parser.add_argument("status", type=str, location="args")
+transaction_list_parser.add_argument("user_id", type=int, location="args")
+transaction_list_parser.add_argument("wallet_id", type=int, location="args")
+transaction_list_parser.add_argument("type", type=str, location="args")
+transaction_list_parser.add_argument("from", type=inputs.datetime_from_iso8601, location="args", dest="date_from",
+                                     help="created_at >= (ISO 8601)")
+transaction_list_parser.add_argument("to", type=inputs.datetime_from_iso8601, location="args", dest="date_to",
+                                     help="created_at < (ISO 8601)")
+transaction_list_parser.add_argument("format", type=str, location="args", choices=("json", "ndjson"), default="json",
+                                     help="ndjson streams every matching transaction")
+transaction_list_parser.add_argument("include_user", type=inputs.boolean, location="args", default=False,
+                                     help="Attach the owner from user-service (one batched lookup per page, json only)")
+
+transaction_history_model = api.model("TransactionHistory", {
+    "items": fields.List(fields.Nested(transaction_model)),
+    "next_cursor": fields.String(description="Pass as `before` to fetch older transactions"),
+})
+
+history_parser = reqparse.RequestParser()
+history_parser.add_argument("limit", type=int, location="args", help="Page size")
+history_parser.add_argument("before", type=str, location="args", help="Cursor from the previous page")
+history_parser.add_argument("from", type=inputs.datetime_from_iso8601, location="args", dest="date_from",
+                            help="created_at >= (ISO 8601)")
+history_parser.add_argument("to", type=inputs.datetime_from_iso8601, location="args", dest="date_to",
+                            help="created_at < (ISO 8601)")
+
+export_parser = transaction_list_parser.copy()
+export_parser.remove_argument("limit")
+export_parser.remove_argument("after")
+export_parser.replace_argument("format", type=str, location="args", choices=("csv", "ndjson"), default="csv")
+export_parser.add_argument("gzip", type=inputs.boolean, location="args", default=False,
+                           help="Compress the stream on the fly (Content-Encoding: gzip)")
+
+bulk_transfer_row_model = api.model("BulkTransferRow", {
+    "to_wallet_id": fields.Integer(required=True),
+    "amount": fields.Float(required=True),
+})
+
+bulk_transfer_model = api.model("BulkTransfer", {
+    "from_wallet_id": fields.Integer(required=True),
+    "transfers": fields.List(fields.Nested(bulk_transfer_row_model), required=True),
+})
+
+bulk_items_parser = reqparse.RequestParser()
+bulk_items_parser.add_argument("status", type=str, location="args", choices=("PENDING", "SUCCESS", "FAILED"))
+bulk_items_parser.add_argument("limit", type=int, location="args")
+bulk_items_parser.add_argument("after", type=int, location="args")
+
+def day(value):
+    """YYYY-MM-DD -> date (inputs.date memberi datetime naive, tidak cocok dibanding dengan kolom Date)"""
+    return inputs.date(value).date()
+
+
+day.__schema__ = {"type": "string", "format": "date"}
+
+report_parser = reqparse.RequestParser()
+report_parser.add_argument("user_id", type=int, location="args")
+report_parser.add_argument("wallet_id", type=int, location="args")
+report_parser.add_argument("type", type=str, location="args")
+report_parser.add_argument("from", type=day, location="args", dest="date_from", help="First day (YYYY-MM-DD)")
+report_parser.add_argument("to", type=day, location="args", dest="date_to", help="Last day, inclusive (YYYY-MM-DD)")
+report_parser.add_argument("period", type=str, location="args", choices=("day", "month", "all"), default="day")
+
+analytics_parser = reqparse.RequestParser()
+analytics_parser.add_argument("user_id", type=int, location="args")
+analytics_parser.add_argument("wallet_id", type=int, location="args")
+analytics_parser.add_argument("type", type=str, location="args")
+analytics_parser.add_argument("status", type=str, location="args")
+analytics_parser.add_argument("from", type=inputs.datetime_from_iso8601, location="args", dest="date_from",
+                              help="created_at >= (ISO 8601)")
+analytics_parser.add_argument("to", type=inputs.datetime_from_iso8601, location="args", dest="date_to",
+                              help="created_at < (ISO 8601)")
+analytics_parser.add_argument("group_by", type=str, location="args", choices=GROUP_KEYS)
+analytics_parser.add_argument("percentiles", type=str, location="args",
+                              help="Comma separated amount percentiles, e.g. 50,90,99")
+analytics_parser.add_argument("order_by", type=str, location="args", choices=METRICS, default="sum")
+analytics_parser.add_argument("limit", type=int, location="args", default=100)
+
+ledger_balance_parser = reqparse.RequestParser()
+ledger_balance_parser.add_argument("at", type=inputs.datetime_from_iso8601, location="args",
+                                   help="Point-in-time balance (ISO 8601), default now")
+
 topup_model = api.model("Topup", {
     "wallet_id": fields.Integer(required=True),
     "amount": fields.Float(required=True),
@@ -58,13 +211,102 @@ transfer_model = api.model("Transfer", {
 #        ENDPOINTS
 # ============================
 
+def filter_transactions(query, args):
+    """Filter umum: status, user_id, wallet_id, type, from/to (created_at)"""
+    if args.get("status"):
+        query = query.filter(Transaction.status == args["status"])
+    if args.get("user_id") is not None:
+        query = query.filter(Transaction.user_id == args["user_id"])
+    if args.get("wallet_id") is not None:
+        query = query.filter(Transaction.wallet_id == args["wallet_id"])
+    if args.get("type"):
+        query = query.filter(Transaction.type == args["type"].upper())
+    if args.get("date_from"):
+        query = query.filter(Transaction.created_at >= args["date_from"])
+    if args.get("date_to"):
+        query = query.filter(Transaction.created_at < args["date_to"])
+    return query
+
+
+def archived(args):
+    """Sumber baris arsip bulanan untuk pagination (bulan di luar from/to/cursor dilewati)"""
+    return lambda stmt, **order: archive_store.sources(
+        stmt, args.get("date_from"), args.get("date_to"), **order
+    )
+
+
+def block_transaction(wallet, trx_type, amount, rule):
+    """Catat percobaan yang diblok velocity rule sebagai transaksi FAILED"""
+    transaction_writer.submit(
+        [dict(
+            wallet_id=wallet["id"],
+            user_id=wallet["user_id"],
+            type=trx_type,
+            amount=amount,
+            status="FAILED",
+            description=f"Blocked by velocity rule: {rule}"
+        )],
+        []
+    )
+    return {"error": "Transaction blocked by velocity rule", "rule": rule}, 403
+
+
 @transaction_ns.route("/")
 class TransactionList(Resource):
 
-    @transaction_ns.marshal_list_with(transaction_model)
+    @transaction_ns.expect(transaction_list_parser)
+    @transaction_ns.response(200, "Success", transaction_page_model)
+    def get(self):
+        """List transactions (keyset pagination, or NDJSON stream)"""
+        args = transaction_list_parser.parse_args()
+        query = filter_transactions(Transaction.query, args)
+
+        if args["format"] == "ndjson":
+            return stream_ndjson(
+                query, Transaction.id, lambda t: marshal(t, transaction_model),
+                after=args["after"], limit=args["limit"],
+                batch_size=Config.STREAM_BATCH_SIZE,
+                archive_rows=archived(args)
+            )
+
+        transactions, next_cursor = keyset_page(
+            query, Transaction.id,
+            after=args["after"],
+            limit=args["limit"] or Config.PAGE_SIZE_DEFAULT,
+            max_limit=Config.PAGE_SIZE_MAX,
+            archive_rows=archived(args)
+        )
+        items = marshal(transactions, transaction_model)
+        if args["include_user"]:
+            # Satu GET /internal/users?ids=... untuk semua pemilik di halaman ini
+            users = user_client.get_users({item["user_id"] for item in items})
+            for item in items:
+                user = users.get(item["user_id"])
+                item["user"] = marshal(user, transaction_user_model) if user else None
+        return {
+            "items": items,
+            "next_cursor": next_cursor
+        }
+
+
+@transaction_ns.route("/export")
+class TransactionExport(Resource):
+
+    @transaction_ns.expect(export_parser)
+    @transaction_ns.produces(["text/csv", "application/x-ndjson"])
     def get(self):
-        """Get all transactions"""
-        return Transaction.query.all()
+        """Stream a filtered transaction export as CSV or NDJSON (archived months included)"""
+        args = export_parser.parse_args()
+        query = filter_transactions(Transaction.query, args)
+        return export_response(
+            query,
+            fmt=args["format"],
+            gzip=args["gzip"],
+            batch_size=Config.STREAM_BATCH_SIZE,
+            archive=archive_store,
+            date_from=args["date_from"],
+            date_to=args["date_to"]
+        )
 
 
 # ============================================================
@@ -74,30 +316,38 @@ class TransactionList(Resource):
 class Topup(Resource):
 
     @transaction_ns.expect(topup_model)
+    @transaction_ns.header("Idempotency-Key", "Replays the original response instead of charging twice")
+    @idempotency.guard
     def post(self):
         """Topup a wallet"""
         data = request.json
-        wallet = Wallet.query.get(data["wallet_id"])
+        wallet = wallet_client.get_wallet(data["wallet_id"])
 
         if not wallet:
             return {"error": "Wallet not found"}, 404
 
-        # Tambah saldo
-        wallet.balance += data["amount"]
-
-        trx = Transaction(
-            wallet_id=wallet.id,
-            user_id=wallet.user_id,
-            type="TOPUP",
-            amount=data["amount"],
-            status="SUCCESS",
-            description="Topup balance"
-        )
-
-        db.session.add(trx)
-        db.session.commit()
+        try:
+            # Tambah saldo
+            result = transaction_writer.submit(
+                [dict(
+                    wallet_id=wallet["id"],
+                    user_id=wallet["user_id"],
+                    type="TOPUP",
+                    amount=data["amount"],
+                    status="SUCCESS",
+                    description="Topup balance"
+                )],
+                [(wallet["id"], data["amount"])],
+                idempotency_key=g.get("idempotency_key"),
+                fingerprint=g.get("idempotency_fingerprint"),
+                build_response=lambda r: (
+                    {"message": "Topup successful", "new_balance": r.balances[wallet["id"]]}, 200
+                )
+            )
+        except WalletNotFound:
+            return {"error": "Wallet not found"}, 404
 
-        return {"message": "Topup successful", "new_balance": wallet.balance}, 200
+        return result.response
 
 
 # ============================================================
@@ -107,33 +357,50 @@ class Topup(Resource):
 class Payment(Resource):
 
     @transaction_ns.expect(payment_model)
+    @transaction_ns.header("Idempotency-Key", "Replays the original response instead of charging twice")
+    @idempotency.guard
     def post(self):
         """Make a payment (saldo berkurang)"""
         data = request.json
-        wallet = Wallet.query.get(data["wallet_id"])
+        wallet = wallet_client.get_wallet(data["wallet_id"])
 
         if not wallet:
             return {"error": "Wallet not found"}, 404
 
-        if wallet.balance < data["amount"]:
-            return {"error": "Insufficient balance"}, 400
-
-        # Kurangi saldo
-        wallet.balance -= data["amount"]
-
-        trx = Transaction(
-            wallet_id=wallet.id,
-            user_id=wallet.user_id,
-            type="PAYMENT",
-            amount=data["amount"],
-            status="SUCCESS",
-            description=data.get("description", "Payment done")
-        )
-
-        db.session.add(trx)
-        db.session.commit()
-
-        return {"message": "Payment successful", "new_balance": wallet.balance}, 200
+        # Velocity limit di-reservasi dulu; dilepas otomatis kalau payment gagal
+        with velocity.hold(wallet["user_id"], data["amount"]) as hold:
+            if hold.blocked_by:
+                return block_transaction(wallet, "PAYMENT", data["amount"], hold.blocked_by)
+
+            try:
+                # Kurangi saldo (dijaga saldo >= amount)
+                result = transaction_writer.submit(
+                    [dict(
+                        wallet_id=wallet["id"],
+                        user_id=wallet["user_id"],
+                        type="PAYMENT",
+                        amount=data["amount"],
+                        status="SUCCESS",
+                        description=data.get("description", "Payment done")
+                    )],
+                    [(wallet["id"], -data["amount"])],
+                    idempotency_key=g.get("idempotency_key"),
+                    fingerprint=g.get("idempotency_fingerprint"),
+                    build_response=lambda r: (
+                        {"message": "Payment successful", "new_balance": r.balances[wallet["id"]]}, 200
+                    )
+                )
+            except WalletNotFound:
+                return {"error": "Wallet not found"}, 404
+            except InsufficientBalance:
+                return {"error": "Insufficient balance"}, 400
+            except WriteTimeout:
+                # Write masih bisa commit: reservasi velocity dipertahankan
+                hold.commit()
+                raise
+            hold.commit()
+
+        return result.response
 
 
 # ============================================================
@@ -143,38 +410,293 @@ class Payment(Resource):
 class Transfer(Resource):
 
     @transaction_ns.expect(transfer_model)
+    @transaction_ns.header("Idempotency-Key", "Replays the original response instead of charging twice")
+    @idempotency.guard
     def post(self):
         """Transfer money between wallets"""
         data = request.json
 
-        from_wallet = Wallet.query.get(data["from_wallet_id"])
-        to_wallet = Wallet.query.get(data["to_wallet_id"])
+        from_wallet = wallet_client.get_wallet(data["from_wallet_id"])
+        to_wallet = wallet_client.get_wallet(data["to_wallet_id"])
 
         if not from_wallet or not to_wallet:
             return {"error": "One or both wallets not found"}, 404
 
-        if from_wallet.balance < data["amount"]:
-            return {"error": "Insufficient balance"}, 400
+        if from_wallet["id"] == to_wallet["id"]:
+            return {"error": "Cannot transfer to the same wallet"}, 400
+
+        with velocity.hold(from_wallet["user_id"], data["amount"], payee=to_wallet["id"]) as hold:
+            if hold.blocked_by:
+                return block_transaction(from_wallet, "TRANSFER", data["amount"], hold.blocked_by)
+
+            try:
+                # Dua leg (debit pengirim + kredit penerima), atomik di wallet-service
+                result = transaction_writer.submit(
+                    [
+                        dict(
+                            wallet_id=from_wallet["id"],
+                            user_id=from_wallet["user_id"],
+                            type="TRANSFER",
+                            amount=data["amount"],
+                            status="SUCCESS",
+                            description=f"Transfer to wallet {to_wallet['id']}",
+                            counterparty_wallet_id=to_wallet["id"]
+                        ),
+                        dict(
+                            wallet_id=to_wallet["id"],
+                            user_id=to_wallet["user_id"],
+                            type="TRANSFER_IN",
+                            amount=data["amount"],
+                            status="SUCCESS",
+                            description=f"Transfer from wallet {from_wallet['id']}",
+                            counterparty_wallet_id=from_wallet["id"]
+                        ),
+                    ],
+                    [(from_wallet["id"], -data["amount"]), (to_wallet["id"], data["amount"])],
+                    idempotency_key=g.get("idempotency_key"),
+                    fingerprint=g.get("idempotency_fingerprint"),
+                    build_response=lambda r: ({
+                        "message": "Transfer successful",
+                        "from_wallet_balance": r.balances[from_wallet["id"]],
+                        "to_wallet_balance": r.balances[to_wallet["id"]]
+                    }, 200)
+                )
+            except WalletNotFound:
+                return {"error": "One or both wallets not found"}, 404
+            except InsufficientBalance:
+                return {"error": "Insufficient balance"}, 400
+            except WriteTimeout:
+                # Write masih bisa commit: reservasi velocity dipertahankan
+                hold.commit()
+                raise
+            hold.commit()
+
+        return result.response
+
+
+@transaction_ns.route("/writes/<string:write_id>")
+@transaction_ns.param("write_id", "write_id from a 202 response")
+class WriteStatus(Resource):
+
+    def get(self, write_id):
+        """Outcome of a write that timed out: COMMITTED, FAILED or PENDING"""
+        return transaction_writer.write_status(write_id), 200
+
+
+# ============================================================
+#                 BULK TRANSFER ENDPOINT
+# ============================================================
+@transaction_ns.route("/bulk-transfer")
+class BulkTransfer(Resource):
+
+    @transaction_ns.expect(bulk_transfer_model)
+    @transaction_ns.doc(params={"from_wallet_id": "Source wallet (CSV upload only)"})
+    def post(self):
+        """
+        Bulk transfer from one wallet to many (JSON body, or CSV upload with
+        header `to_wallet_id,amount` as multipart `file` or text/csv body)
+        """
+        if request.mimetype == "application/json":
+            data = request.json or {}
+            from_wallet_id = data.get("from_wallet_id")
+            transfers = data.get("transfers")
+            if not isinstance(transfers, list):
+                return {"error": "transfers must be a list"}, 400
+            rows = json_rows(transfers, from_wallet_id)
+        else:
+            from_wallet_id = request.values.get("from_wallet_id", type=int)
+            if request.mimetype == "multipart/form-data":
+                if "file" not in request.files:
+                    return {"error": "CSV file is required"}, 400
+                stream = request.files["file"].stream
+            else:
+                stream = request.stream
+            rows = csv_rows(stream, from_wallet_id)
+
+        source = wallet_client.get_wallet(from_wallet_id) if from_wallet_id else None
+        if not source:
+            return {"error": "Source wallet not found"}, 404
+
+        try:
+            job = create_job(
+                source["id"], rows,
+                chunk_size=Config.BULK_TRANSFER_CHUNK_SIZE,
+                max_rows=Config.BULK_TRANSFER_MAX_ROWS
+            )
+        except TooManyRows:
+            return {"error": f"Bulk transfer limited to {Config.BULK_TRANSFER_MAX_ROWS} rows"}, 413
+        except InvalidCsv as e:
+            return {"error": f"Invalid CSV file (UTF-8 with header to_wallet_id,amount expected): {e}"}, 400
+
+        start_job(app, transaction_writer, job.id, Config.BULK_TRANSFER_CHUNK_SIZE)
+        return {
+            "message": "Bulk transfer accepted",
+            "job_id": job.id,
+            "status_url": api.url_for(BulkTransferStatus, job_id=job.id)
+        }, 202
+
+
+@transaction_ns.route("/bulk-transfer/<int:job_id>")
+@transaction_ns.param("job_id", "Bulk transfer job ID")
+class BulkTransferStatus(Resource):
+
+    def get(self, job_id):
+        """Bulk transfer job status"""
+        job = BulkTransferJob.query.get(job_id)
+        if not job:
+            return {"error": "Job not found"}, 404
+        return job.to_dict(), 200
+
+
+@transaction_ns.route("/bulk-transfer/<int:job_id>/items")
+@transaction_ns.param("job_id", "Bulk transfer job ID")
+class BulkTransferItems(Resource):
+
+    @transaction_ns.expect(bulk_items_parser)
+    def get(self, job_id):
+        """Per-row outcomes of a bulk transfer job"""
+        args = bulk_items_parser.parse_args()
+
+        query = BulkTransferItem.query.filter(BulkTransferItem.job_id == job_id)
+        if args["status"]:
+            query = query.filter(BulkTransferItem.status == args["status"])
+
+        items, next_cursor = keyset_page(
+            query, BulkTransferItem.id,
+            after=args["after"],
+            limit=args["limit"] or Config.PAGE_SIZE_DEFAULT,
+            max_limit=Config.PAGE_SIZE_MAX
+        )
+        return {
+            "items": [item.to_dict() for item in items],
+            "next_cursor": next_cursor
+        }, 200
 
-        from_wallet.balance -= data["amount"]
-        to_wallet.balance += data["amount"]
 
-        trx = Transaction(
-            wallet_id=from_wallet.id,
-            user_id=from_wallet.user_id,
-            type="TRANSFER",
-            amount=data["amount"],
-            status="SUCCESS",
-            description=f"Transfer to wallet {to_wallet.id}"
+# ============================================================
+#                 HISTORY (INDEXED)
+# ============================================================
+def history_page(filter_column, value):
+    """Riwayat terbaru-dulu via index (filter_column, created_at)"""
+    args = history_parser.parse_args()
+
+    query = Transaction.query.filter(filter_column == value)
+    if args["date_from"]:
+        query = query.filter(Transaction.created_at >= args["date_from"])
+    if args["date_to"]:
+        query = query.filter(Transaction.created_at < args["date_to"])
+
+    try:
+        transactions, next_cursor = time_keyset_page(
+            query, Transaction.created_at, Transaction.id,
+            before=args["before"],
+            limit=args["limit"] or Config.PAGE_SIZE_DEFAULT,
+            max_limit=Config.PAGE_SIZE_MAX,
+            archive_rows=archived(args)
         )
+    except ValueError as e:
+        api.abort(400, str(e))
 
-        db.session.add(trx)
-        db.session.commit()
+    return {
+        "items": marshal(transactions, transaction_model),
+        "next_cursor": next_cursor
+    }
 
+
+@transaction_ns.route("/users/<int:user_id>/history")
+@transaction_ns.param("user_id", "User ID")
+class UserHistory(Resource):
+
+    @transaction_ns.expect(history_parser)
+    @transaction_ns.response(200, "Success", transaction_history_model)
+    def get(self, user_id):
+        """Transaction history of a user, newest first"""
+        return history_page(Transaction.user_id, user_id)
+
+
+@transaction_ns.route("/wallets/<int:wallet_id>/history")
+@transaction_ns.param("wallet_id", "Wallet ID")
+class WalletHistory(Resource):
+
+    @transaction_ns.expect(history_parser)
+    @transaction_ns.response(200, "Success", transaction_history_model)
+    def get(self, wallet_id):
+        """Transaction history of a wallet, newest first"""
+        return history_page(Transaction.wallet_id, wallet_id)
+
+
+# ============================================================
+#                 REPORTS (DAILY ROLLUPS)
+# ============================================================
+@transaction_ns.route("/reports")
+class TransactionReport(Resource):
+
+    @transaction_ns.expect(report_parser)
+    def get(self):
+        """Count / sum / min / max per period and type, read from daily rollups"""
+        args = report_parser.parse_args()
+        return report(
+            user_id=args["user_id"],
+            wallet_id=args["wallet_id"],
+            trx_type=args["type"],
+            date_from=args["date_from"],
+            date_to=args["date_to"],
+            period=args["period"]
+        ), 200
+
+
+# ============================================================
+#                 ANALYTICS (COLUMNAR)
+# ============================================================
+@transaction_ns.route("/analytics")
+class TransactionAnalytics(Resource):
+
+    @transaction_ns.expect(analytics_parser)
+    def get(self):
+        """Vectorized filter / group-by / percentile over the columnar copy of transactions"""
+        args = analytics_parser.parse_args()
+        try:
+            percentiles = [float(p) for p in args["percentiles"].split(",")] if args["percentiles"] else []
+        except ValueError:
+            return {"error": "percentiles must be numbers"}, 400
+        if any(p < 0 or p > 100 for p in percentiles):
+            return {"error": "percentiles must be between 0 and 100"}, 400
+
+        try:
+            # Tidak sync di sini: data diperbarui oleh sync-analytics / analytics-syncer
+            return analytics_store.query(
+                filters={
+                    "user_id": args["user_id"],
+                    "wallet_id": args["wallet_id"],
+                    "type": args["type"].upper() if args["type"] else None,
+                    "status": args["status"],
+                    "date_from": args["date_from"],
+                    "date_to": args["date_to"],
+                },
+                group_by=args["group_by"],
+                percentiles=percentiles,
+                order_by=args["order_by"],
+                limit=min(max(args["limit"], 1), Config.PAGE_SIZE_MAX)
+            ), 200
+        except AnalyticsUnavailable as e:
+            return {"error": str(e)}, 501
+
+
+# ============================================================
+#                 LEDGER BALANCE
+# ============================================================
+@transaction_ns.route("/ledger/<int:wallet_id>/balance")
+@transaction_ns.param("wallet_id", "Wallet ID")
+class LedgerBalance(Resource):
+
+    @transaction_ns.expect(ledger_balance_parser)
+    def get(self, wallet_id):
+        """Ledger balance of a wallet (snapshot + tail), optionally at a point in time"""
+        args = ledger_balance_parser.parse_args()
         return {
-            "message": "Transfer successful",
-            "from_wallet_balance": from_wallet.balance,
-            "to_wallet_balance": to_wallet.balance
+            "wallet_id": wallet_id,
+            "at": args["at"].isoformat() if args["at"] else None,
+            "balance": balance_at(wallet_id, args["at"])
         }, 200
 
 
@@ -183,10 +705,24 @@ class Transfer(Resource):
 # ============================================================
 @app.route("/internal/transactions/<int:user_id>")
 def get_transactions_internal(user_id):
-    trxs = Transaction.query.filter_by(user_id=user_id).all()
+    trxs = (
+        Transaction.query.filter_by(user_id=user_id)
+        .order_by(Transaction.created_at, Transaction.id)
+        .all()
+    )
     return jsonify([t.to_dict() for t in trxs])
 
 
+@app.route("/internal/outbox/stats")
+def outbox_stats():
+    counts = dict(
+        db.session.query(OutboxEvent.status, db.func.count(OutboxEvent.id))
+        .group_by(OutboxEvent.status)
+        .all()
+    )
+    return jsonify(counts)
+
+
 # HEALTH CHECK
 @app.route("/health")
 def health_check():
@@ -201,10 +737,139 @@ def health_check():
 def create_db():
     with app.app_context():
         db.create_all()
+        added = add_missing_columns()
+        for column in added:
+            print(f"Added missing column {column}")
+        if "transactions.counterparty_wallet_id" in added:
+            print(f"Backfilled counterparty for {backfill_counterparty_wallets()} transfer leg(s)")
+        if ensure_autoincrement(archive_store.max_id()):
+            print("Rebuilt transactions with AUTOINCREMENT ids")
+        report_missing_indexes(create=True)
         print("Transaction DB created!")
 
 
+@app.cli.command("resume-bulk-transfers")
+def resume_bulk_transfers():
+    """Lanjutkan bulk transfer yang terhenti (mis. setelah restart)"""
+    with app.app_context():
+        job_ids = [j.id for j in BulkTransferJob.query.filter(
+            BulkTransferJob.status.in_(("PENDING", "RUNNING", "PAUSED"))
+        )]
+        for job_id in job_ids:
+            try:
+                run_job(transaction_writer, job_id, Config.BULK_TRANSFER_CHUNK_SIZE)
+            except Exception as e:
+                pause_job(job_id, e)
+                print(f"Bulk transfer job {job_id} paused again: {e}")
+        print(f"Resumed {len(job_ids)} bulk transfer job(s)")
+
+
+@app.cli.command("reconcile-wallet-applies")
+def reconcile_wallet_applies():
+    """Batalkan ulang apply wallet-service yang hasilnya tidak pasti (unresolved_wallet_applies)"""
+    with app.app_context():
+        resolved, pending = reconcile_unresolved(wallet_client)
+        print(f"{resolved} resolved, {pending} still unresolved")
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Hitung ulang daily_rollups dari tabel transactions + arsip bulanan"""
+    with app.app_context():
+        rebuild_rollups(archive_store)
+        db.session.commit()
+        print("Daily rollups rebuilt")
+
+
+@app.cli.command("snapshot-balances")
+def snapshot_balances():
+    """Buat snapshot saldo ledger (jalankan berkala via cron)"""
+    with app.app_context():
+        created = snapshot_all(Config.LEDGER_SNAPSHOT_MIN_TAIL)
+        db.session.commit()
+        print(f"{created} balance snapshot(s) created")
+
+
+@app.cli.command("backfill-opening-balances")
+def backfill_opening_balances_command():
+    """
+    Catat saldo wallet-service yang belum ada di ledger sebagai opening balance.
+    Jalankan sekali saat write berhenti (maintenance), sebelum snapshot-balances.
+    """
+    with app.app_context():
+        total = 0
+        page = []
+        for wallet in wallet_client.iter_wallets():
+            page.append(wallet)
+            if len(page) >= 500:
+                total += backfill_opening_balances(page)
+                db.session.commit()
+                page.clear()
+        total += backfill_opening_balances(page)
+        db.session.commit()
+        print(f"Opening balance recorded for {total} wallet(s)")
+
+
+@app.cli.command("prune-idempotency-keys")
+def prune_idempotency_keys():
+    """Hapus response Idempotency-Key yang lebih tua dari IDEMPOTENCY_RETENTION_DAYS"""
+    with app.app_context():
+        count = idempotency.prune()
+        print(f"Pruned {count} idempotency key(s)")
+
+
+@app.cli.command("dispatch-outbox")
+def dispatch_outbox():
+    """Worker dispatcher outbox (jalan terus); alternatif thread di proses web"""
+    with app.app_context():
+        outbox_dispatcher.run_forever()
+
+
+@app.cli.command("prune-outbox")
+def prune_outbox():
+    """Hapus event outbox SENT yang lebih tua dari OUTBOX_RETENTION_DAYS"""
+    with app.app_context():
+        count = outbox_dispatcher.prune(Config.OUTBOX_RETENTION_DAYS)
+        print(f"Pruned {count} sent outbox event(s)")
+
+
+@app.cli.command("sync-analytics")
+def sync_analytics():
+    """Salin transaksi baru ke columnar store (ANALYTICS_DIR)"""
+    with app.app_context():
+        added = analytics_store.sync(Config.ANALYTICS_SYNC_BATCH_SIZE)
+        print(f"{added} transaction(s) appended, {analytics_store.meta()['rows']} total")
+
+
+@app.cli.command("analytics-syncer")
+def analytics_syncer():
+    """Worker sync columnar store (jalan terus, tiap ANALYTICS_SYNC_INTERVAL detik)"""
+    with app.app_context():
+        analytics_store.run_forever(app, Config.ANALYTICS_SYNC_BATCH_SIZE, Config.ANALYTICS_SYNC_INTERVAL)
+
+
+@app.cli.command("archive-transactions")
+def archive_transactions():
+    """Arsipkan bulan yang sudah tutup ke file terkompresi (TRANSACTION_HOT_MONTHS tetap hot)"""
+    with app.app_context():
+        for month in closed_months(Config.TRANSACTION_HOT_MONTHS):
+            count = archive_store.archive_month(month, Config.STREAM_BATCH_SIZE)
+            print(f"{month:%Y-%m}: {count} transaction(s) archived")
+
+
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        if "transactions.counterparty_wallet_id" in add_missing_columns():
+            backfill_counterparty_wallets()
+        ensure_autoincrement(archive_store.max_id())
+        report_missing_indexes()
+        # State velocity dibangun sekali sebelum menerima request
+        if Config.VELOCITY_ENABLED:
+            velocity.load()
+    idempotency.start()
+    if Config.OUTBOX_DISPATCHER_ENABLED:
+        outbox_dispatcher.start()
+    if Config.ANALYTICS_SYNCER_ENABLED:
+        analytics_store.start(app, Config.ANALYTICS_SYNC_BATCH_SIZE, Config.ANALYTICS_SYNC_INTERVAL)
     app.run(host="0.0.0.0", port=Config.PORT, debug=True)
@@ -0,0 +1,330 @@
+import csv
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, insert, select, update
+
+from models import db, Transaction, BulkTransferJob, BulkTransferItem
+from wallet_client import InsufficientBalance, WalletNotFound, ApplyCancelled
+from idempotency import DuplicateRequest
+from ledger import record_entries
+from rollups import record_rollups
+from outbox import record_events
+
+
+class TooManyRows(Exception):
+    pass
+
+
+class InvalidCsv(Exception):
+    """Upload bukan CSV UTF-8 yang bisa dibaca"""
+    pass
+
+
+# ============================================================
+#                 BULK TRANSFER (PAYROLL / PAYOUT)
+# ============================================================
+# 1. Baris disimpan sebagai BulkTransferItem (streaming, per chunk)
+# 2. Total di-debit dari wallet sumber SEKALI ke akun clearing
+# 3. Kredit ke tujuan diproses per chunk, satu transaksi DB per chunk
+# 4. Sisa (tujuan gagal) dikembalikan ke sumber
+# Debit & refund idempotent lewat idempotency key. Kredit per item memakai
+# apply_id tetap "bulk:<job>:<item>", jadi kredit yang sudah masuk di
+# wallet-service tapi belum ter-commit lokal (timeout, crash) hanya di-replay
+# saat retry / resume, tidak dikredit dua kali.
+# Job yang terhenti karena error (mis. wallet-service down) menjadi PAUSED,
+# dana tetap di akun clearing sampai `flask resume-bulk-transfers`.
+
+def _clearing_account(job_id):
+    return f"CLEARING:BULK:{job_id}"
+
+
+def _validate_row(row_number, to_wallet_id, amount, from_wallet_id):
+    try:
+        to_wallet_id = int(to_wallet_id)
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return row_number, None, None, "Invalid to_wallet_id or amount"
+
+    if amount <= 0:
+        return row_number, to_wallet_id, amount, "Amount must be positive"
+    if to_wallet_id == from_wallet_id:
+        return row_number, to_wallet_id, amount, "Cannot transfer to the same wallet"
+    return row_number, to_wallet_id, amount, None
+
+
+def json_rows(transfers, from_wallet_id):
+    for i, row in enumerate(transfers, start=1):
+        if not isinstance(row, dict):
+            yield i, None, None, "Row must be an object"
+            continue
+        yield _validate_row(i, row.get("to_wallet_id"), row.get("amount"), from_wallet_id)
+
+
+def csv_rows(stream, from_wallet_id):
+    """Baca CSV (header: to_wallet_id,amount) langsung dari stream upload"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline=""))
+    try:
+        for i, row in enumerate(reader, start=1):
+            yield _validate_row(i, row.get("to_wallet_id"), row.get("amount"), from_wallet_id)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise InvalidCsv(str(e))
+
+
+def create_job(from_wallet_id, rows, chunk_size=1000, max_rows=100000):
+    """Simpan job + semua item dalam satu transaksi; item di-insert per chunk"""
+    job = BulkTransferJob(from_wallet_id=from_wallet_id, status="PENDING")
+    db.session.add(job)
+    db.session.flush()
+
+    buffer = []
+    count = failed = 0
+    total = 0.0
+    try:
+        for row_number, to_wallet_id, amount, error in rows:
+            count += 1
+            if count > max_rows:
+                raise TooManyRows(max_rows)
+
+            if error:
+                failed += 1
+            else:
+                total += amount
+            buffer.append({
+                "job_id": job.id,
+                "row_number": row_number,
+                "to_wallet_id": to_wallet_id,
+                "amount": amount,
+                "status": "FAILED" if error else "PENDING",
+                "error": error,
+            })
+            if len(buffer) >= chunk_size:
+                db.session.execute(insert(BulkTransferItem), buffer)
+                buffer.clear()
+
+        if buffer:
+            db.session.execute(insert(BulkTransferItem), buffer)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    job.total_rows = count
+    job.total_amount = total
+    job.failed = failed
+    db.session.commit()
+    return job
+
+
+def reserve_funds(writer, job_id):
+    """Debit total job dari sumber ke akun clearing. Return False kalau saldo kurang."""
+    job = db.session.get(BulkTransferJob, job_id)
+    source = writer.wallets.get_wallet(job.from_wallet_id)
+
+    if job.total_amount > 0:
+        try:
+            writer.submit(
+                [dict(
+                    wallet_id=source["id"],
+                    user_id=source["user_id"],
+                    type="TRANSFER",
+                    amount=job.total_amount,
+                    status="SUCCESS",
+                    description=f"Bulk transfer job {job_id}"
+                )],
+                [(source["id"], -job.total_amount)],
+                idempotency_key=f"bulk-transfer:{job_id}",
+                counter_account=_clearing_account(job_id)
+            )
+        except DuplicateRequest:
+            pass    # Sudah di-debit sebelumnya (resume)
+        except InsufficientBalance:
+            job = db.session.get(BulkTransferJob, job_id)
+            job.status = "FAILED"
+            job.error = "Insufficient balance in source wallet"
+            db.session.execute(
+                update(BulkTransferItem)
+                .where(BulkTransferItem.job_id == job_id, BulkTransferItem.status == "PENDING")
+                .values(status="FAILED", error="Insufficient balance in source wallet")
+            )
+            job.failed = job.total_rows
+            db.session.commit()
+            return False
+
+    job = db.session.get(BulkTransferJob, job_id)
+    job.status = "RUNNING"
+    db.session.commit()
+    return True
+
+
+def _apply_id(job_id, item_id):
+    return f"bulk:{job_id}:{item_id}"
+
+
+def _item_error(outcome):
+    if isinstance(outcome, WalletNotFound):
+        return "Destination wallet not found"
+    if isinstance(outcome, ApplyCancelled):
+        return "Credit was cancelled"
+    return f"{type(outcome).__name__}: {outcome}"[:255]
+
+
+def _process_chunk(writer, job_id, from_wallet_id, chunk_size):
+    items = db.session.execute(
+        select(BulkTransferItem)
+        .where(BulkTransferItem.job_id == job_id, BulkTransferItem.status == "PENDING")
+        .order_by(BulkTransferItem.id)
+        .limit(chunk_size)
+    ).scalars().all()
+    if not items:
+        return 0
+
+    # Satu multi-get + satu apply (satu grup per item, apply_id tetap) ke wallet-service.
+    # Error apply / commit tidak dikompensasi: item tetap PENDING dan retry /
+    # resume mengirim apply_id yang sama (replay).
+    owners = {
+        wallet_id: wallet["user_id"]
+        for wallet_id, wallet in writer.wallets.get_wallets({item.to_wallet_id for item in items}).items()
+    }
+    found = [item for item in items if item.to_wallet_id in owners]
+    outcomes = dict(zip(
+        (item.id for item in found),
+        writer.wallets.apply(
+            [[(item.to_wallet_id, item.amount)] for item in found],
+            ids=[_apply_id(job_id, item.id) for item in found]
+        ) if found else []
+    ))
+
+    ok = []
+    for item in items:
+        outcome = outcomes.get(item.id, WalletNotFound(item.to_wallet_id))
+        if isinstance(outcome, Exception):
+            item.status = "FAILED"
+            item.error = _item_error(outcome)
+        else:
+            ok.append(item)
+
+    try:
+        if ok:
+            trxs = [
+                Transaction(
+                    wallet_id=item.to_wallet_id,
+                    user_id=owners[item.to_wallet_id],
+                    type="TRANSFER_IN",
+                    amount=item.amount,
+                    status="SUCCESS",
+                    description=f"Bulk transfer from wallet {from_wallet_id} (job {job_id})",
+                    counterparty_wallet_id=from_wallet_id
+                )
+                for item in ok
+            ]
+            db.session.add_all(trxs)
+            db.session.flush()
+            record_entries(trxs, [(item.to_wallet_id, item.amount) for item in ok], _clearing_account(job_id))
+            record_rollups(trxs)
+            record_events(trxs)
+
+            for item, trx in zip(ok, trxs):
+                item.status = "SUCCESS"
+                item.transaction_id = trx.id
+
+        db.session.execute(
+            update(BulkTransferJob)
+            .where(BulkTransferJob.id == job_id)
+            .values(
+                succeeded=BulkTransferJob.succeeded + len(ok),
+                failed=BulkTransferJob.failed + (len(items) - len(ok)),
+            )
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(items)
+
+
+def _refund_remainder(writer, job_id):
+    job = db.session.get(BulkTransferJob, job_id)
+    paid = db.session.execute(
+        select(func.coalesce(func.sum(BulkTransferItem.amount), 0.0))
+        .where(BulkTransferItem.job_id == job_id, BulkTransferItem.status == "SUCCESS")
+    ).scalar_one()
+    refund = round(job.total_amount - paid, 2)
+
+    if refund > 0:
+        source = writer.wallets.get_wallet(job.from_wallet_id)
+        try:
+            writer.submit(
+                [dict(
+                    wallet_id=source["id"],
+                    user_id=source["user_id"],
+                    type="TRANSFER_IN",
+                    amount=refund,
+                    status="SUCCESS",
+                    description=f"Refund bulk transfer job {job_id}"
+                )],
+                [(source["id"], refund)],
+                idempotency_key=f"bulk-transfer:{job_id}:refund",
+                counter_account=_clearing_account(job_id)
+            )
+        except DuplicateRequest:
+            pass
+
+    job = db.session.get(BulkTransferJob, job_id)
+    job.refunded_amount = max(refund, 0.0)
+    job.status = "COMPLETED"
+    db.session.commit()
+
+
+def run_job(writer, job_id, chunk_size=1000):
+    """Proses semua item PENDING; aman dipanggil ulang setelah crash"""
+    job = db.session.get(BulkTransferJob, job_id)
+    if job is None or job.status in ("COMPLETED", "FAILED"):
+        return
+
+    # PAUSED bisa terhenti sebelum atau sesudah debit; debit ulang di-dedupe idempotency key
+    if job.status in ("PENDING", "PAUSED") and not reserve_funds(writer, job_id):
+        return
+
+    from_wallet_id = job.from_wallet_id
+    while writer.with_retry(lambda: _process_chunk(writer, job_id, from_wallet_id, chunk_size)):
+        pass
+
+    _refund_remainder(writer, job_id)
+
+
+def pause_job(job_id, error):
+    """Tandai job PAUSED (dana tetap di clearing) supaya diambil resume-bulk-transfers"""
+    db.session.rollback()
+    job = db.session.get(BulkTransferJob, job_id)
+    job.status = "PAUSED"
+    job.error = str(error)[:255]
+    db.session.commit()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(max_workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-transfer")
+        return _executor
+
+
+def start_job(app, writer, job_id, chunk_size=1000):
+    """
+    Antrekan run_job di pool BULK_TRANSFER_WORKERS thread (bukan satu thread per
+    job). Job yang masih antre tetap PENDING; setelah restart diambil resume-bulk-transfers.
+    """
+    def target():
+        with app.app_context():
+            try:
+                run_job(writer, job_id, chunk_size)
+            except Exception as e:
+                app.logger.exception("Bulk transfer job %s paused", job_id)
+                pause_job(job_id, e)
+
+    return _get_executor(app.config.get("BULK_TRANSFER_WORKERS", 2)).submit(target)
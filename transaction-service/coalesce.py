@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+# ============================================================
+#                 COALESCING LOOKUP (wallet / user client)
+# ============================================================
+# LRU + TTL di depan fetch(ids) -> {id: value}. get() dari banyak thread yang
+# berdekatan digabung jadi satu fetch:
+# - thread pertama yang menambah id ke batch terbuka jadi leader batch itu
+# - leader menunggu coalesce_window, menutup batch (id berikutnya masuk batch
+#   baru dengan leader baru), lalu fetch sekali untuk semua id di batch
+# Leader hanya mengerjakan batch miliknya sendiri, jadi lama satu get()
+# dibatasi satu window + satu fetch walau lookup terus berdatangan.
+#     lookup = CoalescingLookup(client.fetch, cache_size=10000, cache_ttl=30)
+#     lookup.get(1)            # dari banyak thread -> digabung
+#     lookup.get_many([1, 2])  # yang belum di-cache diambil sekaligus
+
+class CoalescingLookup:
+
+    def __init__(self, fetch, cache_size=10000, cache_ttl=30.0, coalesce_window=0.0):
+        self.fetch = fetch
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_ttl = cache_ttl
+        self._coalesce_window = coalesce_window
+        self._inflight = {}
+        self._pending = []
+        self._leader = False
+        self._lock = threading.Lock()
+
+    # ------------------------------
+    # CACHE
+    # ------------------------------
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _remember(self, key, value):
+        self._cache[key] = (time.monotonic() + self._cache_ttl, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    # ------------------------------
+    # LOOKUP
+    # ------------------------------
+    def get_many(self, keys):
+        """{key: value} untuk key yang ada; yang belum di-cache diambil dengan satu fetch"""
+        found, missing = {}, []
+        with self._lock:
+            for key in set(keys):
+                cached = self._cached(key)
+                if cached is not None:
+                    found[key] = cached
+                else:
+                    missing.append(key)
+        if missing:
+            fetched = self.fetch(sorted(missing))
+            with self._lock:
+                for key, value in fetched.items():
+                    if value is not None:
+                        self._remember(key, value)
+            found.update(fetched)
+        return found
+
+    def get(self, key):
+        """value atau None; get() bersamaan untuk key yang sama / berbeda digabung"""
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+
+            future = self._inflight.get(key)
+            leader = False
+            if future is None:
+                future = self._inflight[key] = Future()
+                self._pending.append(key)
+                if not self._leader:
+                    self._leader = leader = True
+
+        if leader:
+            if self._coalesce_window:
+                time.sleep(self._coalesce_window)
+            # Tutup batch: id yang datang setelah ini dipimpin thread lain
+            with self._lock:
+                keys, self._pending = self._pending, []
+                self._leader = False
+            self._resolve(keys)
+
+        return future.result()
+
+    def _resolve(self, keys):
+        try:
+            found = self.fetch(sorted(keys))
+        except Exception as e:
+            found, error = {}, e
+        else:
+            error = None
+        with self._lock:
+            for key in keys:
+                pending = self._inflight.pop(key)
+                if error is not None:
+                    pending.set_exception(error)
+                    continue
+                if found.get(key) is not None:
+                    self._remember(key, found[key])
+                pending.set_result(found.get(key))
@@ -0,0 +1,365 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import or_, select
+
+from models import db, Transaction
+
+
+class AnalyticsUnavailable(Exception):
+    pass
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise AnalyticsUnavailable("Columnar analytics requires the 'numpy' package")
+    return numpy
+
+
+# ============================================================
+#                 COLUMNAR ANALYTICS STORE
+# ============================================================
+# Salinan kolom transaksi sebagai array NumPy bertipe tetap, satu file per
+# kolom (append-only), dibaca lewat memmap. meta.json menyimpan jumlah baris
+# yang valid + id terakhir yang sudah disalin; baris di file yang melebihi
+# meta (crash di tengah append) dipotong sebelum append berikutnya.
+# type/status disimpan sebagai kode uint8 (dictionary encoding).
+#
+# Sync TIDAK jalan di request baca: hanya lewat CLI sync-analytics atau satu
+# syncer (analytics-syncer / ANALYTICS_SYNCER_ENABLED). Penulis memegang
+# flock di <dir>/.lock dan membaca ulang meta.json dari disk di dalam lock,
+# jadi beberapa proses tidak saling menimpa. Pembaca cukup melihat mtime
+# meta.json (ditulis atomik) untuk tahu ada baris baru.
+#
+# Watermark aman terhadap celah id: id yang dilewati (transaksi lebih kecil
+# yang belum commit saat id lebih besar sudah terlihat) dicatat sebagai
+# rentang di meta["gaps"] dan dicek ulang setiap sync, sampai ketemu atau
+# lebih tua dari gap_retention (rollback / sequence yang dilompati).
+
+COLUMNS = {
+    "id": "int64",
+    "user_id": "int64",
+    "wallet_id": "int64",
+    "type": "uint8",
+    "status": "uint8",
+    "amount": "float64",
+    "created_at": "int64",      # detik sejak epoch (UTC)
+}
+
+GROUP_KEYS = ("user_id", "wallet_id", "type", "status", "hour", "day")
+METRICS = ("count", "sum", "mean", "min", "max")
+
+_BUCKET_SECONDS = {"hour": 3600, "day": 86400}
+
+
+class ColumnarStore:
+
+    def __init__(self, directory, gap_retention=3600):
+        self.directory = directory
+        self.gap_retention = gap_retention
+        self._lock = threading.Lock()
+        self._meta = None
+        self._meta_mtime = None
+        self._maps = None
+        self._thread = None
+
+    # ------------------------------
+    # META + FILE
+    # ------------------------------
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def _load_meta(self):
+        path = self._meta_path()
+        if not os.path.exists(path):
+            return {"rows": 0, "last_id": 0, "gaps": [], "dictionaries": {"type": [], "status": []}}
+        with open(path) as f:
+            meta = json.load(f)
+        meta.setdefault("gaps", [])
+        return meta
+
+    def meta(self):
+        """meta.json terbaru; dibaca ulang kalau file diganti oleh proses lain"""
+        path = self._meta_path()
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        with self._lock:
+            if self._meta is None or mtime != self._meta_mtime:
+                self._meta = self._load_meta()
+                self._meta_mtime = mtime
+                self._maps = None
+            return self._meta
+
+    def _write_meta(self, meta):
+        path = self._meta_path()
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    @contextmanager
+    def _file_lock(self):
+        """Satu penulis di antara semua proses / worker yang memakai directory ini"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def columns(self):
+        """dict nama kolom -> array read-only (memmap) sepanjang meta['rows']"""
+        np = _numpy()
+        meta = self.meta()
+        with self._lock:
+            if self._maps is None:
+                rows = meta["rows"]
+                self._maps = {
+                    name: (np.memmap(self._path(name), dtype=dtype, mode="r", shape=(rows,))
+                           if rows else np.empty(0, dtype=dtype))
+                    for name, dtype in COLUMNS.items()
+                }
+            return self._maps
+
+    # ------------------------------
+    # APPEND INKREMENTAL
+    # ------------------------------
+    def _encode(self, dictionary, value):
+        try:
+            return dictionary.index(value)
+        except ValueError:
+            if len(dictionary) >= 255:
+                raise ValueError("Too many distinct values for a uint8 column")
+            dictionary.append(value)
+            return len(dictionary) - 1
+
+    def _append(self, np, rows, meta):
+        ids, user_ids, wallet_ids, types, statuses, amounts, created = zip(*rows)
+        dictionaries = meta["dictionaries"]
+        batch = {
+            "id": np.array(ids, dtype="int64"),
+            "user_id": np.array(user_ids, dtype="int64"),
+            "wallet_id": np.array(wallet_ids, dtype="int64"),
+            "type": np.array([self._encode(dictionaries["type"], t) for t in types], dtype="uint8"),
+            "status": np.array([self._encode(dictionaries["status"], s) for s in statuses], dtype="uint8"),
+            "amount": np.array(amounts, dtype="float64"),
+            "created_at": np.array(created, dtype="datetime64[s]").astype("int64"),
+        }
+        for name, values in batch.items():
+            with open(self._path(name), "ab") as f:
+                f.write(values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        meta["rows"] += len(rows)
+
+    def _select(self):
+        return select(
+            Transaction.id, Transaction.user_id, Transaction.wallet_id,
+            Transaction.type, Transaction.status, Transaction.amount,
+            Transaction.created_at,
+        )
+
+    def _fill_gaps(self, np, meta, now):
+        """Salin id di celah yang sekarang sudah commit; buang celah kedaluwarsa. Return True kalau meta berubah."""
+        before = (meta["rows"], len(meta["gaps"]))
+        gaps = [g for g in meta["gaps"] if now - g[2] < self.gap_retention]
+        if gaps:
+            rows = db.session.execute(
+                self._select()
+                .where(or_(*(Transaction.id.between(lo, hi) for lo, hi, _ in gaps)))
+                .order_by(Transaction.id)
+            ).all()
+            if rows:
+                self._append(np, rows, meta)
+                gaps = _subtract(gaps, [row[0] for row in rows])
+        meta["gaps"] = gaps
+        return (meta["rows"], len(gaps)) != before
+
+    def sync(self, batch_size=50000):
+        """
+        Salin transaksi baru (id > last_id) + id di celah yang sudah commit ke
+        file kolom; return jumlah baris ditambahkan. Aman dipanggil dari
+        beberapa proses sekaligus (flock).
+        """
+        np = _numpy()
+        with self._file_lock():
+            meta = self._load_meta()
+            start_rows = meta["rows"]
+
+            for name, dtype in COLUMNS.items():
+                size = meta["rows"] * np.dtype(dtype).itemsize
+                with open(self._path(name), "ab") as f:
+                    f.truncate(size)
+
+            now = time.time()
+            if self._fill_gaps(np, meta, now):
+                self._write_meta(meta)
+            while True:
+                rows = db.session.execute(
+                    self._select()
+                    .where(Transaction.id > meta["last_id"])
+                    .order_by(Transaction.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+
+                self._append(np, rows, meta)
+                previous = meta["last_id"]
+                for row in rows:
+                    if row[0] > previous + 1:
+                        meta["gaps"].append([previous + 1, row[0] - 1, now])
+                    previous = row[0]
+                meta["last_id"] = int(previous)
+                self._write_meta(meta)
+                db.session.commit()
+            db.session.commit()
+            return meta["rows"] - start_rows
+
+    # ------------------------------
+    # BACKGROUND SYNCER
+    # ------------------------------
+    def run_forever(self, app, batch_size=50000, interval=5.0):
+        while True:
+            try:
+                self.sync(batch_size)
+            except AnalyticsUnavailable:
+                app.logger.error("Analytics syncer stopped: numpy is not installed")
+                return
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Analytics sync failed")
+            time.sleep(interval)
+
+    def start(self, app, batch_size=50000, interval=5.0):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+
+            def target():
+                with app.app_context():
+                    self.run_forever(app, batch_size, interval)
+
+            self._thread = threading.Thread(target=target, name="analytics-syncer", daemon=True)
+            self._thread.start()
+            return self._thread
+
+    # ------------------------------
+    # QUERY (vectorized)
+    # ------------------------------
+    def query(self, filters=None, group_by=None, percentiles=(), order_by="sum", limit=100):
+        """
+        Filter + group-by + agregasi di atas kolom.
+        filters: user_id, wallet_id, type, status, date_from, date_to
+        group_by: salah satu GROUP_KEYS, atau None untuk satu baris total
+        percentiles: mis. (50, 90, 99) untuk kolom amount
+        """
+        np = _numpy()
+        cols = self.columns()
+        dictionaries = self.meta()["dictionaries"]
+        filters = filters or {}
+
+        mask = np.ones(len(cols["id"]), dtype=bool)
+        for name in ("user_id", "wallet_id"):
+            if filters.get(name) is not None:
+                mask &= cols[name] == filters[name]
+        for name in ("type", "status"):
+            if filters.get(name):
+                if filters[name] not in dictionaries[name]:
+                    mask[:] = False
+                else:
+                    mask &= cols[name] == dictionaries[name].index(filters[name])
+        if filters.get("date_from"):
+            mask &= cols["created_at"] >= _epoch(filters["date_from"])
+        if filters.get("date_to"):
+            mask &= cols["created_at"] < _epoch(filters["date_to"])
+
+        amounts = cols["amount"][mask]
+        if group_by is None:
+            keys = np.zeros(len(amounts), dtype="int64")
+        elif group_by in _BUCKET_SECONDS:
+            bucket = _BUCKET_SECONDS[group_by]
+            keys = cols["created_at"][mask] // bucket * bucket
+        else:
+            keys = cols[group_by][mask]
+
+        groups, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(groups))
+        sums = np.bincount(inverse, weights=amounts, minlength=len(groups))
+
+        # Urutkan per (grup, amount) sekali: min/max/percentile cukup dari indeks
+        ordered = amounts[np.lexsort((amounts, inverse))]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype("int64")
+        nonempty = counts > 0
+        result = {
+            "count": counts,
+            "sum": sums,
+            "mean": np.divide(sums, counts, out=np.zeros(len(groups)), where=nonempty),
+            "min": ordered[starts] if len(ordered) else np.zeros(0),
+            "max": ordered[starts + counts - 1] if len(ordered) else np.zeros(0),
+        }
+        for p in percentiles:
+            position = starts + (counts - 1) * (p / 100.0)
+            low = np.floor(position).astype("int64")
+            high = np.minimum(low + 1, starts + counts - 1)
+            frac = position - low
+            result[f"p{p:g}"] = ordered[low] * (1 - frac) + ordered[high] * frac
+
+        top = np.argsort(-result[order_by], kind="stable")[:limit] if group_by else np.arange(len(groups))
+        return {
+            "rows_scanned": int(len(mask)),
+            "rows_matched": int(len(amounts)),
+            "groups": [
+                dict(
+                    key=_format_key(group_by, groups[i], dictionaries),
+                    **{name: (int(values[i]) if name == "count" else float(values[i]))
+                       for name, values in result.items()}
+                )
+                for i in top
+            ],
+        }
+
+
+def _subtract(gaps, found):
+    """Pecah rentang celah [lo, hi, seen] setelah id di `found` (terurut) tersalin"""
+    result = []
+    found = iter(found)
+    next_id = next(found, None)
+    for lo, hi, seen in sorted(gaps):
+        while next_id is not None and next_id < lo:
+            next_id = next(found, None)
+        while next_id is not None and next_id <= hi:
+            if next_id > lo:
+                result.append([lo, next_id - 1, seen])
+            lo = next_id + 1
+            next_id = next(found, None)
+        if lo <= hi:
+            result.append([lo, hi, seen])
+    return result
+
+
+def _epoch(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
+
+def _format_key(group_by, key, dictionaries):
+    if group_by is None:
+        return None
+    if group_by in ("type", "status"):
+        return dictionaries[group_by][int(key)]
+    if group_by in _BUCKET_SECONDS:
+        return datetime.utcfromtimestamp(int(key)).isoformat()
+    return int(key)
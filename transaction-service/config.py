@@ -31,3 +31,91 @@ class Config:
     # URL Service lain (opsional digunakan untuk integrasi)
     TRANSACTION_SERVICE_URL = os.getenv("TRANSACTION_SERVICE_URL", "http://localhost:3002")
     NOTIFICATION_SERVICE_URL = os.getenv("NOTIFICATION_SERVICE_URL", "http://localhost:3003")
+    WALLET_SERVICE_URL = os.getenv("WALLET_SERVICE_URL", "http://localhost:3004")
+
+    # Client ke wallet-service: http (pool keep-alive) atau local (stand-in in-memory)
+    WALLET_CLIENT = os.getenv("WALLET_CLIENT", "http")
+    WALLET_CLIENT_POOL_SIZE = int(os.getenv("WALLET_CLIENT_POOL_SIZE", 20))
+    WALLET_CLIENT_CONNECT_TIMEOUT = float(os.getenv("WALLET_CLIENT_CONNECT_TIMEOUT", 1.0))
+    WALLET_CLIENT_READ_TIMEOUT = float(os.getenv("WALLET_CLIENT_READ_TIMEOUT", 5.0))
+    WALLET_CLIENT_CACHE_TTL = float(os.getenv("WALLET_CLIENT_CACHE_TTL", 30))
+    WALLET_CLIENT_COALESCE_MS = float(os.getenv("WALLET_CLIENT_COALESCE_MS", 0))
+
+    # Client ke user-service (GET /transactions?include_user=true): batch + LRU/TTL
+    USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:3001")
+    USER_CLIENT_POOL_SIZE = int(os.getenv("USER_CLIENT_POOL_SIZE", 10))
+    USER_CLIENT_CACHE_SIZE = int(os.getenv("USER_CLIENT_CACHE_SIZE", 10000))
+    USER_CLIENT_CACHE_TTL = float(os.getenv("USER_CLIENT_CACHE_TTL", 30))
+    USER_CLIENT_COALESCE_MS = float(os.getenv("USER_CLIENT_COALESCE_MS", 2))
+
+    # Pagination untuk endpoint list
+    PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 100))
+    PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 1000))
+    STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 1000))
+
+    # Group commit: gabungkan commit banyak request dalam satu transaksi DB
+    GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() == "true"
+    GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", 256))
+    GROUP_COMMIT_MAX_DELAY_MS = float(os.getenv("GROUP_COMMIT_MAX_DELAY_MS", 5))
+    GROUP_COMMIT_TIMEOUT = float(os.getenv("GROUP_COMMIT_TIMEOUT", 10))
+
+    # Retry otomatis untuk serialization failure / deadlock / SQLite busy
+    WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", 5))
+    WRITE_RETRY_BACKOFF_MS = float(os.getenv("WRITE_RETRY_BACKOFF_MS", 10))
+
+    # Snapshot saldo ledger dibuat kalau tail entry sudah >= nilai ini
+    LEDGER_SNAPSHOT_MIN_TAIL = int(os.getenv("LEDGER_SNAPSHOT_MIN_TAIL", 100))
+
+    # Bulk transfer (payroll / payout)
+    BULK_TRANSFER_CHUNK_SIZE = int(os.getenv("BULK_TRANSFER_CHUNK_SIZE", 1000))
+    BULK_TRANSFER_MAX_ROWS = int(os.getenv("BULK_TRANSFER_MAX_ROWS", 100000))
+    # Jumlah job yang diproses bersamaan per proses; sisanya antre
+    BULK_TRANSFER_WORKERS = int(os.getenv("BULK_TRANSFER_WORKERS", 2))
+
+    # Idempotency-Key: bloom filter + LRU response terbaru di depan DB
+    IDEMPOTENCY_LRU_SIZE = int(os.getenv("IDEMPOTENCY_LRU_SIZE", 10000))
+    IDEMPOTENCY_KEY_MAX_LENGTH = int(os.getenv("IDEMPOTENCY_KEY_MAX_LENGTH", 64))
+    IDEMPOTENCY_BLOOM_CAPACITY = int(os.getenv("IDEMPOTENCY_BLOOM_CAPACITY", 1000000))
+    IDEMPOTENCY_BLOOM_ERROR_RATE = float(os.getenv("IDEMPOTENCY_BLOOM_ERROR_RATE", 0.01))
+    # Lama response Idempotency-Key disimpan (retry setelah ini dieksekusi ulang)
+    IDEMPOTENCY_RETENTION_DAYS = int(os.getenv("IDEMPOTENCY_RETENTION_DAYS", 7))
+
+    # Arsip bulanan: bulan yang lebih tua dari N bulan terakhir diarsipkan
+    # ke file SQLite terkompresi per bulan (read-only, tetap bisa di-query)
+    TRANSACTION_HOT_MONTHS = int(os.getenv("TRANSACTION_HOT_MONTHS", 3))
+    TRANSACTION_ARCHIVE_DIR = os.getenv("TRANSACTION_ARCHIVE_DIR", os.path.join(instance_path, "archive"))
+
+    # Columnar analytics (butuh numpy): salinan kolom transaksi untuk agregasi cepat
+    ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", os.path.join(instance_path, "columnar"))
+    ANALYTICS_SYNC_BATCH_SIZE = int(os.getenv("ANALYTICS_SYNC_BATCH_SIZE", 50000))
+    ANALYTICS_SYNC_INTERVAL = float(os.getenv("ANALYTICS_SYNC_INTERVAL", 5.0))
+    # Id yang dilewati dicek ulang selama ini (detik) sebelum dianggap rollback
+    ANALYTICS_GAP_RETENTION_SECONDS = int(os.getenv("ANALYTICS_GAP_RETENTION_SECONDS", 3600))
+    # Syncer di proses web; cukup satu (atau pakai `flask analytics-syncer` terpisah)
+    ANALYTICS_SYNCER_ENABLED = os.getenv("ANALYTICS_SYNCER_ENABLED", "false").lower() == "true"
+
+    # Velocity / fraud rules di jalur payment & transfer (0 = tanpa batas).
+    # Default mati: batas diisi dari pola traffic nyata (mis. p99 per user) sebelum dinyalakan
+    VELOCITY_ENABLED = os.getenv("VELOCITY_ENABLED", "false").lower() == "true"
+    VELOCITY_MAX_USERS = int(os.getenv("VELOCITY_MAX_USERS", 100000))
+    VELOCITY_MAX_COUNT_PER_MINUTE = int(os.getenv("VELOCITY_MAX_COUNT_PER_MINUTE", 0))
+    VELOCITY_MAX_COUNT_PER_HOUR = int(os.getenv("VELOCITY_MAX_COUNT_PER_HOUR", 0))
+    VELOCITY_MAX_COUNT_PER_DAY = int(os.getenv("VELOCITY_MAX_COUNT_PER_DAY", 0))
+    VELOCITY_MAX_AMOUNT_PER_MINUTE = float(os.getenv("VELOCITY_MAX_AMOUNT_PER_MINUTE", 0))
+    VELOCITY_MAX_AMOUNT_PER_HOUR = float(os.getenv("VELOCITY_MAX_AMOUNT_PER_HOUR", 0))
+    VELOCITY_MAX_AMOUNT_PER_DAY = float(os.getenv("VELOCITY_MAX_AMOUNT_PER_DAY", 0))
+    VELOCITY_NEW_PAYEE_MAX_AMOUNT = float(os.getenv("VELOCITY_NEW_PAYEE_MAX_AMOUNT", 0))
+    VELOCITY_NEW_PAYEES_PER_DAY = int(os.getenv("VELOCITY_NEW_PAYEES_PER_DAY", 0))
+    VELOCITY_MAX_PAYEES_PER_USER = int(os.getenv("VELOCITY_MAX_PAYEES_PER_USER", 1000))
+    VELOCITY_PAYEE_LOOKBACK_DAYS = int(os.getenv("VELOCITY_PAYEE_LOOKBACK_DAYS", 90))
+
+    # Transactional outbox → notification-service (at-least-once)
+    OUTBOX_DISPATCHER_ENABLED = os.getenv("OUTBOX_DISPATCHER_ENABLED", "true").lower() == "true"
+    OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+    OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 0.5))
+    OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", 30))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+    OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", 1.0))
+    OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", 300))
+    OUTBOX_SEND_TIMEOUT = float(os.getenv("OUTBOX_SEND_TIMEOUT", 5.0))
+    OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))
@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+import zlib
+
+from flask import Response, stream_with_context
+
+from models import db, Transaction
+
+
+# ============================================================
+#                 STREAMING EXPORT (CSV / NDJSON)
+# ============================================================
+# Baris dibaca lewat server-side cursor (stream_results + yield_per) dan
+# dikirim per chunk, jadi memori tetap konstan berapapun ukuran export.
+# Kalau ada arsip bulanan (partitions.py), bulan yang beririsan dengan
+# rentang from/to dibaca dulu dari arsip, baru kemudian tabel hot.
+
+EXPORT_COLUMNS = [
+    "id", "wallet_id", "user_id", "type", "amount", "status",
+    "reference_id", "description", "created_at", "updated_at",
+]
+
+
+def _rows(query, batch_size, archive=None, date_from=None, date_to=None):
+    columns = [getattr(Transaction, name) for name in EXPORT_COLUMNS]
+    stmt = (
+        query.with_entities(*columns)
+        .order_by(Transaction.id)
+        .statement
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    if archive is not None:
+        yield from archive.iter_rows(stmt, date_from, date_to)
+    for row in db.session.execute(stmt):
+        yield row
+
+
+def _format(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def iter_ndjson(query, batch_size=1000, chunk_bytes=65536, **archive):
+    buffer = []
+    size = 0
+    for row in _rows(query, batch_size, **archive):
+        line = json.dumps({k: _format(v) for k, v in zip(EXPORT_COLUMNS, row)}) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield "".join(buffer).encode()
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def iter_csv(query, batch_size=1000, chunk_bytes=65536, **archive):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in _rows(query, batch_size, **archive):
+        writer.writerow([_format(v) for v in row])
+        if out.tell() >= chunk_bytes:
+            yield out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """Kompres stream on the fly (format gzip)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(query, fmt="csv", gzip=False, batch_size=1000,
+                    archive=None, date_from=None, date_to=None):
+    archive = {"archive": archive, "date_from": date_from, "date_to": date_to}
+    if fmt == "ndjson":
+        chunks = iter_ndjson(query, batch_size, **archive)
+        mimetype, ext = "application/x-ndjson", "ndjson"
+    else:
+        chunks = iter_csv(query, batch_size, **archive)
+        mimetype, ext = "text/csv", "csv"
+
+    headers = {"Content-Disposition": f"attachment; filename=transactions.{ext}"}
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
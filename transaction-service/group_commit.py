@@ -0,0 +1,359 @@
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from models import db, Transaction, IdempotentResponse, UnresolvedWalletApply
+from ledger import record_entries
+from rollups import record_rollups
+from outbox import record_events
+from idempotency import DuplicateRequest
+
+
+class WriteTimeout(Exception):
+    """Write belum selesai dalam GROUP_COMMIT_TIMEOUT; hasil akhirnya bisa dicek lewat write_id"""
+
+    def __init__(self, write_id):
+        super().__init__(write_id)
+        self.write_id = write_id
+
+
+# ============================================================
+#                  GROUP-COMMIT WRITE PIPELINE
+# ============================================================
+# Setiap request menyerahkan baris Transaction + delta saldo ke writer.
+# Mode sync (default): langsung diterapkan dan di-commit di request.
+# Mode group-commit: writer thread mengumpulkan banyak request dan
+# meng-commit sekaligus (satu fsync), request baru dilepas setelah batch durable.
+#
+# Saldo diubah di wallet-service (satu round-trip per batch, tiap item atomik
+# di sana), baru kemudian Transaction + ledger ditulis lokal. Setiap item punya
+# write_id yang dikirim sebagai apply_id dan disimpan di Transaction.write_id:
+# - retry (deadlock lokal, timeout ke wallet-service) mengirim id yang sama,
+#   wallet-service me-replay hasil pertama, saldo tidak berubah dua kali
+# - kalau write akhirnya gagal (termasuk hasil apply yang tidak diketahui),
+#   semua id di-cancel: yang sudah masuk dibalik, yang belum sampai ditolak
+# - cancel yang gagal dicatat di unresolved_wallet_applies, diselesaikan oleh
+#   `flask reconcile-wallet-applies`
+
+# SQLSTATE serialization_failure / deadlock_detected (Postgres)
+_RETRYABLE_PGCODES = ("40001", "40P01")
+
+
+def _is_retryable(exc):
+    if isinstance(exc, IntegrityError) or not isinstance(exc, DBAPIError):
+        return False
+    if getattr(exc.orig, "pgcode", None) in _RETRYABLE_PGCODES:
+        return True
+    return "database is locked" in str(exc.orig)
+
+
+def _record_unresolved(errors):
+    """Simpan write_id yang belum bisa dibatalkan untuk reconcile_unresolved()"""
+    try:
+        db.session.rollback()
+        for write_id, error in errors.items():
+            record = db.session.get(UnresolvedWalletApply, write_id) or UnresolvedWalletApply(write_id=write_id, attempts=0)
+            record.attempts += 1
+            record.last_error = str(error)[:255]
+            db.session.add(record)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Could not record unresolved wallet applies %s", sorted(errors))
+
+
+def _committed(write_ids):
+    """write_id yang Transaction-nya ternyata sudah tersimpan (jangan dibatalkan)"""
+    return set(db.session.execute(
+        select(Transaction.write_id).where(Transaction.write_id.in_(write_ids))
+    ).scalars())
+
+
+def compensate(wallets, write_ids):
+    """Batalkan apply di wallet-service untuk write yang gagal; return {write_id: error} yang belum beres"""
+    write_ids = sorted({write_id for write_id in write_ids if write_id})
+    if not write_ids:
+        return {}
+    try:
+        write_ids = sorted(set(write_ids) - _committed(write_ids))
+        if not write_ids:
+            return {}
+        outcomes = wallets.cancel(write_ids)
+        errors = {
+            write_id: f"cancel returned {outcomes.get(write_id)}"
+            for write_id in write_ids if outcomes.get(write_id) not in ("REVERSED", "CANCELLED")
+        }
+    except Exception as e:
+        errors = {write_id: repr(e) for write_id in write_ids}
+
+    if errors:
+        current_app.logger.error("Balance compensation failed, queued for reconciliation: %s", sorted(errors))
+        _record_unresolved(errors)
+    return errors
+
+
+def reconcile_unresolved(wallets, limit=500):
+    """Ulangi cancel untuk unresolved_wallet_applies; return (selesai, masih gagal)"""
+    records = UnresolvedWalletApply.query.order_by(UnresolvedWalletApply.created_at).limit(limit).all()
+    write_ids = [record.write_id for record in records]
+    db.session.rollback()
+    if not write_ids:
+        return 0, 0
+
+    errors = compensate(wallets, write_ids)
+    resolved = [write_id for write_id in write_ids if write_id not in errors]
+    if resolved:
+        UnresolvedWalletApply.query.filter(
+            UnresolvedWalletApply.write_id.in_(resolved)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    return len(resolved), len(errors)
+
+
+class WriteResult:
+    def __init__(self, transactions, balances):
+        self.transactions = transactions    # list dict Transaction yang tersimpan
+        self.balances = balances            # {wallet_id: saldo baru}
+        self.response = None                # (body, status) dari build_response
+
+
+class _WriteItem:
+    __slots__ = ("write_id", "transactions", "deltas", "idempotency_key", "fingerprint",
+                 "build_response", "counter_account", "future")
+
+    def __init__(self, transactions, deltas, idempotency_key=None, build_response=None,
+                 counter_account=None, write_id=None, fingerprint=None):
+        self.write_id = write_id or uuid.uuid4().hex
+        self.transactions = transactions
+        self.deltas = deltas
+        self.idempotency_key = idempotency_key
+        self.fingerprint = fingerprint
+        self.build_response = build_response
+        self.counter_account = counter_account
+        self.future = Future()
+
+
+class TransactionWriter:
+
+    def __init__(self, app=None, wallets=None):
+        self.app = None
+        self.wallets = wallets
+        self.enabled = False
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._outcomes = OrderedDict()     # write_id -> error, untuk write_status()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get("GROUP_COMMIT_ENABLED", False)
+        self.max_batch = app.config.get("GROUP_COMMIT_MAX_BATCH", 256)
+        self.max_delay = app.config.get("GROUP_COMMIT_MAX_DELAY_MS", 5) / 1000.0
+        self.timeout = app.config.get("GROUP_COMMIT_TIMEOUT", 10)
+        self.max_retries = app.config.get("WRITE_MAX_RETRIES", 5)
+        self.retry_backoff = app.config.get("WRITE_RETRY_BACKOFF_MS", 10) / 1000.0
+
+    # ------------------------------
+    # PUBLIC API
+    # ------------------------------
+    def submit(self, transactions, deltas, idempotency_key=None, build_response=None,
+               counter_account=None, write_id=None, fingerprint=None):
+        """
+        transactions: list dict kolom Transaction
+        deltas: list (wallet_id, delta); delta negatif dijaga saldo >= 0
+        idempotency_key: diklaim di idempotency_responses, response disimpan di commit yang sama
+        build_response: fungsi WriteResult -> (body, status)
+        counter_account: akun ledger lawan (default EXTERNAL:<type>)
+        write_id: apply_id di wallet-service (default uuid baru); caller yang
+                  mengulang write yang sama (mis. resume bulk transfer) memberi id tetap
+        fingerprint: hash request asli, disimpan bersama key (lihat idempotency.py)
+        Return WriteResult setelah data durable. WriteTimeout kalau group commit
+        belum selesai dalam GROUP_COMMIT_TIMEOUT (write tetap jalan, cek write_status).
+        """
+        item = _WriteItem(transactions, deltas, idempotency_key, build_response,
+                          counter_account, write_id, fingerprint)
+
+        if not self.enabled:
+            _, result, error = self._run_batch([item])[0]
+            if error is not None:
+                raise error
+            return result
+
+        # Lepas koneksi request selama menunggu, supaya writer tidak kehabisan pool
+        db.session.close()
+
+        self._ensure_worker()
+        self._queue.put(item)
+        try:
+            return item.future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise WriteTimeout(item.write_id)
+
+    def write_status(self, write_id):
+        """
+        COMMITTED (+ transaksi) kalau sudah tersimpan, FAILED kalau gagal di proses
+        ini, selain itu PENDING (masih antre / diproses di worker lain)
+        """
+        trxs = Transaction.query.filter(Transaction.write_id == write_id).order_by(Transaction.id).all()
+        if trxs:
+            return {"write_id": write_id, "status": "COMMITTED", "transactions": [t.to_dict() for t in trxs]}
+        with self._lock:
+            error = self._outcomes.get(write_id)
+        if error is not None:
+            return {"write_id": write_id, "status": "FAILED", "error": error}
+        return {"write_id": write_id, "status": "PENDING"}
+
+    def _remember_failure(self, write_id, error):
+        with self._lock:
+            self._outcomes[write_id] = str(error) or type(error).__name__
+            while len(self._outcomes) > 10000:
+                self._outcomes.popitem(last=False)
+
+    # ------------------------------
+    # RETRY (serialization failure / deadlock / SQLite busy)
+    # ------------------------------
+    def with_retry(self, fn):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except DBAPIError as e:
+                db.session.rollback()
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                # Exponential backoff + jitter
+                time.sleep(self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+            except Exception:
+                db.session.rollback()
+                raise
+
+    # ------------------------------
+    # APPLY SATU ITEM (tanpa commit)
+    # ------------------------------
+    def _record(self, item, balances):
+        key = item.idempotency_key
+        claim = None
+        if key:
+            # Klaim key dulu di savepoint sendiri: hanya bentrok di PK ini yang
+            # berarti request kembar, IntegrityError lain tetap error biasa
+            claim = IdempotentResponse(key=key, fingerprint=item.fingerprint, status_code=200, body="null")
+            try:
+                with db.session.begin_nested():
+                    db.session.add(claim)
+            except IntegrityError:
+                raise DuplicateRequest(key)
+
+        trxs = [Transaction(write_id=item.write_id, **fields) for fields in item.transactions]
+        db.session.add_all(trxs)
+        db.session.flush()
+        record_entries(trxs, item.deltas, item.counter_account)
+        record_rollups(trxs)
+        record_events(trxs)
+
+        result = WriteResult([t.to_dict() for t in trxs], balances)
+        if item.build_response is not None:
+            result.response = item.build_response(result)
+            if claim is not None:
+                body, status = result.response
+                claim.status_code = status
+                claim.body = json.dumps(body)
+        return result
+
+    # ------------------------------
+    # WRITER THREAD
+    # ------------------------------
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="group-commit-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._collect()
+                self._flush(batch)
+
+    def _apply_balances(self, batch):
+        """Satu round-trip ke wallet-service untuk semua item yang punya delta"""
+        pending = [item for item in batch if item.deltas]
+        remote = iter(self.wallets.apply(
+            [item.deltas for item in pending], ids=[item.write_id for item in pending]
+        ) if pending else [])
+        return [next(remote) if item.deltas else {} for item in batch]
+
+    def _apply_batch(self, batch):
+        """Tidak ada kompensasi di sini: retry memakai write_id yang sama (replay)"""
+        outcomes = []
+        for item, balances in zip(batch, self._apply_balances(batch)):
+            if isinstance(balances, Exception):
+                outcomes.append((item, None, balances))
+                continue
+            try:
+                with db.session.begin_nested():
+                    outcomes.append((item, self._record(item, balances), None))
+            except DuplicateRequest as e:
+                outcomes.append((item, None, e))
+        db.session.commit()
+        return outcomes
+
+    def _run_batch(self, batch):
+        try:
+            outcomes = self.with_retry(lambda: self._apply_batch(batch))
+        except Exception as e:
+            # Hasil apply tidak pasti (timeout) atau commit lokal gagal: batalkan semua
+            compensate(self.wallets, [item.write_id for item in batch if item.deltas])
+            for item in batch:
+                self._remember_failure(item.write_id, e)
+            raise
+
+        # Request kembar: saldonya sudah diterapkan tapi Transaction tidak disimpan
+        compensate(self.wallets, [
+            item.write_id for item, _, error in outcomes
+            if isinstance(error, DuplicateRequest) and item.deltas
+        ])
+        for item, _, error in outcomes:
+            if error is not None:
+                self._remember_failure(item.write_id, error)
+        return outcomes
+
+    def _flush(self, batch):
+        try:
+            outcomes = self._run_batch(batch)
+        except Exception as e:
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        for item, result, error in outcomes:
+            if error is not None:
+                item.future.set_exception(error)
+            else:
+                item.future.set_result(result)
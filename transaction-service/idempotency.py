@@ -0,0 +1,203 @@
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import g, request
+from sqlalchemy import delete, select
+
+from models import db, IdempotentResponse
+
+
+class DuplicateRequest(Exception):
+    pass
+
+
+# Panjang IdempotentResponse.key; scope + ":" + key client harus muat
+KEY_COLUMN_LENGTH = 100
+
+
+# ============================================================
+#                 IDEMPOTENCY-KEY
+# ============================================================
+# Key di-scope per user ("u<X-User-Id>:<key>", tanpa header gateway pakai wallet
+# sumber "w<wallet_id>:<key>"), jadi key yang sama dari dua user tidak bentrok.
+# Baris idempotency_responses adalah klaimnya: di-insert lebih dulu (PK = key)
+# dalam commit yang sama dengan transaksinya, lengkap dengan fingerprint
+# request (sha256 method + path + body kanonik). Key yang dipakai ulang dengan
+# body berbeda ditolak 422, bukan di-replay.
+# Di depan DB ada bloom filter (key baru = tanpa query) + LRU response terbaru.
+# Bloom filter diisi di thread background saat start (hanya key dalam
+# IDEMPOTENCY_RETENTION_DAYS); selama belum siap, lookup langsung ke DB.
+# Baris yang lebih tua dari retensi dihapus `flask prune-idempotency-keys`.
+
+class BloomFilter:
+
+    def __init__(self, capacity=1_000_000, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class IdempotencyStore:
+
+    def __init__(self, app=None):
+        self.bloom = None
+        self._recent = OrderedDict()
+        self._loading = None    # key yang di-remember() selama load() berjalan
+        self._thread = None
+        self._lock = threading.Lock()
+        self.db_lookups = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_recent = app.config.get("IDEMPOTENCY_LRU_SIZE", 10000)
+        self.max_key_length = app.config.get("IDEMPOTENCY_KEY_MAX_LENGTH", 64)
+        self.capacity = app.config.get("IDEMPOTENCY_BLOOM_CAPACITY", 1_000_000)
+        self.error_rate = app.config.get("IDEMPOTENCY_BLOOM_ERROR_RATE", 0.01)
+        self.retention_days = app.config.get("IDEMPOTENCY_RETENTION_DAYS", 7)
+
+    def load(self):
+        """Isi bloom filter dari key dalam masa retensi (tanpa menahan lock selama scan)"""
+        with self._lock:
+            self._loading = []
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        keys = db.session.execute(
+            select(IdempotentResponse.key)
+            .where(IdempotentResponse.created_at >= cutoff)
+            .execution_options(yield_per=10000)
+        ).scalars()
+        for key in keys:
+            bloom.add(key)
+        with self._lock:
+            for key in self._loading:
+                bloom.add(key)
+            self._loading = None
+            self.bloom = bloom
+
+    def start(self):
+        """Bangun bloom filter di thread background; request tidak menunggu"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+
+            def target():
+                with self.app.app_context():
+                    self.load()
+
+            self._thread = threading.Thread(target=target, name="idempotency-bloom", daemon=True)
+            self._thread.start()
+            return self._thread
+
+    def prune(self, older_than_days=None):
+        """Hapus response yang lebih tua dari masa retensi, return jumlah baris"""
+        days = self.retention_days if older_than_days is None else older_than_days
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        result = db.session.execute(delete(IdempotentResponse).where(IdempotentResponse.created_at < cutoff))
+        db.session.commit()
+        return result.rowcount
+
+    def lookup(self, key, check_db=False):
+        """Return (body, status, fingerprint) response asli, atau None kalau key belum pernah dipakai"""
+        with self._lock:
+            cached = self._recent.get(key)
+            if cached is not None:
+                self._recent.move_to_end(key)
+                return cached
+            # Bloom filter belum siap: cek DB
+            if not check_db and self.bloom is not None and key not in self.bloom:
+                return None
+            self.db_lookups += 1
+
+        record = db.session.get(IdempotentResponse, key)
+        if record is None:
+            return None
+        response = (json.loads(record.body), record.status_code, record.fingerprint)
+        self.remember(key, response)
+        return response
+
+    def remember(self, key, response):
+        with self._lock:
+            if self.bloom is not None:
+                self.bloom.add(key)
+            elif self._loading is not None:
+                self._loading.append(key)
+            self._recent[key] = response
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.max_recent:
+                self._recent.popitem(last=False)
+
+    @staticmethod
+    def _scope():
+        """Pemilik key: user dari gateway, atau wallet sumber untuk panggilan internal"""
+        user_id = request.headers.get("X-User-Id")
+        if user_id:
+            return f"u{user_id}"
+        data = request.get_json(silent=True) or {}
+        return f"w{data.get('wallet_id', data.get('from_wallet_id'))}"
+
+    @staticmethod
+    def fingerprint():
+        body = json.dumps(request.get_json(silent=True), sort_keys=True, separators=(",", ":"))
+        raw = f"{request.method} {request.path}\n{body}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @staticmethod
+    def _replay(replay, fingerprint):
+        body, status, original = replay
+        if original is not None and original != fingerprint:
+            return {"error": "Idempotency-Key already used with a different request"}, 422
+        return body, status, {"Idempotent-Replayed": "true"}
+
+    def guard(self, fn):
+        """Decorator untuk endpoint yang memindahkan uang"""
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            client_key = request.headers.get("Idempotency-Key")
+            if not client_key:
+                return fn(*args, **kwargs)
+            if len(client_key) > self.max_key_length:
+                return {"error": f"Idempotency-Key too long (max {self.max_key_length} chars)"}, 400
+            key = f"{self._scope()}:{client_key}"
+            if len(key) > KEY_COLUMN_LENGTH:
+                return {"error": "Invalid X-User-Id / wallet id for Idempotency-Key"}, 400
+            fingerprint = self.fingerprint()
+
+            replay = self.lookup(key)
+            if replay is not None:
+                return self._replay(replay, fingerprint)
+
+            g.idempotency_key = key
+            g.idempotency_fingerprint = fingerprint
+            try:
+                body, status = fn(*args, **kwargs)
+            except DuplicateRequest:
+                # Request kembar di worker lain menang lebih dulu
+                replay = self.lookup(key, check_db=True)
+                if replay is None:
+                    return {"error": "Idempotency-Key already used"}, 409
+                return self._replay(replay, fingerprint)
+
+            if 200 <= status < 300:
+                self.remember(key, (body, status, fingerprint))
+            return body, status
+        return wrapper
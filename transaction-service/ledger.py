@@ -0,0 +1,193 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, insert, select
+
+from models import db, LedgerEntry, BalanceSnapshot
+
+
+# ============================================================
+#                 APPEND-ONLY LEDGER + SNAPSHOT
+# ============================================================
+# Saldo wallet = snapshot terakhir + jumlah entry setelahnya (tail).
+# Entry tidak pernah di-update / dihapus.
+# Saldo yang sudah ada sebelum ledger dipakai dicatat sekali sebagai opening
+# balance (lawan: akun OPENING:<wallet_id>), lihat backfill_opening_balances().
+
+_signed_amount = case(
+    (LedgerEntry.direction == "CREDIT", LedgerEntry.amount),
+    else_=-LedgerEntry.amount,
+)
+
+
+def record_entries(transactions, deltas, counter_account=None):
+    """
+    Tulis entry double-entry untuk satu pergerakan dana (tanpa commit).
+    transactions: list Transaction yang sudah di-flush
+    deltas: list (wallet_id, delta) yang diterapkan ke saldo
+    counter_account: akun lawan untuk selisih (default EXTERNAL:<type>)
+    """
+    if not deltas:
+        return
+
+    now = datetime.utcnow()
+    default_trx = transactions[0].id if transactions else None
+    if len(transactions) == len(deltas):
+        trx_ids = [t.id for t in transactions]
+    else:
+        by_wallet = {t.wallet_id: t.id for t in transactions}
+        trx_ids = [by_wallet.get(wallet_id, default_trx) for wallet_id, _ in deltas]
+
+    rows = [
+        {
+            "transaction_id": trx_id,
+            "wallet_id": wallet_id,
+            "account": f"WALLET:{wallet_id}",
+            "direction": "CREDIT" if delta > 0 else "DEBIT",
+            "amount": abs(delta),
+            "created_at": now,
+        }
+        for (wallet_id, delta), trx_id in zip(deltas, trx_ids)
+    ]
+
+    # Sisi lawan untuk dana dari / ke luar sistem (topup, payment) atau akun clearing
+    residual = -sum(delta for _, delta in deltas)
+    if residual:
+        trx_type = transactions[0].type if transactions else "ADJUSTMENT"
+        rows.append({
+            "transaction_id": default_trx,
+            "wallet_id": None,
+            "account": counter_account or f"EXTERNAL:{trx_type}",
+            "direction": "CREDIT" if residual > 0 else "DEBIT",
+            "amount": abs(residual),
+            "created_at": now,
+        })
+
+    db.session.execute(insert(LedgerEntry), rows)
+
+
+def _latest_snapshot(wallet_id, at=None):
+    query = select(BalanceSnapshot).where(BalanceSnapshot.wallet_id == wallet_id)
+    if at is not None:
+        query = query.where(BalanceSnapshot.as_of <= at)
+    return db.session.execute(
+        query.order_by(BalanceSnapshot.last_entry_id.desc()).limit(1)
+    ).scalar_one_or_none()
+
+
+def _tail(wallet_id, after_entry_id, at=None):
+    query = select(
+        func.coalesce(func.sum(_signed_amount), 0.0),
+        func.max(LedgerEntry.id),
+        func.max(LedgerEntry.created_at),
+    ).where(LedgerEntry.wallet_id == wallet_id, LedgerEntry.id > after_entry_id)
+    if at is not None:
+        query = query.where(LedgerEntry.created_at <= at)
+    return db.session.execute(query).one()
+
+
+def balance_at(wallet_id, at=None):
+    """Saldo wallet sekarang (at=None) atau pada waktu tertentu, O(tail)"""
+    snapshot = _latest_snapshot(wallet_id, at)
+    base = snapshot.balance if snapshot else 0.0
+    after = snapshot.last_entry_id if snapshot else 0
+
+    total, _, _ = _tail(wallet_id, after, at)
+    return base + total
+
+
+def take_snapshot(wallet_id, min_tail=1):
+    """Simpan snapshot baru kalau ada minimal `min_tail` entry sejak snapshot terakhir"""
+    snapshot = _latest_snapshot(wallet_id)
+    base = snapshot.balance if snapshot else 0.0
+    after = snapshot.last_entry_id if snapshot else 0
+
+    tail_count = db.session.execute(
+        select(func.count(LedgerEntry.id))
+        .where(LedgerEntry.wallet_id == wallet_id, LedgerEntry.id > after)
+    ).scalar_one()
+    if tail_count < min_tail:
+        return None
+
+    total, last_entry_id, as_of = _tail(wallet_id, after)
+    new_snapshot = BalanceSnapshot(
+        wallet_id=wallet_id,
+        balance=base + total,
+        last_entry_id=last_entry_id,
+        as_of=as_of,
+    )
+    db.session.add(new_snapshot)
+    return new_snapshot
+
+
+def _opened_wallets():
+    accounts = db.session.execute(
+        select(LedgerEntry.account).where(LedgerEntry.account.like("OPENING:%")).distinct()
+    ).scalars()
+    return {int(account.split(":", 1)[1]) for account in accounts}
+
+
+def backfill_opening_balances(wallets):
+    """
+    Catat opening balance (tanpa commit) untuk wallet yang saldonya di
+    wallet-service tidak sama dengan saldo ledger: selisihnya ditulis sebagai
+    entry WALLET:<id> lawan OPENING:<id>, bertanggal saat wallet dibuat
+    (paling lambat sebelum entry pertamanya) supaya balance_at(at=...) ikut benar.
+    wallets: iterable dict wallet-service (id, balance). Wallet yang sudah
+    punya opening balance dilewati, jadi aman dijalankan ulang.
+    Return jumlah wallet yang di-backfill.
+    """
+    opened = _opened_wallets()
+    now = datetime.utcnow()
+    created = 0
+    for wallet in wallets:
+        wallet_id = wallet["id"]
+        if wallet_id in opened:
+            continue
+        opening = round(wallet["balance"] - balance_at(wallet_id), 2)
+        if not opening:
+            continue
+
+        # Tanggal opening: saat wallet dibuat, dan selalu sebelum entry pertamanya
+        candidates = [now]
+        if wallet.get("created_at"):
+            candidates.append(datetime.fromisoformat(wallet["created_at"]))
+        first = db.session.execute(
+            select(func.min(LedgerEntry.created_at)).where(LedgerEntry.wallet_id == wallet_id)
+        ).scalar()
+        if first is not None:
+            candidates.append(first - timedelta(microseconds=1))
+        created_at = min(candidates)
+        db.session.execute(insert(LedgerEntry), [
+            {
+                "transaction_id": None,
+                "wallet_id": wallet_id,
+                "account": f"WALLET:{wallet_id}",
+                "direction": "CREDIT" if opening > 0 else "DEBIT",
+                "amount": abs(opening),
+                "created_at": created_at,
+            },
+            {
+                "transaction_id": None,
+                "wallet_id": None,
+                "account": f"OPENING:{wallet_id}",
+                "direction": "DEBIT" if opening > 0 else "CREDIT",
+                "amount": abs(opening),
+                "created_at": created_at,
+            },
+        ])
+        opened.add(wallet_id)
+        created += 1
+    return created
+
+
+def snapshot_all(min_tail=1):
+    """Snapshot semua wallet yang punya entry baru, return jumlah snapshot dibuat"""
+    wallet_ids = db.session.execute(
+        select(LedgerEntry.wallet_id).where(LedgerEntry.wallet_id.isnot(None)).distinct()
+    ).scalars().all()
+
+    created = 0
+    for wallet_id in wallet_ids:
+        if take_snapshot(wallet_id, min_tail) is not None:
+            created += 1
+    return created
@@ -1,15 +1,43 @@
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from datetime import datetime
 
 db = SQLAlchemy()
 
+
+# pysqlite tidak mengirim BEGIN sebelum SAVEPOINT: di group commit savepoint
+# per item bisa jadi statement pertama, langsung ter-commit saat di-release,
+# dan rollback() sebelum retry / kompensasi tidak membatalkannya. BEGIN
+# dikirim sendiri (kecuali koneksi AUTOCOMMIT, mis. VACUUM arsip).
+@event.listens_for(Engine, "connect")
+def _sqlite_disable_autobegin(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.isolation_level = None
+
+
+@event.listens_for(Engine, "begin")
+def _sqlite_begin(conn):
+    if conn.dialect.name == "sqlite" and conn.get_execution_options().get("isolation_level") != "AUTOCOMMIT":
+        conn.exec_driver_sql("BEGIN")
+
 class Transaction(db.Model):
     __tablename__ = "transactions"   # NAMA TABEL FIXED
+    __table_args__ = (
+        # Riwayat per user / per wallet: filter + ORDER BY created_at pakai index
+        db.Index("ix_transactions_user_id_created_at", "user_id", "created_at"),
+        db.Index("ix_transactions_wallet_id_created_at", "wallet_id", "created_at"),
+        # Id tidak boleh dipakai ulang setelah baris lama diarsip & dihapus
+        # dari tabel hot (lihat partitions.py / schema.ensure_autoincrement)
+        {"sqlite_autoincrement": True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     wallet_id = db.Column(db.Integer, nullable=False)      # ID wallet dari wallet-service
     user_id = db.Column(db.Integer, nullable=False)        # User ID (owner wallet)
-    type = db.Column(db.String(50), nullable=False)        # TOPUP, PAYMENT, TRANSFER, WITHDRAW
+    type = db.Column(db.String(50), nullable=False)        # TOPUP, PAYMENT, TRANSFER, TRANSFER_IN, WITHDRAW
     amount = db.Column(db.Float, nullable=False)
 
     # PENDING → SUCCESS / FAILED
@@ -20,6 +48,11 @@ class Transaction(db.Model):
 
     reference_id = db.Column(db.String(100), unique=True, nullable=True)
     description = db.Column(db.String(255), nullable=True)
+    # Wallet lawan untuk leg transfer (TRANSFER: tujuan, TRANSFER_IN: pengirim);
+    # NULL untuk transaksi tanpa satu lawan (topup, payment, debit bulk ke clearing)
+    counterparty_wallet_id = db.Column(db.Integer, nullable=True)
+    # ID write (TransactionWriter) = apply_id di wallet-service, untuk cek status & rekonsiliasi
+    write_id = db.Column(db.String(32), nullable=True, index=True)
 
     created_at = db.Column(
         db.DateTime,
@@ -41,6 +74,231 @@ class Transaction(db.Model):
             "status": self.status,
             "reference_id": self.reference_id,
             "description": self.description,
+            "counterparty_wallet_id": self.counterparty_wallet_id,
+            "write_id": self.write_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class LedgerEntry(db.Model):
+    """Double-entry, append-only: setiap pergerakan dana = satu DEBIT + satu CREDIT"""
+    __tablename__ = "ledger_entries"
+    __table_args__ = (
+        db.Index("ix_ledger_entries_wallet_id_id", "wallet_id", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Tanpa FK: entry ledger tetap ada setelah transaksinya diarsipkan (partitions.py)
+    transaction_id = db.Column(db.Integer, nullable=True, index=True)
+
+    # wallet_id NULL = akun eksternal (mis. EXTERNAL:TOPUP untuk dana masuk)
+    wallet_id = db.Column(db.Integer, nullable=True)
+    account = db.Column(db.String(50), nullable=False)
+
+    direction = db.Column(db.String(10), nullable=False)   # DEBIT / CREDIT
+    amount = db.Column(db.Float, nullable=False)             # selalu positif
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "transaction_id": self.transaction_id,
+            "wallet_id": self.wallet_id,
+            "account": self.account,
+            "direction": self.direction,
+            "amount": self.amount,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class BalanceSnapshot(db.Model):
+    """Saldo wallet setelah ledger entry `last_entry_id`"""
+    __tablename__ = "balance_snapshots"
+    __table_args__ = (
+        db.Index("ix_balance_snapshots_wallet_id_last_entry_id", "wallet_id", "last_entry_id"),
+        db.Index("ix_balance_snapshots_wallet_id_as_of", "wallet_id", "as_of"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    wallet_id = db.Column(db.Integer, nullable=False)
+    balance = db.Column(db.Float, nullable=False)
+    last_entry_id = db.Column(db.Integer, nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False)          # created_at entry terakhir
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "wallet_id": self.wallet_id,
+            "balance": self.balance,
+            "last_entry_id": self.last_entry_id,
+            "as_of": self.as_of.isoformat() if self.as_of else None,
+        }
+
+
+class IdempotentResponse(db.Model):
+    """Klaim + response asli untuk request dengan Idempotency-Key (key sudah di-scope per user)"""
+    __tablename__ = "idempotency_responses"
+
+    key = db.Column(db.String(100), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=True)     # sha256 request asli
+    status_code = db.Column(db.Integer, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class BulkTransferJob(db.Model):
+    """Satu sumber wallet -> banyak tujuan (payroll / payout)"""
+    __tablename__ = "bulk_transfer_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    from_wallet_id = db.Column(db.Integer, nullable=False)
+
+    # PENDING → RUNNING → COMPLETED / FAILED; PAUSED = terhenti karena error, lanjut lewat resume
+    status = db.Column(db.String(20), default="PENDING")
+    error = db.Column(db.String(255), nullable=True)
+
+    total_rows = db.Column(db.Integer, default=0)
+    total_amount = db.Column(db.Float, default=0.0)     # yang di-debit dari sumber
+    succeeded = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    refunded_amount = db.Column(db.Float, default=0.0)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "from_wallet_id": self.from_wallet_id,
+            "status": self.status,
+            "error": self.error,
+            "total_rows": self.total_rows,
+            "total_amount": self.total_amount,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "refunded_amount": self.refunded_amount,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class BulkTransferItem(db.Model):
+    __tablename__ = "bulk_transfer_items"
+    __table_args__ = (
+        db.Index("ix_bulk_transfer_items_job_id_status_id", "job_id", "status", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey("bulk_transfer_jobs.id"), nullable=False)
+    row_number = db.Column(db.Integer, nullable=False)
+    to_wallet_id = db.Column(db.Integer, nullable=True)
+    amount = db.Column(db.Float, nullable=True)
+
+    # PENDING → SUCCESS / FAILED
+    status = db.Column(db.String(20), default="PENDING")
+    error = db.Column(db.String(255), nullable=True)
+    transaction_id = db.Column(db.Integer, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "row_number": self.row_number,
+            "to_wallet_id": self.to_wallet_id,
+            "amount": self.amount,
+            "status": self.status,
+            "error": self.error,
+            "transaction_id": self.transaction_id,
+        }
+
+
+class DailyRollup(db.Model):
+    """Agregat harian transaksi SUCCESS per user / wallet / type"""
+    __tablename__ = "daily_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "day", "wallet_id", "type", name="uq_daily_rollups_key"),
+        db.Index("ix_daily_rollups_wallet_id_day", "wallet_id", "day"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    wallet_id = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    min_amount = db.Column(db.Float, nullable=True)
+    max_amount = db.Column(db.Float, nullable=True)
+
+    def to_dict(self):
+        return {
+            "day": self.day.isoformat() if self.day else None,
+            "user_id": self.user_id,
+            "wallet_id": self.wallet_id,
+            "type": self.type,
+            "count": self.count,
+            "total": self.total,
+            "min_amount": self.min_amount,
+            "max_amount": self.max_amount,
+        }
+
+
+class OutboxEvent(db.Model):
+    """Event yang ditulis di commit yang sama dengan Transaction, dikirim async oleh dispatcher"""
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        db.Index("ix_outbox_events_status_next_attempt_at", "status", "next_attempt_at", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)       # transaction.created
+    aggregate_id = db.Column(db.Integer, nullable=False)        # Transaction.id
+    user_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)                # JSON
+
+    # PENDING → SENT, atau DEAD setelah OUTBOX_MAX_ATTEMPTS
+    status = db.Column(db.String(20), nullable=False, default="PENDING")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Juga dipakai sebagai lease: event yang sedang dikirim digeser ke depan
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(255), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "event_type": self.event_type,
+            "aggregate_id": self.aggregate_id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "next_attempt_at": self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "sent_at": self.sent_at.isoformat() if self.sent_at else None,
+        }
+
+
+class UnresolvedWalletApply(db.Model):
+    """Apply di wallet-service yang hasilnya tidak pasti dan belum berhasil dibatalkan"""
+    __tablename__ = "unresolved_wallet_applies"
+
+    write_id = db.Column(db.String(32), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "write_id": self.write_id,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
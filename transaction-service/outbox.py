@@ -0,0 +1,262 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from models import db, OutboxEvent
+
+
+# ============================================================
+#                 TRANSACTIONAL OUTBOX
+# ============================================================
+# Setiap Transaction menulis satu baris outbox_events di commit yang sama,
+# jadi event tidak pernah hilang dan payment tidak menunggu HTTP.
+# Dispatcher (background thread / worker terpisah) mengambil batch event
+# PENDING, mengirim ke notification-service (POST /notifications/bulk), lalu
+# menandai SENT. Gagal = retry dengan exponential backoff, lalu DEAD.
+# Klaim memakai lease di next_attempt_at, dan nilai lease sekaligus token klaim
+# (pola yang sama dengan delivery_jobs di notification-service):
+# - panjangnya OUTBOX_LEASE_SECONDS + OUTBOX_SEND_TIMEOUT (satu POST per batch)
+# - update SENT / retry / DEAD bersyarat next_attempt_at = lease, jadi
+#   dispatcher yang lease-nya sudah habis & diambil alih tidak menimpa hasil
+#   dispatcher lain
+# Pengiriman at-least-once: penerima dedupe berdasarkan event_id.
+# Event SENT dihapus `flask prune-outbox` setelah OUTBOX_RETENTION_DAYS.
+
+EVENT_TRANSACTION_CREATED = "transaction.created"
+
+_TITLES = {
+    "TOPUP": "Topup",
+    "PAYMENT": "Payment",
+    "TRANSFER": "Transfer sent",
+    "TRANSFER_IN": "Transfer received",
+}
+
+
+def record_events(transactions):
+    """Tulis event untuk Transaction yang sudah di-flush (tanpa commit)"""
+    if not transactions:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(OutboxEvent), [
+        {
+            "event_type": EVENT_TRANSACTION_CREATED,
+            "aggregate_id": trx.id,
+            "user_id": trx.user_id,
+            "payload": json.dumps(trx.to_dict()),
+            "status": "PENDING",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+        for trx in transactions
+    ])
+
+
+def to_notification(event_id, payload):
+    """Ubah payload transaksi jadi notifikasi untuk notification-service"""
+    failed = payload["status"] == "FAILED"
+    if failed:
+        title = payload["type"].replace("_", " ").title() + " failed"
+    else:
+        title = _TITLES.get(payload["type"], payload["type"].title())
+    return {
+        "event_id": f"transaction:{event_id}",
+        "user_id": payload["user_id"],
+        "title": title,
+        "message": f"{title}: {payload['amount']:,.2f} ({payload.get('description') or payload['status']})",
+        "type": "WARNING" if failed else "TRANSACTION",
+    }
+
+
+class NotificationSender:
+    """Kirim batch notifikasi lewat satu Session keep-alive"""
+
+    def __init__(self, base_url, timeout=5.0):
+        self.url = base_url.rstrip("/") + "/notifications/bulk"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=2))
+
+    def send(self, notifications):
+        response = self.session.post(self.url, json={"notifications": notifications}, timeout=self.timeout)
+        if response.status_code >= 300:
+            raise RuntimeError(f"notification-service returned HTTP {response.status_code}")
+
+
+class OutboxDispatcher:
+
+    def __init__(self, app=None, sender=None):
+        self.sender = sender
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get("OUTBOX_BATCH_SIZE", 100)
+        self.poll_interval = app.config.get("OUTBOX_POLL_INTERVAL", 0.5)
+        self.lease = timedelta(seconds=app.config.get("OUTBOX_LEASE_SECONDS", 30))
+        self.max_attempts = app.config.get("OUTBOX_MAX_ATTEMPTS", 10)
+        self.backoff = app.config.get("OUTBOX_BACKOFF_SECONDS", 1.0)
+        self.max_backoff = app.config.get("OUTBOX_MAX_BACKOFF_SECONDS", 300.0)
+        self.send_timeout = timedelta(seconds=app.config.get("OUTBOX_SEND_TIMEOUT", 5.0))
+        if self.sender is None:
+            self.sender = NotificationSender(
+                app.config["NOTIFICATION_SERVICE_URL"], self.send_timeout.total_seconds()
+            )
+
+    # ------------------------------
+    # CLAIM (lease lewat next_attempt_at)
+    # ------------------------------
+    def _claim(self):
+        """Return (events, lease): lease = next_attempt_at yang dipasang, token klaim batch ini"""
+        now = datetime.utcnow()
+        ids = db.session.execute(
+            select(OutboxEvent.id)
+            .where(OutboxEvent.status == "PENDING", OutboxEvent.next_attempt_at <= now)
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+        ).scalars().all()
+        if not ids:
+            db.session.rollback()
+            return [], None
+
+        # Kondisi next_attempt_at <= now diulang: dispatcher lain yang sudah
+        # mengambil event yang sama membuatnya tidak lolos lagi
+        lease = now + self.lease + self.send_timeout
+        stmt = (
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_(ids), OutboxEvent.next_attempt_at <= now)
+            .values(next_attempt_at=lease)
+            .execution_options(synchronize_session=False)
+        )
+        if getattr(db.engine.dialect, "update_returning", False):
+            claimed = set(db.session.execute(stmt.returning(OutboxEvent.id)).scalars())
+        else:
+            db.session.execute(stmt)
+            # Tanpa RETURNING: yang benar-benar terklaim = yang membawa lease ini
+            claimed = set(db.session.execute(
+                select(OutboxEvent.id)
+                .where(OutboxEvent.id.in_(ids), OutboxEvent.next_attempt_at == lease)
+            ).scalars())
+        db.session.commit()
+        if not claimed:
+            return [], None
+
+        events = db.session.execute(
+            select(OutboxEvent.id, OutboxEvent.attempts, OutboxEvent.payload)
+            .where(OutboxEvent.id.in_(claimed))
+            .order_by(OutboxEvent.id)
+        ).all()
+        return events, lease
+
+    # ------------------------------
+    # DISPATCH
+    # ------------------------------
+    def dispatch_once(self):
+        """Kirim satu batch; return jumlah event yang diproses"""
+        events, lease = self._claim()
+        if not events:
+            return 0
+
+        ids = [event_id for event_id, _, _ in events]
+        try:
+            self.sender.send([to_notification(event_id, json.loads(payload)) for event_id, _, payload in events])
+        except Exception as e:
+            self._failed(events, str(e)[:255], lease)
+        else:
+            db.session.execute(
+                update(OutboxEvent)
+                .where(
+                    OutboxEvent.id.in_(ids),
+                    OutboxEvent.status == "PENDING",
+                    OutboxEvent.next_attempt_at == lease,
+                )
+                .values(status="SENT", sent_at=datetime.utcnow(), attempts=OutboxEvent.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        return len(events)
+
+    def _failed(self, events, error, lease):
+        now = datetime.utcnow()
+        rows = []
+        for event_id, attempts, _ in events:
+            attempts += 1
+            delay = min(self.backoff * (2 ** (attempts - 1)), self.max_backoff) * random.uniform(0.5, 1.5)
+            rows.append({
+                "event_id": event_id,
+                "new_attempts": attempts,
+                "new_status": "DEAD" if attempts >= self.max_attempts else "PENDING",
+                "retry_at": now + timedelta(seconds=delay),
+                "error": error,
+                "lease": lease,
+            })
+        table = OutboxEvent.__table__
+        db.session.execute(
+            table.update()
+            .where(
+                table.c.id == bindparam("event_id"),
+                table.c.status == "PENDING",
+                table.c.next_attempt_at == bindparam("lease"),
+            )
+            .values(
+                attempts=bindparam("new_attempts"),
+                status=bindparam("new_status"),
+                next_attempt_at=bindparam("retry_at"),
+                last_error=bindparam("error"),
+            ),
+            rows
+        )
+
+    def prune(self, older_than_days):
+        """Hapus event SENT yang lebih tua dari `older_than_days` hari"""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        count = db.session.execute(
+            delete(OutboxEvent).where(OutboxEvent.status == "SENT", OutboxEvent.sent_at < cutoff)
+        ).rowcount
+        db.session.commit()
+        return count
+
+    def drain(self):
+        """Kirim semua event yang jatuh tempo; return total event diproses"""
+        total = 0
+        while True:
+            processed = self.dispatch_once()
+            if not processed:
+                return total
+            total += processed
+
+    # ------------------------------
+    # BACKGROUND THREAD
+    # ------------------------------
+    def run_forever(self):
+        while True:
+            try:
+                if not self.dispatch_once():
+                    time.sleep(self.poll_interval)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception("Outbox dispatch failed")
+                time.sleep(self.poll_interval)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+
+            def target():
+                with self.app.app_context():
+                    self.run_forever()
+
+            self._thread = threading.Thread(target=target, name="outbox-dispatcher", daemon=True)
+            self._thread.start()
+            return self._thread
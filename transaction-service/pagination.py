@@ -0,0 +1,144 @@
+import base64
+import json
+from contextlib import closing
+from datetime import datetime
+from itertools import islice
+
+from flask import Response, stream_with_context
+from sqlalchemy import and_, or_
+
+
+# ============================
+#   KEYSET PAGINATION HELPERS
+# ============================
+
+# archive_rows (opsional): fungsi (statement, order, after) -> list (first, open)
+# dari ArchiveStore.sources(). Statement yang sama (filter + cursor + limit)
+# dijalankan di tiap arsip lalu di-merge dengan tabel hot menurut urutan
+# halaman. Arsip baru dibuka saat key pertamanya bisa masuk sebelum baris
+# berikutnya, jadi halaman yang penuh dari tabel hot tidak menyentuh arsip.
+
+def _merged(rows, sources, key, reverse=False):
+    """Merge lazy `rows` + sumber arsip; iterator arsip yang belum habis ditutup di akhir"""
+    ahead = (lambda a, b: a > b) if reverse else (lambda a, b: a < b)
+    pending = sorted(sources, key=lambda source: source[0], reverse=reverse)
+    active = []
+
+    def advance(it):
+        row = next(it, None)
+        if row is not None:
+            active.append((key(row), row, it))
+
+    try:
+        advance(iter(rows))
+        while active or pending:
+            best = None
+            for i, head in enumerate(active):
+                if best is None or ahead(head[0], active[best][0]):
+                    best = i
+            if pending and (best is None or not ahead(active[best][0], pending[0][0])):
+                advance(pending.pop(0)[1]())
+                continue
+            _, row, it = active.pop(best)
+            yield row
+            advance(it)
+    finally:
+        for _, _, it in active:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+
+
+def keyset_page(query, id_column, after=None, limit=100, max_limit=1000, archive_rows=None):
+    """Ambil satu halaman dengan id > after, return (rows, next_cursor)"""
+    limit = max(1, min(limit, max_limit))
+    if after is not None:
+        query = query.filter(id_column > after)
+
+    # Ambil satu baris ekstra untuk tahu apakah masih ada halaman berikutnya
+    query = query.order_by(id_column).limit(limit + 1)
+    if archive_rows is None:
+        rows = query.all()
+    else:
+        by_id = lambda row: getattr(row, id_column.key)
+        sources = archive_rows(query.statement, order="id", after=after)
+        with closing(_merged(query, sources, by_id)) as merged:
+            rows = list(islice(merged, limit + 1))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], id_column.key)
+    return rows, next_cursor
+
+
+def stream_ndjson(query, id_column, serialize, after=None, limit=None, batch_size=1000, archive_rows=None):
+    """Stream hasil query sebagai NDJSON memakai server-side cursor (yield_per)"""
+    if after is not None:
+        query = query.filter(id_column > after)
+    query = query.order_by(id_column)
+    if limit is not None:
+        query = query.limit(limit)
+
+    def generate():
+        rows = query.yield_per(batch_size)
+        if archive_rows is None:
+            for row in rows:
+                yield json.dumps(serialize(row), default=str) + "\n"
+            return
+        by_id = lambda row: getattr(row, id_column.key)
+        sources = archive_rows(query.statement, order="id", after=after)
+        with closing(_merged(rows, sources, by_id)) as merged:
+            for row in islice(merged, limit):
+                yield json.dumps(serialize(row), default=str) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+# ============================
+#   TIME-ORDERED KEYSET (NEWEST FIRST)
+# ============================
+
+def encode_cursor(created_at, row_id):
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id); ValueError kalau cursor tidak valid"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def time_keyset_page(query, time_column, id_column, before=None, limit=100, max_limit=1000,
+                     archive_rows=None):
+    """
+    Halaman terbaru-dulu (ORDER BY time DESC, id DESC), cocok dengan index
+    (filter_column, time). `before` = cursor dari halaman sebelumnya.
+    """
+    limit = max(1, min(limit, max_limit))
+    after = None
+    if before:
+        cursor_time, cursor_id = decode_cursor(before)
+        after = (cursor_time, cursor_id)
+        query = query.filter(or_(
+            time_column < cursor_time,
+            and_(time_column == cursor_time, id_column < cursor_id),
+        ))
+
+    query = query.order_by(time_column.desc(), id_column.desc()).limit(limit + 1)
+    if archive_rows is None:
+        rows = query.all()
+    else:
+        newest = lambda row: (getattr(row, time_column.key), getattr(row, id_column.key))
+        sources = archive_rows(query.statement, order="time", after=after)
+        with closing(_merged(query, sources, newest, reverse=True)) as merged:
+            rows = list(islice(merged, limit + 1))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
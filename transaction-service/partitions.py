@@ -0,0 +1,308 @@
+import gzip
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import date, datetime
+from itertools import chain
+
+from sqlalchemy import create_engine, delete, func, insert, select, text
+
+from models import db, Transaction
+from schema import add_missing_columns
+
+
+# ============================================================
+#                 MONTHLY COLD ARCHIVE
+# ============================================================
+# Tabel `transactions` hanya menyimpan bulan-bulan "hot".
+# Bulan yang sudah tutup diarsipkan ke file SQLite per bulan
+# (transactions_YYYY_MM.db.gz, skema sama, read-only, terkompresi).
+# Saat di-query, arsip didekompres sekali ke cache lalu dibuka read-only.
+# Semua jalur baca (list, history, export, rebuild rollup) memakai
+# iter_rows() / sources(), jadi bulan yang diarsip tetap terlihat.
+# Baris hot hanya dihapus kalau id-nya sudah ada di file arsip.
+# Setiap arsip punya file .meta.json (min/max id dan created_at): pagination
+# memakainya untuk melewati bulan di luar cursor dan baru membuka arsip saat
+# baris berikutnya memang bisa berasal dari sana (lihat pagination._merged).
+
+_ARCHIVE_RE = re.compile(r"^transactions_(\d{4})_(\d{2})\.db\.gz$")
+
+
+def month_start(day):
+    return datetime(day.year, day.month, 1)
+
+
+def next_month(month):
+    return datetime(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+
+def iter_months(date_from, date_to):
+    """Bulan-bulan yang beririsan dengan [date_from, date_to)"""
+    month = month_start(date_from)
+    while month < date_to:
+        yield month
+        month = next_month(month)
+
+
+def _suffix(month):
+    return f"{month.year:04d}_{month.month:02d}"
+
+
+class ArchiveStore:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.cache_dir = os.path.join(directory, ".cache")
+        self._engines = {}
+        self._meta = {}
+        self._month_locks = {}
+        self._lock = threading.Lock()
+
+    def path(self, month):
+        return os.path.join(self.directory, f"transactions_{_suffix(month)}.db.gz")
+
+    def meta_path(self, month):
+        return os.path.join(self.directory, f"transactions_{_suffix(month)}.meta.json")
+
+    def months(self):
+        if not os.path.isdir(self.directory):
+            return []
+        months = []
+        for name in os.listdir(self.directory):
+            match = _ARCHIVE_RE.match(name)
+            if match:
+                months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+        return sorted(months)
+
+    def months_in_range(self, date_from=None, date_to=None):
+        return [
+            m for m in self.months()
+            if (date_from is None or next_month(m) > date_from)
+            and (date_to is None or m < date_to)
+        ]
+
+    # ------------------------------
+    # READ (decompress sekali, buka read-only)
+    # ------------------------------
+    def engine(self, month):
+        with self._lock:
+            engine = self._engines.get(month)
+            if engine is not None:
+                return engine
+            month_lock = self._month_locks.setdefault(month, threading.Lock())
+
+        # Dekompres di bawah lock per bulan: bulan lain tetap bisa dibaca
+        with month_lock:
+            with self._lock:
+                engine = self._engines.get(month)
+            if engine is not None:
+                return engine
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cached = os.path.join(self.cache_dir, f"transactions_{_suffix(month)}.db")
+            if not os.path.exists(cached):
+                tmp = cached + ".tmp"
+                with gzip.open(self.path(month), "rb") as src, open(tmp, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                # Arsip lama dibuat sebelum kolom baru ada di model
+                upgrade = create_engine(f"sqlite:///{tmp}")
+                add_missing_columns(upgrade)
+                upgrade.dispose()
+                os.replace(tmp, cached)
+
+            engine = create_engine(f"sqlite:///file:{cached}?mode=ro&uri=true")
+            with self._lock:
+                self._engines[month] = engine
+            return engine
+
+    def meta(self, month):
+        """{min_id, max_id, min_created_at, max_created_at} arsip bulan itu, None kalau kosong"""
+        with self._lock:
+            if month in self._meta:
+                return self._meta[month]
+        meta = None
+        if os.path.exists(self.meta_path(month)):
+            with open(self.meta_path(month)) as f:
+                meta = json.load(f)
+        else:
+            # Arsip dari sebelum ada .meta.json: hitung sekali lalu simpan
+            meta = self._write_meta(month)
+        if meta is not None:
+            meta = dict(
+                meta,
+                min_created_at=datetime.fromisoformat(meta["min_created_at"]),
+                max_created_at=datetime.fromisoformat(meta["max_created_at"]),
+            )
+        with self._lock:
+            self._meta[month] = meta
+        return meta
+
+    def _write_meta(self, month):
+        table = Transaction.__table__
+        with self.engine(month).connect() as conn:
+            row = conn.execute(select(
+                func.min(table.c.id), func.max(table.c.id),
+                func.min(table.c.created_at), func.max(table.c.created_at),
+            )).one()
+        meta = None
+        if row[0] is not None:
+            meta = {
+                "min_id": row[0], "max_id": row[1],
+                "min_created_at": row[2].isoformat(), "max_created_at": row[3].isoformat(),
+            }
+        tmp = self.meta_path(month) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path(month))
+        return meta
+
+    def max_id(self):
+        """Id terbesar di semua arsip (high-water mark untuk id baru di tabel hot)"""
+        metas = [self.meta(month) for month in self.months()]
+        return max((meta["max_id"] for meta in metas if meta), default=0)
+
+    def iter_rows(self, stmt, date_from=None, date_to=None):
+        """Jalankan statement Core yang sama di setiap arsip bulan dalam rentang, bulan demi bulan"""
+        months = self.months_in_range(date_from, date_to)
+        return chain.from_iterable(self._month_rows(month, stmt) for month in months)
+
+    def sources(self, stmt, date_from=None, date_to=None, order="id", after=None):
+        """
+        Arsip yang bisa berisi baris setelah cursor, sebagai list (first, open):
+        first = key terawal yang mungkin ada di arsip itu menurut urutan halaman,
+        open() = iterator baris stmt di arsip itu (belum dieksekusi).
+        order "id"  : key id naik, after = id cursor
+        order "time": key (created_at, id) turun, after = (created_at, id) cursor
+        """
+        sources = []
+        for month in self.months_in_range(date_from, date_to):
+            meta = self.meta(month)
+            if meta is None:
+                continue
+            if order == "id":
+                first = meta["min_id"]
+                if after is not None:
+                    if meta["max_id"] <= after:
+                        continue
+                    first = max(first, after)
+            else:
+                first = (meta["max_created_at"], meta["max_id"])
+                if after is not None:
+                    if (meta["min_created_at"], meta["min_id"]) >= after:
+                        continue
+                    first = min(first, after)
+            sources.append((first, lambda month=month: self._month_rows(month, stmt)))
+        return sources
+
+    def _month_rows(self, month, stmt):
+        with self.engine(month).connect() as conn:
+            yield from conn.execution_options(stream_results=True).execute(stmt)
+
+    def _forget(self, month):
+        """Buang engine + salinan dekompres lama setelah file arsip diganti"""
+        with self._lock:
+            self._meta.pop(month, None)
+            engine = self._engines.pop(month, None)
+            if engine is not None:
+                engine.dispose()
+            cached = os.path.join(self.cache_dir, f"transactions_{_suffix(month)}.db")
+            if os.path.exists(cached):
+                os.remove(cached)
+
+    # ------------------------------
+    # WRITE (arsip satu bulan)
+    # ------------------------------
+    def archive_month(self, month, batch_size=5000):
+        """
+        Pindahkan transaksi satu bulan dari tabel hot ke arsip terkompresi.
+        Kalau arsip bulan itu sudah ada (run sebelumnya / baris telat), baris
+        hot digabung ke arsip lama. Return jumlah baris baru di arsip.
+        """
+        start, end = month, next_month(month)
+        in_month = (Transaction.created_at >= start) & (Transaction.created_at < end)
+        os.makedirs(self.directory, exist_ok=True)
+
+        raw = os.path.join(self.directory, f"transactions_{_suffix(month)}.db.tmp")
+        if os.path.exists(raw):
+            os.remove(raw)
+        table = Transaction.__table__
+        if os.path.exists(self.path(month)):
+            with gzip.open(self.path(month), "rb") as src, open(raw, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            target = create_engine(f"sqlite:///{raw}")
+            add_missing_columns(target)
+        else:
+            target = create_engine(f"sqlite:///{raw}")
+            table.create(target)
+
+        archived = 0
+        rows = db.session.execute(
+            select(table).where(in_month).order_by(table.c.id)
+            .execution_options(stream_results=True, yield_per=batch_size)
+        ).mappings()
+        copy = insert(table).prefix_with("OR IGNORE")
+        with target.begin() as conn:
+            batch = []
+            for row in rows:
+                batch.append(dict(row))
+                if len(batch) >= batch_size:
+                    archived += conn.execute(copy, batch).rowcount
+                    batch.clear()
+            if batch:
+                archived += conn.execute(copy, batch).rowcount
+        with target.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+        target.dispose()
+
+        tmp_gz = self.path(month) + ".tmp"
+        with open(raw, "rb") as src, gzip.open(tmp_gz, "wb", compresslevel=9) as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_gz, self.path(month))
+        os.remove(raw)
+        self._forget(month)
+        self._write_meta(month)
+
+        self.drop_archived(month, in_month, batch_size)
+        return archived
+
+    def drop_archived(self, month, in_month, batch_size=5000):
+        """Hapus dari tabel hot hanya baris yang id-nya terbukti ada di arsip"""
+        table = Transaction.__table__
+        after = 0
+        with self.engine(month).connect() as archive:
+            while True:
+                ids = db.session.execute(
+                    select(Transaction.id).where(in_month, Transaction.id > after)
+                    .order_by(Transaction.id).limit(batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                after = ids[-1]
+                copied = archive.execute(select(table.c.id).where(table.c.id.in_(ids))).scalars().all()
+                if copied:
+                    db.session.execute(delete(Transaction).where(Transaction.id.in_(copied)))
+                    db.session.commit()
+
+
+def closed_months(keep_months, today=None):
+    """Bulan di tabel hot yang lebih tua dari `keep_months` bulan terakhir"""
+    cutoff = month_start(today or date.today())
+    for _ in range(keep_months):
+        cutoff = datetime(cutoff.year - (cutoff.month == 1), (cutoff.month - 2) % 12 + 1, 1)
+
+    oldest = db.session.execute(
+        select(Transaction.created_at).where(Transaction.created_at < cutoff)
+        .order_by(Transaction.created_at).limit(1)
+    ).scalar_one_or_none()
+    if oldest is None:
+        return []
+    return [
+        month for month in iter_months(oldest, cutoff)
+        if db.session.execute(
+            select(Transaction.id).where(
+                Transaction.created_at >= month, Transaction.created_at < next_month(month)
+            ).limit(1)
+        ).first() is not None
+    ]
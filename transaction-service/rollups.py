@@ -0,0 +1,196 @@
+from datetime import date, datetime
+
+from sqlalchemy import cast, delete, func, select
+
+from models import db, Transaction, DailyRollup
+
+
+# ============================================================
+#                 DAILY ROLLUPS
+# ============================================================
+# Diupdate di commit yang sama dengan transaksinya (upsert), sehingga
+# laporan cukup membaca O(hari) baris, bukan O(transaksi).
+
+ROLLUP_COLUMNS = ["user_id", "day", "wallet_id", "type", "count", "total", "min_amount", "max_amount"]
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _upsert_stmt():
+    dialect = _dialect()
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        least, greatest = func.min, func.max
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        least, greatest = func.least, func.greatest
+    else:
+        return None
+
+    stmt = insert(DailyRollup)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "wallet_id", "type"],
+        set_={
+            "count": DailyRollup.count + stmt.excluded["count"],
+            "total": DailyRollup.total + stmt.excluded.total,
+            "min_amount": least(DailyRollup.min_amount, stmt.excluded.min_amount),
+            "max_amount": greatest(DailyRollup.max_amount, stmt.excluded.max_amount),
+        },
+    )
+
+
+def _aggregate(transactions):
+    groups = {}
+    for t in transactions:
+        if t.status != "SUCCESS":
+            continue
+        day = (t.created_at or datetime.utcnow()).date()
+        key = (t.user_id, day, t.wallet_id, t.type)
+        g = groups.get(key)
+        if g is None:
+            groups[key] = [1, t.amount, t.amount, t.amount]
+        else:
+            g[0] += 1
+            g[1] += t.amount
+            g[2] = min(g[2], t.amount)
+            g[3] = max(g[3], t.amount)
+
+    return [
+        {
+            "user_id": user_id, "day": day, "wallet_id": wallet_id, "type": trx_type,
+            "count": count, "total": total, "min_amount": lo, "max_amount": hi,
+        }
+        for (user_id, day, wallet_id, trx_type), (count, total, lo, hi) in groups.items()
+    ]
+
+
+def record_rollups(transactions):
+    """Tambahkan transaksi (sudah di-flush) ke rollup harian, tanpa commit"""
+    _add_rows(_aggregate(transactions))
+
+
+def _add_rows(rows):
+    if not rows:
+        return
+
+    stmt = _upsert_stmt()
+    if stmt is not None:
+        db.session.execute(stmt, rows)
+        return
+
+    # Fallback generik: UPDATE lalu INSERT kalau belum ada
+    for row in rows:
+        rollup = db.session.execute(
+            select(DailyRollup).where(
+                DailyRollup.user_id == row["user_id"],
+                DailyRollup.day == row["day"],
+                DailyRollup.wallet_id == row["wallet_id"],
+                DailyRollup.type == row["type"],
+            ).with_for_update()
+        ).scalar_one_or_none()
+        if rollup is None:
+            db.session.add(DailyRollup(**row))
+        else:
+            rollup.count += row["count"]
+            rollup.total += row["total"]
+            rollup.min_amount = min(rollup.min_amount, row["min_amount"])
+            rollup.max_amount = max(rollup.max_amount, row["max_amount"])
+
+
+def _rollup_source(dialect):
+    if dialect == "sqlite":
+        day = func.date(Transaction.created_at)
+    else:
+        day = cast(Transaction.created_at, db.Date)
+
+    return (
+        select(
+            Transaction.user_id,
+            day,
+            Transaction.wallet_id,
+            Transaction.type,
+            func.count(Transaction.id),
+            func.sum(Transaction.amount),
+            func.min(Transaction.amount),
+            func.max(Transaction.amount),
+        )
+        .where(Transaction.status == "SUCCESS")
+        .group_by(Transaction.user_id, day, Transaction.wallet_id, Transaction.type)
+    )
+
+
+def rebuild_rollups(archive=None):
+    """
+    Hitung ulang semua rollup dari tabel transactions (satu INSERT ... SELECT),
+    lalu tambahkan bulan-bulan di arsip (ArchiveStore, file SQLite) per bulan.
+    """
+    db.session.execute(delete(DailyRollup))
+    db.session.execute(
+        DailyRollup.__table__.insert().from_select(
+            ROLLUP_COLUMNS,
+            _rollup_source(_dialect()),
+        )
+    )
+    if archive is None:
+        return
+
+    rows = []
+    for row in archive.iter_rows(_rollup_source("sqlite")):
+        values = dict(zip(ROLLUP_COLUMNS, row))
+        values["day"] = date.fromisoformat(values["day"])
+        rows.append(values)
+        if len(rows) >= 5000:
+            _add_rows(rows)
+            rows = []
+    _add_rows(rows)
+
+
+def report(user_id=None, wallet_id=None, trx_type=None, date_from=None, date_to=None, period="day"):
+    """
+    Ringkasan dari rollup. period: day, month, atau all.
+    date_from / date_to inklusif (tanggal).
+    """
+    query = select(
+        DailyRollup.day,
+        DailyRollup.type,
+        func.sum(DailyRollup.count),
+        func.sum(DailyRollup.total),
+        func.min(DailyRollup.min_amount),
+        func.max(DailyRollup.max_amount),
+    )
+    if user_id is not None:
+        query = query.where(DailyRollup.user_id == user_id)
+    if wallet_id is not None:
+        query = query.where(DailyRollup.wallet_id == wallet_id)
+    if trx_type:
+        query = query.where(DailyRollup.type == trx_type.upper())
+    if date_from:
+        query = query.where(DailyRollup.day >= date_from)
+    if date_to:
+        query = query.where(DailyRollup.day <= date_to)
+    query = query.group_by(DailyRollup.day, DailyRollup.type).order_by(DailyRollup.day, DailyRollup.type)
+
+    buckets = {}
+    for day, trx_type, count, total, lo, hi in db.session.execute(query):
+        if period == "month":
+            label = day.strftime("%Y-%m")
+        elif period == "all":
+            label = "all"
+        else:
+            label = day.isoformat()
+
+        b = buckets.get((label, trx_type))
+        if b is None:
+            buckets[(label, trx_type)] = [count, total, lo, hi]
+        else:
+            b[0] += count
+            b[1] += total
+            b[2] = min(b[2], lo)
+            b[3] = max(b[3], hi)
+
+    return [
+        {"period": label, "type": trx_type, "count": count, "total": total,
+         "min_amount": lo, "max_amount": hi}
+        for (label, trx_type), (count, total, lo, hi) in buckets.items()
+    ]
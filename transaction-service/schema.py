@@ -0,0 +1,165 @@
+from sqlalchemy import Integer, MetaData, cast, func, inspect, text, update
+
+from models import db, Transaction
+
+
+# ============================
+#   COLUMN MIGRATION
+# ============================
+# db.create_all() hanya membuat tabel baru; kolom yang ditambahkan ke model
+# belakangan tidak muncul di tabel lama (mis. instance/*.db yang sudah ada),
+# dan semua query ke model itu gagal "no such column". Kolom yang hilang
+# ditambahkan dengan ALTER TABLE ... ADD COLUMN (nullable / pakai server_default).
+
+def missing_columns(engine=None):
+    """Return list Column yang ada di model tapi belum ada di database"""
+    inspector = inspect(engine or db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        missing.extend(c for c in table.columns if c.name not in existing)
+    return missing
+
+
+def add_missing_columns(engine=None):
+    """ALTER TABLE untuk setiap kolom yang hilang; return list nama tabel.kolom"""
+    engine = engine or db.engine
+    dialect = engine.dialect
+    added = []
+    with engine.begin() as conn:
+        for column in missing_columns(engine):
+            ddl = f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column.type.compile(dialect)}"
+            if column.server_default is not None:
+                default = column.server_default.arg
+                default = default.text if hasattr(default, "text") else "'" + default.replace("'", "''") + "'"
+                ddl += f" DEFAULT {default}"
+            if not column.nullable and column.server_default is not None:
+                ddl += " NOT NULL"
+            conn.execute(text(ddl))
+            added.append(f"{column.table.name}.{column.name}")
+    return added
+
+
+# ============================
+#   INDEX CHECK
+# ============================
+# db.create_all() tidak menambah index ke tabel yang sudah ada,
+# jadi DB lama bisa jalan tanpa index yang didefinisikan di models.py.
+
+def missing_indexes():
+    """Return list Index yang ada di model tapi belum ada di database"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        missing.extend(ix for ix in table.indexes if ix.name not in existing)
+    return missing
+
+
+def report_missing_indexes(create=False):
+    """Print index yang hilang; kalau create=True sekalian dibuat"""
+    missing = missing_indexes()
+    for index in missing:
+        columns = ", ".join(c.name for c in index.columns)
+        if create:
+            index.create(db.engine)
+            print(f"Created missing index {index.name} on {index.table.name} ({columns})")
+        else:
+            print(f"WARNING: missing index {index.name} on {index.table.name} ({columns}), run `flask create-db`")
+    return missing
+
+
+# ============================
+#   TRANSFER COUNTERPARTY BACKFILL
+# ============================
+# counterparty_wallet_id baru ada sejak kolomnya ditambahkan; leg transfer lama
+# hanya menyimpan lawannya di description ("Transfer to wallet N" /
+# "Transfer from wallet N"). Diisi sekali, saat kolom baru ditambahkan.
+
+_TRANSFER_DESCRIPTIONS = (
+    ("TRANSFER", "Transfer to wallet "),
+    ("TRANSFER_IN", "Transfer from wallet "),
+)
+
+
+def backfill_counterparty_wallets():
+    """Isi counterparty_wallet_id leg transfer lama dari description; return jumlah baris"""
+    total = 0
+    with db.engine.begin() as conn:
+        for trx_type, prefix in _TRANSFER_DESCRIPTIONS:
+            total += conn.execute(
+                update(Transaction)
+                .where(
+                    Transaction.type == trx_type,
+                    Transaction.counterparty_wallet_id.is_(None),
+                    Transaction.description.like(prefix + "%"),
+                )
+                .values(counterparty_wallet_id=cast(
+                    func.substr(Transaction.description, len(prefix) + 1), Integer
+                ))
+            ).rowcount
+    return total
+
+
+# ============================
+#   TRANSACTION ID HIGH-WATER MARK
+# ============================
+# Tanpa AUTOINCREMENT SQLite memberi id = max(id) + 1, jadi id baris yang sudah
+# diarsip (dan dihapus dari tabel hot) bisa dipakai lagi oleh transaksi baru:
+# archive_month() melewatinya (INSERT OR IGNORE), drop_archived() menghapusnya,
+# dan merge hot + arsip mengembalikan dua baris dengan id sama.
+# Tabel lama dibangun ulang dengan AUTOINCREMENT, lalu sqlite_sequence dinaikkan
+# ke id terbesar di tabel hot maupun arsip.
+
+def ensure_autoincrement(high_water=0):
+    """Pastikan transactions.id AUTOINCREMENT dan tidak di bawah high_water; return True kalau tabel dibangun ulang"""
+    engine = db.engine
+    if engine.dialect.name != "sqlite":
+        return False
+
+    table = Transaction.__table__
+    rebuilt = False
+    with engine.begin() as conn:
+        sql = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": table.name},
+        ).scalar()
+        if sql is None:
+            return False
+
+        if "AUTOINCREMENT" not in sql.upper():
+            existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+            indexes = conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"
+            ), {"name": table.name}).scalars().all()
+            for index in indexes:
+                conn.execute(text(f'DROP INDEX "{index}"'))
+
+            rebuild = table.to_metadata(MetaData(), name=f"{table.name}_rebuild")
+            rebuild.create(conn)
+            columns = ", ".join(c.name for c in table.columns if c.name in existing)
+            conn.execute(text(f"INSERT INTO {rebuild.name} ({columns}) SELECT {columns} FROM {table.name}"))
+            conn.execute(text(f"DROP TABLE {table.name}"))
+            conn.execute(text(f"ALTER TABLE {rebuild.name} RENAME TO {table.name}"))
+            rebuilt = True
+
+        hot_max = conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table.name}")).scalar()
+        high_water = max(high_water, hot_max)
+        seq = conn.execute(
+            text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {"name": table.name}
+        ).scalar()
+        if seq is None:
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                         {"name": table.name, "seq": high_water})
+        elif seq < high_water:
+            conn.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :name"),
+                         {"name": table.name, "seq": high_water})
+    return rebuilt
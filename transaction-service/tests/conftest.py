@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Config dibaca saat import: DATABASE_URL & direktori data harus di-set sebelum app di-import
+_tmpdir = tempfile.mkdtemp(prefix="transaction-service-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'transaction.db')}"
+os.environ["TRANSACTION_ARCHIVE_DIR"] = os.path.join(_tmpdir, "archive")
+os.environ["ANALYTICS_DIR"] = os.path.join(_tmpdir, "columnar")
+os.environ["WALLET_CLIENT"] = "local"
+os.environ["OUTBOX_DISPATCHER_ENABLED"] = "false"
+os.environ["GROUP_COMMIT_ENABLED"] = "false"
+os.environ["VELOCITY_ENABLED"] = "false"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app, wallet_client, transaction_writer, idempotency  # noqa: E402
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config["TESTING"] = True
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        wallet_client._wallets.clear()
+        wallet_client._applied.clear()
+        idempotency.bloom = None
+        idempotency._loading = None
+        idempotency._recent.clear()
+        transaction_writer.enabled = False
+        yield flask_app
+        transaction_writer.enabled = False
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def wallets(app):
+    """LocalWalletClient yang dipakai app (in-memory, tanpa wallet-service)"""
+    return wallet_client
+
+
+@pytest.fixture
+def writer(app):
+    return transaction_writer
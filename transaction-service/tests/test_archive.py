@@ -0,0 +1,162 @@
+import shutil
+from datetime import datetime
+
+import pytest
+from sqlalchemy import MetaData, text
+
+from app import archive_store
+from models import db, Transaction
+from schema import ensure_autoincrement
+
+
+@pytest.fixture
+def archive(app):
+    """ArchiveStore app dengan direktori kosong per test"""
+    yield archive_store
+    for month in list(archive_store._engines):
+        archive_store._forget(month)
+    archive_store._meta.clear()
+    shutil.rmtree(archive_store.directory, ignore_errors=True)
+
+
+@pytest.fixture
+def opened(archive, monkeypatch):
+    """Bulan arsip yang benar-benar dibaca (_month_rows dipanggil)"""
+    months = []
+    month_rows = archive._month_rows
+
+    def spy(month, stmt):
+        months.append(month)
+        return month_rows(month, stmt)
+
+    monkeypatch.setattr(archive, "_month_rows", spy)
+    return months
+
+
+def add_transactions(*created_at, user_id=1):
+    """Simpan transaksi per timestamp, return list id"""
+    rows = [
+        Transaction(wallet_id=10, user_id=user_id, type="TOPUP", amount=1.0, status="SUCCESS", created_at=ts)
+        for ts in created_at
+    ]
+    db.session.add_all(rows)
+    db.session.flush()
+    ids = [row.id for row in rows]
+    db.session.commit()
+    return ids
+
+
+def list_ids(client, **params):
+    resp = client.get("/transactions/", query_string=params)
+    assert resp.status_code == 200
+    return [item["id"] for item in resp.get_json()["items"]], resp.get_json()["next_cursor"]
+
+
+def test_archive_moves_month_and_writes_meta(client, archive):
+    january = add_transactions(datetime(2026, 1, 5), datetime(2026, 1, 20))
+    add_transactions(datetime(2026, 2, 3))
+
+    assert archive.archive_month(datetime(2026, 1, 1)) == 2
+
+    assert Transaction.query.filter(Transaction.id.in_(january)).count() == 0
+    meta = archive.meta(datetime(2026, 1, 1))
+    assert (meta["min_id"], meta["max_id"]) == (january[0], january[-1])
+    assert meta["max_created_at"] == datetime(2026, 1, 20)
+
+
+def test_ids_not_reused_after_archiving(client, archive):
+    archived = add_transactions(datetime(2026, 1, 5), datetime(2026, 1, 6))
+    archive.archive_month(datetime(2026, 1, 1))
+    assert Transaction.query.count() == 0
+
+    fresh = add_transactions(datetime(2026, 2, 1))
+    assert fresh[0] > archived[-1]
+
+    ids, _ = list_ids(client)
+    assert ids == archived + fresh
+
+
+def test_id_pages_merge_archive_and_hot_without_duplicates(client, archive):
+    january = add_transactions(*(datetime(2026, 1, day) for day in range(1, 6)))
+    february = add_transactions(*(datetime(2026, 2, day) for day in range(1, 4)))
+    archive.archive_month(datetime(2026, 1, 1))
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3}
+        if cursor is not None:
+            params["after"] = cursor
+        ids, cursor = list_ids(client, **params)
+        seen.extend(ids)
+        if cursor is None:
+            break
+    assert seen == january + february
+
+
+def test_id_cursor_past_archive_skips_it(client, archive, opened):
+    january = add_transactions(datetime(2026, 1, 1), datetime(2026, 1, 2))
+    february = add_transactions(datetime(2026, 2, 1), datetime(2026, 2, 2))
+    archive.archive_month(datetime(2026, 1, 1))
+    opened.clear()
+
+    ids, _ = list_ids(client, after=january[-1])
+
+    assert ids == february
+    assert opened == []
+
+
+def test_ndjson_stream_includes_archive(client, archive):
+    january = add_transactions(datetime(2026, 1, 1))
+    february = add_transactions(datetime(2026, 2, 1))
+    archive.archive_month(datetime(2026, 1, 1))
+
+    resp = client.get("/transactions/", query_string={"format": "ndjson"})
+    lines = [line for line in resp.get_data(as_text=True).splitlines() if line]
+    assert [int(line.split('"id": ')[1].split(",")[0]) for line in lines] == january + february
+
+
+def test_history_page_filled_from_hot_does_not_open_archive(client, archive, opened):
+    january = add_transactions(datetime(2026, 1, 10), datetime(2026, 1, 20))
+    february = add_transactions(*(datetime(2026, 2, day) for day in range(1, 4)))
+    archive.archive_month(datetime(2026, 1, 1))
+    opened.clear()
+
+    resp = client.get("/transactions/users/1/history", query_string={"limit": 2})
+    page = resp.get_json()
+    assert [item["id"] for item in page["items"]] == february[::-1][:2]
+    assert opened == []
+
+    resp = client.get("/transactions/users/1/history", query_string={"limit": 2, "before": page["next_cursor"]})
+    page = resp.get_json()
+    assert [item["id"] for item in page["items"]] == [february[0], january[-1]]
+    assert opened == [datetime(2026, 1, 1)]
+
+    resp = client.get("/transactions/users/1/history", query_string={"limit": 2, "before": page["next_cursor"]})
+    assert [item["id"] for item in resp.get_json()["items"]] == [january[0]]
+
+
+def test_time_sources_skip_months_newer_than_cursor(archive):
+    add_transactions(datetime(2026, 1, 10))
+    add_transactions(datetime(2026, 2, 10))
+    archive.archive_month(datetime(2026, 1, 1))
+    archive.archive_month(datetime(2026, 2, 1))
+
+    stmt = Transaction.query.statement
+    assert len(archive.sources(stmt, order="time")) == 2
+    assert len(archive.sources(stmt, order="time", after=(datetime(2026, 1, 31), 10 ** 6))) == 1
+
+
+def test_ensure_autoincrement_rebuilds_legacy_table(app):
+    db.drop_all()
+    legacy = Transaction.__table__.to_metadata(MetaData())
+    legacy.dialect_options["sqlite"]["autoincrement"] = False
+    legacy.create(db.engine)
+    existing = add_transactions(datetime(2026, 3, 1))
+
+    assert ensure_autoincrement(high_water=50) is True
+    assert ensure_autoincrement(high_water=50) is False
+
+    sql = db.session.execute(text("SELECT sql FROM sqlite_master WHERE name = 'transactions'")).scalar()
+    assert "AUTOINCREMENT" in sql.upper()
+    assert Transaction.query.get(existing[0]) is not None
+    assert add_transactions(datetime(2026, 3, 2)) == [51]
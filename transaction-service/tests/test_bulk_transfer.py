@@ -0,0 +1,80 @@
+from bulk_transfer import create_job, json_rows, reserve_funds, run_job
+from models import db, BulkTransferItem, BulkTransferJob, LedgerEntry
+
+
+def _job(source, transfers, **kwargs):
+    return create_job(source, json_rows(transfers, source), **kwargs).id
+
+
+def _clearing_balance(job_id):
+    entries = LedgerEntry.query.filter_by(account=f"CLEARING:BULK:{job_id}").all()
+    return round(sum(e.amount if e.direction == "CREDIT" else -e.amount for e in entries), 2)
+
+
+def _items(job_id):
+    db.session.expire_all()
+    return {
+        item.row_number: (item.status, item.error)
+        for item in BulkTransferItem.query.filter_by(job_id=job_id)
+    }
+
+
+def test_job_pays_destinations_and_refunds_the_rest(writer, wallets):
+    wallets.add_wallet(1, 101, balance=100.0)
+    wallets.add_wallet(2, 102)
+    wallets.add_wallet(3, 103)
+    job_id = _job(1, [
+        {"to_wallet_id": 2, "amount": 30},
+        {"to_wallet_id": 99, "amount": 20},
+        {"to_wallet_id": 3, "amount": 10},
+        {"to_wallet_id": 2, "amount": -5},
+    ])
+
+    run_job(writer, job_id, chunk_size=2)
+
+    job = db.session.get(BulkTransferJob, job_id)
+    assert (job.status, job.succeeded, job.failed, job.refunded_amount) == ("COMPLETED", 2, 2, 20.0)
+    assert [wallets.get_wallet(i)["balance"] for i in (1, 2, 3)] == [60.0, 30.0, 10.0]
+    assert _items(job_id) == {
+        1: ("SUCCESS", None),
+        2: ("FAILED", "Destination wallet not found"),
+        3: ("SUCCESS", None),
+        4: ("FAILED", "Amount must be positive"),
+    }
+    # Reserve, kredit dan refund saling menutup di akun clearing
+    assert _clearing_balance(job_id) == 0
+
+
+def test_reserve_fails_job_when_source_is_short(writer, wallets):
+    wallets.add_wallet(1, 101, balance=10.0)
+    wallets.add_wallet(2, 102)
+    job_id = _job(1, [{"to_wallet_id": 2, "amount": 30}])
+
+    run_job(writer, job_id)
+
+    job = db.session.get(BulkTransferJob, job_id)
+    assert (job.status, job.failed) == ("FAILED", 1)
+    assert _items(job_id) == {1: ("FAILED", "Insufficient balance in source wallet")}
+    assert [wallets.get_wallet(i)["balance"] for i in (1, 2)] == [10.0, 0.0]
+
+
+def test_resume_does_not_debit_or_credit_twice(writer, wallets):
+    wallets.add_wallet(1, 101, balance=100.0)
+    wallets.add_wallet(2, 102)
+    job_id = _job(1, [{"to_wallet_id": 2, "amount": 40}])
+    item_id = BulkTransferItem.query.filter_by(job_id=job_id).one().id
+
+    # Crash setelah reserve dan setelah kredit sampai di wallet-service,
+    # sebelum item ter-commit lokal
+    assert reserve_funds(writer, job_id)
+    wallets.apply([[(2, 40.0)]], ids=[f"bulk:{job_id}:{item_id}"])
+    job = db.session.get(BulkTransferJob, job_id)
+    job.status = "PAUSED"
+    db.session.commit()
+
+    run_job(writer, job_id)
+
+    job = db.session.get(BulkTransferJob, job_id)
+    assert (job.status, job.succeeded, job.refunded_amount) == ("COMPLETED", 1, 0.0)
+    assert [wallets.get_wallet(i)["balance"] for i in (1, 2)] == [60.0, 40.0]
+    assert _clearing_balance(job_id) == 0
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from coalesce import CoalescingLookup
+
+
+class _Fetch:
+    """fetch(ids) yang mencatat batch; batch pertama bisa ditahan lewat `release`"""
+
+    def __init__(self, hold_first=False):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold_first:
+            self.release.set()
+
+    def __call__(self, ids):
+        self.calls.append(list(ids))
+        if len(self.calls) == 1:
+            self.started.set()
+            self.release.wait(5)
+        return {i: {"id": i} for i in ids if i != 404}
+
+
+def _get_in_thread(lookup, key, results):
+    thread = threading.Thread(target=lambda: results.setdefault(key, lookup.get(key)))
+    thread.start()
+    return thread
+
+
+def test_concurrent_gets_share_one_fetch():
+    fetch = _Fetch()
+    lookup = CoalescingLookup(fetch, coalesce_window=0.2)
+    results = {}
+
+    threads = [_get_in_thread(lookup, key, results) for key in (1, 2, 3, 2)]
+    for thread in threads:
+        thread.join()
+
+    assert fetch.calls == [[1, 2, 3]]
+    assert results == {1: {"id": 1}, 2: {"id": 2}, 3: {"id": 3}}
+
+
+def test_leader_only_resolves_its_own_batch():
+    fetch = _Fetch(hold_first=True)
+    lookup = CoalescingLookup(fetch)
+    results = {}
+
+    first = _get_in_thread(lookup, 1, results)
+    assert fetch.started.wait(5)
+
+    # Batch pertama masih jalan: lookup baru dipimpin thread-nya sendiri
+    second = _get_in_thread(lookup, 2, results)
+    second.join(5)
+    assert not second.is_alive()
+    assert results == {2: {"id": 2}}
+
+    fetch.release.set()
+    first.join(5)
+    assert fetch.calls == [[1], [2]]
+    assert results[1] == {"id": 1}
+
+
+def test_cache_and_misses():
+    fetch = _Fetch()
+    lookup = CoalescingLookup(fetch)
+
+    assert lookup.get_many([1, 404]) == {1: {"id": 1}}
+    assert lookup.get(1) == {"id": 1}
+    assert lookup.get(404) is None
+    assert fetch.calls == [[1, 404], [404]]
+
+    lookup.invalidate(1)
+    lookup.get(1)
+    assert fetch.calls[-1] == [1]
+
+
+def test_fetch_error_reaches_every_waiter():
+    def fetch(ids):
+        raise RuntimeError("down")
+
+    lookup = CoalescingLookup(fetch)
+    with pytest.raises(RuntimeError, match="down"):
+        lookup.get(1)
+    assert lookup._inflight == {}
@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db, Transaction, LedgerEntry
+
+
+def _topup(writer, wallet_id, amount, **kwargs):
+    return writer.submit(
+        [dict(wallet_id=wallet_id, user_id=100 + wallet_id, type="TOPUP", amount=amount, status="SUCCESS")],
+        [(wallet_id, amount)],
+        **kwargs
+    )
+
+
+class _CountingApply:
+    """Bungkus wallets.apply untuk menghitung round-trip ke wallet-service"""
+
+    def __init__(self, wallets):
+        self.wallets = wallets
+        self.real = wallets.apply
+        self.calls = []
+
+    def __call__(self, groups, ids=None):
+        self.calls.append(list(ids or []))
+        return self.real(groups, ids=ids)
+
+
+def test_sync_write_records_transaction_and_ledger(writer, wallets):
+    wallets.add_wallet(1, 101, balance=10.0)
+
+    result = _topup(writer, 1, 25.0)
+
+    assert result.balances == {1: 35.0}
+    assert wallets.get_wallet(1)["balance"] == 35.0
+    trx = Transaction.query.one()
+    assert trx.write_id is not None
+    entries = {e.account: (e.direction, e.amount) for e in LedgerEntry.query.all()}
+    assert entries == {"WALLET:1": ("CREDIT", 25.0), "EXTERNAL:TOPUP": ("DEBIT", 25.0)}
+
+
+def test_group_commit_batches_concurrent_writes(app, writer, wallets, monkeypatch):
+    wallets.add_wallet(1, 101)
+    spy = _CountingApply(wallets)
+    monkeypatch.setattr(wallets, "apply", spy)
+    monkeypatch.setattr(writer, "max_delay", 0.05)
+    writer.enabled = True
+
+    errors = []
+
+    def worker():
+        with app.app_context():
+            try:
+                _topup(writer, 1, 1.0)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert wallets.get_wallet(1)["balance"] == 20.0
+    assert sum(len(ids) for ids in spy.calls) == 20
+    assert len(spy.calls) < 20
+    db.session.expire_all()
+    assert Transaction.query.count() == 20
+
+
+def test_retry_replays_same_write_id(writer, wallets, monkeypatch):
+    wallets.add_wallet(1, 101)
+    spy = _CountingApply(wallets)
+    monkeypatch.setattr(wallets, "apply", spy)
+    monkeypatch.setattr(writer, "retry_backoff", 0)
+
+    real_commit = db.session.commit
+    failures = iter([OperationalError("COMMIT", {}, Exception("database is locked"))])
+
+    def commit():
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        real_commit()
+
+    monkeypatch.setattr(db.session, "commit", commit)
+    _topup(writer, 1, 5.0)
+
+    # Dua round-trip dengan apply_id yang sama, saldo hanya bertambah sekali
+    assert len(spy.calls) == 2
+    assert spy.calls[0] == spy.calls[1]
+    assert wallets.get_wallet(1)["balance"] == 5.0
+    assert Transaction.query.count() == 1
+
+
+def test_failed_commit_cancels_wallet_apply(writer, wallets, monkeypatch):
+    wallets.add_wallet(1, 101, balance=50.0)
+
+    def commit():
+        raise OperationalError("COMMIT", {}, Exception("disk I/O error"))
+
+    with monkeypatch.context() as m:
+        m.setattr(db.session, "commit", commit)
+        with pytest.raises(OperationalError):
+            _topup(writer, 1, 5.0, write_id="w-1")
+
+    assert wallets.get_wallet(1)["balance"] == 50.0
+    assert wallets._applied["w-1"][0] == "REVERSED"
+    assert writer.write_status("w-1")["status"] == "FAILED"
+
+
+def test_insufficient_balance_is_reported_per_item(writer, wallets):
+    from wallet_client import InsufficientBalance
+
+    wallets.add_wallet(1, 101, balance=5.0)
+
+    with pytest.raises(InsufficientBalance):
+        writer.submit(
+            [dict(wallet_id=1, user_id=101, type="PAYMENT", amount=10.0, status="SUCCESS")],
+            [(1, -10.0)]
+        )
+
+    assert wallets.get_wallet(1)["balance"] == 5.0
+    assert Transaction.query.count() == 0
@@ -0,0 +1,151 @@
+import threading
+from datetime import datetime, timedelta
+
+from idempotency import BloomFilter
+from models import db, Transaction, IdempotentResponse
+
+
+def _topup(client, key, amount=10.0, wallet_id=1, user_id="101"):
+    headers = {"Idempotency-Key": key}
+    if user_id is not None:
+        headers["X-User-Id"] = user_id
+    return client.post("/transactions/topup", json={"wallet_id": wallet_id, "amount": amount}, headers=headers)
+
+
+def test_retry_with_same_key_replays_response(client, wallets):
+    wallets.add_wallet(1, 101, balance=100.0)
+
+    first = _topup(client, "abc")
+    second = _topup(client, "abc")
+
+    assert first.status_code == second.status_code == 200
+    assert second.get_json() == first.get_json()
+    assert second.headers.get("Idempotent-Replayed") == "true"
+    assert wallets.get_wallet(1)["balance"] == 110.0
+    assert Transaction.query.count() == 1
+
+
+def test_same_key_with_different_body_is_rejected(client, wallets):
+    wallets.add_wallet(1, 101, balance=100.0)
+
+    assert _topup(client, "abc", amount=10.0).status_code == 200
+    response = _topup(client, "abc", amount=20.0)
+
+    assert response.status_code == 422
+    assert wallets.get_wallet(1)["balance"] == 110.0
+
+
+def test_keys_are_scoped_per_user(client, wallets):
+    wallets.add_wallet(1, 101, balance=100.0)
+
+    assert _topup(client, "abc", user_id="101").status_code == 200
+    response = _topup(client, "abc", user_id="102")
+
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+    assert wallets.get_wallet(1)["balance"] == 120.0
+    assert {r.key for r in IdempotentResponse.query.all()} == {"u101:abc", "u102:abc"}
+
+
+def test_replay_survives_lost_in_process_cache(client, wallets):
+    from app import idempotency
+
+    wallets.add_wallet(1, 101, balance=100.0)
+    assert _topup(client, "abc").status_code == 200
+
+    # Proses baru: bloom filter diisi ulang dari DB, LRU kosong
+    idempotency.bloom = None
+    idempotency._recent.clear()
+    response = _topup(client, "abc")
+
+    assert response.headers.get("Idempotent-Replayed") == "true"
+    assert wallets.get_wallet(1)["balance"] == 110.0
+
+
+def test_concurrent_duplicates_charge_once(app, wallets):
+    wallets.add_wallet(1, 101, balance=100.0)
+    statuses = []
+
+    def worker():
+        with app.app_context():
+            response = _topup(app.test_client(), "race")
+            statuses.append(response.status_code)
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert statuses == [200] * 8
+    assert wallets.get_wallet(1)["balance"] == 110.0
+    db.session.expire_all()
+    assert Transaction.query.count() == 1
+
+
+def test_lookup_goes_to_db_until_bloom_is_loaded(client, wallets):
+    from app import idempotency
+
+    wallets.add_wallet(1, 101, balance=100.0)
+    assert _topup(client, "abc").status_code == 200
+    idempotency._recent.clear()
+
+    before = idempotency.db_lookups
+    assert idempotency.lookup("u101:new") is None
+    assert idempotency.db_lookups == before + 1
+
+    idempotency.load()
+    assert idempotency.lookup("u101:new") is None
+    assert idempotency.db_lookups == before + 1
+    assert idempotency.lookup("u101:abc")[1] == 200
+
+
+def test_background_load_keeps_keys_remembered_meanwhile(app, monkeypatch):
+    import idempotency as idempotency_module
+    from app import idempotency
+
+    db.session.add(IdempotentResponse(key="u1:stored", status_code=200, body="{}"))
+    db.session.commit()
+
+    class RacingBloom(BloomFilter):
+        def add(self, key):
+            # Request lain selesai saat load() masih scan DB
+            if key == "u1:stored":
+                idempotency.remember("u1:during-load", ({}, 200, None))
+            super().add(key)
+
+    monkeypatch.setattr(idempotency_module, "BloomFilter", RacingBloom)
+    idempotency.start().join(5)
+
+    assert "u1:stored" in idempotency.bloom
+    assert "u1:during-load" in idempotency.bloom
+
+
+def test_prune_drops_keys_past_retention(client, wallets):
+    from app import idempotency
+
+    wallets.add_wallet(1, 101, balance=100.0)
+    assert _topup(client, "old").status_code == 200
+    assert _topup(client, "new").status_code == 200
+    old = db.session.get(IdempotentResponse, "u101:old")
+    old.created_at = datetime.utcnow() - timedelta(days=idempotency.retention_days + 1)
+    db.session.commit()
+
+    assert idempotency.prune() == 1
+    assert {r.key for r in IdempotentResponse.query.all()} == {"u101:new"}
+
+    # Key kedaluwarsa tidak ikut masuk bloom filter saat load
+    idempotency.load()
+    assert "u101:new" in idempotency.bloom
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"u{i}:key-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 500
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from ledger import backfill_opening_balances, balance_at, snapshot_all, take_snapshot
+from models import db, BalanceSnapshot, LedgerEntry, Transaction
+
+
+def _signed_total(**filters):
+    entries = LedgerEntry.query.filter_by(**filters).all()
+    return round(sum(e.amount if e.direction == "CREDIT" else -e.amount for e in entries), 2)
+
+
+def test_every_movement_is_balanced_double_entry(client, wallets):
+    wallets.add_wallet(1, 101, balance=0.0)
+    wallets.add_wallet(2, 102, balance=0.0)
+
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 100})
+    client.post("/transactions/transfer", json={"from_wallet_id": 1, "to_wallet_id": 2, "amount": 40})
+    client.post("/transactions/payment", json={"wallet_id": 2, "amount": 15})
+
+    assert _signed_total() == 0
+    assert _signed_total(account="WALLET:1") == balance_at(1) == 60.0
+    assert _signed_total(account="WALLET:2") == balance_at(2) == 25.0
+    legs = [t.id for t in Transaction.query.filter(Transaction.type.in_(("TRANSFER", "TRANSFER_IN")))]
+    transfer = LedgerEntry.query.filter(LedgerEntry.transaction_id.in_(legs)).order_by(LedgerEntry.id).all()
+    assert [(e.account, e.direction, e.amount) for e in transfer] == [
+        ("WALLET:1", "DEBIT", 40.0), ("WALLET:2", "CREDIT", 40.0),
+    ]
+
+
+def test_snapshot_plus_tail_matches_full_history(client, wallets):
+    wallets.add_wallet(1, 101, balance=0.0)
+    for amount in (10, 20, 30):
+        client.post("/transactions/topup", json={"wallet_id": 1, "amount": amount})
+
+    assert take_snapshot(1, min_tail=5) is None
+    snapshot = take_snapshot(1)
+    db.session.commit()
+    assert snapshot.balance == 60.0
+
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 5})
+    assert balance_at(1) == 65.0
+    assert snapshot_all(min_tail=2) == 0
+    assert snapshot_all(min_tail=1) == 1
+    db.session.commit()
+    assert db.session.query(func.max(BalanceSnapshot.balance)).scalar() == 65.0
+    assert balance_at(1) == 65.0
+
+
+def test_balance_at_point_in_time_ignores_later_snapshots(client, wallets):
+    wallets.add_wallet(1, 101, balance=0.0)
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 10})
+    middle = datetime.utcnow()
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 20})
+    take_snapshot(1)
+    db.session.commit()
+
+    assert balance_at(1, middle) == 10.0
+    assert balance_at(1, middle - timedelta(days=1)) == 0.0
+    response = client.get("/transactions/ledger/1/balance", query_string={"at": middle.isoformat()})
+    assert response.get_json()["balance"] == 10.0
+    assert client.get("/transactions/ledger/1/balance").get_json()["balance"] == 30.0
+
+
+def test_opening_balance_backfill_is_dated_first_and_runs_once(client, wallets):
+    wallets.add_wallet(1, 101, balance=0.0)
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 10})
+    first = LedgerEntry.query.filter_by(account="WALLET:1").one().created_at
+    # Saldo wallet-service yang sudah ada sebelum ledger dipakai
+    legacy = {"id": 1, "balance": 50.0, "created_at": (first + timedelta(days=1)).isoformat()}
+
+    assert backfill_opening_balances([legacy]) == 1
+    db.session.commit()
+    assert backfill_opening_balances([dict(legacy, balance=70.0)]) == 0
+
+    opening = LedgerEntry.query.filter_by(account="OPENING:1").one()
+    assert (opening.direction, opening.amount) == ("DEBIT", 40.0)
+    assert opening.created_at < first
+    assert balance_at(1) == 50.0
+    assert _signed_total() == 0
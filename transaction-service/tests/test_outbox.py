@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, OutboxEvent
+from outbox import OutboxDispatcher
+
+
+class RecordingSender:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def send(self, notifications):
+        if self.fail:
+            raise RuntimeError("notification-service down")
+        self.batches.append(notifications)
+
+
+@pytest.fixture
+def make_dispatcher(app):
+    def make(sender, **settings):
+        dispatcher = OutboxDispatcher(app, sender=sender)
+        for name, value in settings.items():
+            setattr(dispatcher, name, value)
+        return dispatcher
+    return make
+
+
+def _events():
+    db.session.expire_all()
+    return OutboxEvent.query.order_by(OutboxEvent.id).all()
+
+
+def test_event_is_written_with_the_transaction(client, wallets):
+    wallets.add_wallet(1, 101)
+
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 10})
+
+    [event] = _events()
+    assert (event.event_type, event.user_id, event.status) == ("transaction.created", 101, "PENDING")
+
+
+def test_drain_sends_with_stable_event_ids(client, wallets, make_dispatcher):
+    wallets.add_wallet(1, 101)
+    for _ in range(3):
+        client.post("/transactions/topup", json={"wallet_id": 1, "amount": 10})
+    sender = RecordingSender()
+
+    assert make_dispatcher(sender, batch_size=2).drain() == 3
+
+    sent = [n for batch in sender.batches for n in batch]
+    assert [len(batch) for batch in sender.batches] == [2, 1]
+    assert [n["event_id"] for n in sent] == [f"transaction:{e.id}" for e in _events()]
+    assert {e.status for e in _events()} == {"SENT"}
+
+
+def test_claimed_events_are_leased(client, wallets, make_dispatcher):
+    wallets.add_wallet(1, 101)
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 10})
+    dispatcher = make_dispatcher(RecordingSender())
+
+    events, lease = dispatcher._claim()
+    assert len(events) == 1
+    assert lease >= datetime.utcnow() + dispatcher.lease
+    assert dispatcher._claim() == ([], None)
+
+    # Dispatcher mati: setelah lease habis event diambil ulang (at-least-once)
+    OutboxEvent.query.update({"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    assert len(dispatcher._claim()[0]) == 1
+
+
+def test_claim_without_returning_only_takes_own_lease(client, wallets, make_dispatcher, monkeypatch):
+    wallets.add_wallet(1, 101)
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 10})
+    monkeypatch.setattr(db.engine.dialect, "update_returning", False)
+    dispatcher = make_dispatcher(RecordingSender())
+
+    events, lease = dispatcher._claim()
+    assert len(events) == 1
+    [event] = _events()
+    assert event.next_attempt_at == lease
+    assert dispatcher._claim() == ([], None)
+
+
+def test_expired_lease_does_not_overwrite_new_owner(client, wallets, make_dispatcher):
+    wallets.add_wallet(1, 101)
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 10})
+
+    class SlowSender(RecordingSender):
+        """Lease habis saat kirim; dispatcher lain mengambil alih event-nya"""
+        def send(self, notifications):
+            OutboxEvent.query.update({"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)})
+            db.session.commit()
+            self.taken = other._claim()
+            super().send(notifications)
+
+    sender = SlowSender()
+    other = make_dispatcher(RecordingSender())
+    assert make_dispatcher(sender).dispatch_once() == 1
+
+    [event] = _events()
+    assert (event.status, event.attempts) == ("PENDING", 0)
+    assert event.next_attempt_at == sender.taken[1]
+
+
+def test_prune_removes_only_old_sent_events(client, wallets, make_dispatcher):
+    wallets.add_wallet(1, 101)
+    for _ in range(3):
+        client.post("/transactions/topup", json={"wallet_id": 1, "amount": 10})
+    dispatcher = make_dispatcher(RecordingSender(), batch_size=2)
+    dispatcher.dispatch_once()
+
+    old, recent, pending = _events()
+    OutboxEvent.query.filter_by(id=old.id).update({"sent_at": datetime.utcnow() - timedelta(days=8)})
+    db.session.commit()
+
+    assert dispatcher.prune(7) == 1
+    assert [(e.id, e.status) for e in _events()] == [(recent.id, "SENT"), (pending.id, "PENDING")]
+
+
+def test_failures_back_off_then_go_dead(client, wallets, make_dispatcher):
+    wallets.add_wallet(1, 101)
+    client.post("/transactions/topup", json={"wallet_id": 1, "amount": 10})
+    dispatcher = make_dispatcher(RecordingSender(fail=True), max_attempts=2, backoff=30.0)
+
+    assert dispatcher.dispatch_once() == 1
+    [event] = _events()
+    assert (event.status, event.attempts) == ("PENDING", 1)
+    assert event.next_attempt_at > datetime.utcnow()
+    assert dispatcher.dispatch_once() == 0
+
+    OutboxEvent.query.update({"next_attempt_at": datetime.utcnow()})
+    db.session.commit()
+    dispatcher.dispatch_once()
+    [event] = _events()
+    assert (event.status, event.attempts, event.last_error) == ("DEAD", 2, "notification-service down")
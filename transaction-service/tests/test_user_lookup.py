@@ -0,0 +1,78 @@
+import pytest
+
+from user_client import UserClient, UserServiceError
+
+
+class _Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+@pytest.fixture
+def user_service(monkeypatch):
+    """Ganti HTTP ke user-service: catat id per request, user 3 tidak ada"""
+    import app as app_module
+
+    calls = []
+
+    def get(url, params=None, timeout=None):
+        ids = [int(i) for i in params["ids"].split(",")]
+        calls.append(ids)
+        return _Response(200, {"items": [
+            {"id": i, "name": f"user {i}", "email": f"u{i}@example.com", "role": "USER",
+             "status": "ACTIVE", "balance": 0.0}
+            for i in ids if i != 3
+        ]})
+
+    client = UserClient("http://user-service", coalesce_window=0)
+    monkeypatch.setattr(client.session, "get", get)
+    monkeypatch.setattr(app_module, "user_client", client)
+    return calls
+
+
+def _seed(client, wallets):
+    for wallet_id in (1, 2, 3):
+        wallets.add_wallet(wallet_id, wallet_id)
+        client.post("/transactions/topup", json={"wallet_id": wallet_id, "amount": 10})
+        client.post("/transactions/topup", json={"wallet_id": wallet_id, "amount": 5})
+
+
+def test_include_user_is_one_batched_lookup(client, wallets, user_service):
+    _seed(client, wallets)
+
+    items = client.get("/transactions/?include_user=true").get_json()["items"]
+
+    assert user_service == [[1, 2, 3]]
+    assert [(i["user_id"], i["user"] and i["user"]["name"]) for i in items] == [
+        (1, "user 1"), (1, "user 1"), (2, "user 2"), (2, "user 2"), (3, None), (3, None)
+    ]
+    assert "balance" not in items[0]["user"]
+
+    # Halaman berikutnya dari cache client, kecuali user yang tidak ditemukan
+    client.get("/transactions/?include_user=true")
+    assert user_service == [[1, 2, 3], [3]]
+
+
+def test_users_are_not_fetched_by_default(client, wallets, user_service):
+    _seed(client, wallets)
+
+    items = client.get("/transactions/").get_json()["items"]
+
+    assert user_service == []
+    assert "user" not in items[0]
+
+
+def test_user_service_outage_is_503(client, wallets, monkeypatch):
+    import app as app_module
+
+    _seed(client, wallets)
+
+    def down(user_ids):
+        raise UserServiceError("connection refused")
+
+    monkeypatch.setattr(app_module.user_client, "get_users", down)
+    assert client.get("/transactions/?include_user=true").status_code == 503
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from models import db, Transaction
+from schema import backfill_counterparty_wallets
+from velocity import VelocityEngine
+
+
+@pytest.fixture
+def engine(app):
+    engine = VelocityEngine(app)
+    engine.enabled = True
+    return engine
+
+
+def _transfer(client, to_wallet_id, amount=5.0):
+    return client.post("/transactions/transfer", json={
+        "from_wallet_id": 1, "to_wallet_id": to_wallet_id, "amount": amount,
+    })
+
+
+def test_transfer_legs_record_counterparty(client, wallets):
+    wallets.add_wallet(1, 101, balance=100.0)
+    wallets.add_wallet(2, 102)
+
+    assert _transfer(client, 2).status_code == 200
+
+    legs = {t.type: t.counterparty_wallet_id for t in Transaction.query.all()}
+    assert legs == {"TRANSFER": 2, "TRANSFER_IN": 1}
+
+
+def test_known_payees_come_from_counterparty_column(client, wallets, engine):
+    wallets.add_wallet(1, 101, balance=100.0)
+    wallets.add_wallet(2, 102)
+    wallets.add_wallet(3, 103)
+    assert _transfer(client, 2).status_code == 200
+
+    # Description tidak lagi dipakai untuk menentukan payee
+    Transaction.query.update({"description": "edited"})
+    db.session.commit()
+
+    engine.load()
+    with engine.hold(101, 1.0, payee=2) as known:
+        assert not known.new_payee
+    with engine.hold(101, 1.0, payee=3) as new:
+        assert new.new_payee
+
+
+def test_concurrent_first_requests_rebuild_once(engine, monkeypatch):
+    calls = []
+
+    def rebuild(user_id=None):
+        calls.append(user_id)
+        time.sleep(0.05)
+        return {}
+
+    monkeypatch.setattr(engine, "_rebuild", rebuild)
+    threads = [threading.Thread(target=engine.load) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [None]
+    assert engine.stats()["loaded"]
+
+
+def test_backfill_reads_legacy_transfer_descriptions(app):
+    db.session.add_all([
+        Transaction(wallet_id=1, user_id=101, type="TRANSFER", amount=5, status="SUCCESS",
+                    description="Transfer to wallet 7"),
+        Transaction(wallet_id=7, user_id=107, type="TRANSFER_IN", amount=5, status="SUCCESS",
+                    description="Transfer from wallet 1"),
+        Transaction(wallet_id=1, user_id=101, type="PAYMENT", amount=5, status="SUCCESS",
+                    description="Transfer to wallet 9"),
+    ])
+    db.session.commit()
+
+    assert backfill_counterparty_wallets() == 2
+
+    db.session.expire_all()
+    rows = Transaction.query.order_by(Transaction.id).all()
+    assert [t.counterparty_wallet_id for t in rows] == [7, 1, None]
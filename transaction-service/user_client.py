@@ -0,0 +1,65 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+from coalesce import CoalescingLookup
+
+
+class UserServiceError(Exception):
+    """user-service tidak bisa dihubungi / membalas error"""
+    pass
+
+
+# ============================================================
+#                 USER CLIENT (user-service)
+# ============================================================
+# Pengganti N x GET /internal/users/<id>: pemilik satu halaman transaksi
+# (?include_user=true) diambil dengan satu GET /internal/users?ids=...,
+# lookup tunggal dari banyak thread yang berdekatan digabung jadi satu batch,
+# dan hasilnya disimpan sebentar di LRU + TTL (USER_CLIENT_CACHE_TTL);
+# cache + penggabungan memakai CoalescingLookup yang sama dengan wallet client.
+#     users = UserClient(USER_SERVICE_URL)
+#     users.get_users([1, 2, 3])      # satu round-trip
+#     users.get_user(1)               # dari banyak thread -> digabung
+
+class UserClient:
+
+    def __init__(self, base_url, pool_size=10, timeout=(1.0, 5.0),
+                 cache_size=10000, cache_ttl=30.0, coalesce_window=0.002, batch_size=500):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self._lookup = CoalescingLookup(self._fetch, cache_size, cache_ttl, coalesce_window)
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+
+    def _fetch(self, user_ids):
+        """Satu GET per `batch_size` id: {user_id: dict}"""
+        found = {}
+        for start in range(0, len(user_ids), self.batch_size):
+            chunk = user_ids[start:start + self.batch_size]
+            try:
+                response = self.session.get(
+                    f"{self.base_url}/internal/users",
+                    params={"ids": ",".join(map(str, chunk))},
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as e:
+                raise UserServiceError(str(e)) from e
+            if response.status_code != 200:
+                raise UserServiceError(f"user lookup failed: HTTP {response.status_code}")
+            for user in response.json()["items"]:
+                found[user["id"]] = user
+        return found
+
+    def get_users(self, user_ids):
+        """{user_id: dict} untuk id yang ada; yang belum di-cache diambil sekaligus"""
+        return self._lookup.get_many(user_ids)
+
+    def get_user(self, user_id):
+        """dict user atau None; lookup dari thread berbeda dalam coalesce_window digabung"""
+        return self._lookup.get(user_id)
+
+    def invalidate(self, user_id):
+        self._lookup.invalidate(user_id)
@@ -0,0 +1,331 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import db, Transaction
+
+
+# ============================================================
+#                 VELOCITY / FRAUD RULES
+# ============================================================
+# Setiap user punya ring buffer per jendela waktu (menit / jam / hari):
+# bucket berukuran tetap, total berjalan di-update saat bucket lama digeser
+# keluar, jadi cek + catat = O(jumlah jendela). State user disimpan di LRU
+# terbatas (VELOCITY_MAX_USERS); user yang ter-evict dimuat ulang dari DB.
+# Dana keluar yang dihitung: PAYMENT + TRANSFER berstatus SUCCESS.
+# Rebuild dari DB (start / setelah evict) mengisi jendela dari transaksi 24 jam
+# terakhir, plus payee yang dikenal dan jendela new_payees dari transfer selama
+# VELOCITY_PAYEE_LOOKBACK_DAYS (transfer 24 jam terakhir ke payee yang belum
+# pernah dibayar sebelumnya dihitung sebagai payee baru). Payee = kolom
+# counterparty_wallet_id leg TRANSFER. Rebuild penuh berjalan sekali, di bawah
+# _load_lock (load() saat start, atau request pertama yang menunggu).
+# State per proses: dengan beberapa worker, batas berlaku per worker.
+
+OUTGOING_TYPES = ("PAYMENT", "TRANSFER")
+
+class RingWindow:
+    """Sliding window dengan `buckets` bucket selebar `width` detik"""
+
+    __slots__ = ("width", "buckets", "counts", "amounts", "head", "count", "amount")
+
+    def __init__(self, width, buckets):
+        self.width = width
+        self.buckets = buckets
+        self.counts = array("l", bytes(8 * buckets))
+        self.amounts = array("d", bytes(8 * buckets))
+        self.head = 0
+        self.count = 0
+        self.amount = 0.0
+
+    def advance(self, now):
+        index = int(now // self.width)
+        if index - self.head >= self.buckets:
+            for slot in range(self.buckets):
+                self.counts[slot] = 0
+                self.amounts[slot] = 0.0
+            self.count = 0
+            self.amount = 0.0
+        else:
+            for step in range(self.head + 1, index + 1):
+                slot = step % self.buckets
+                self.count -= self.counts[slot]
+                self.amount -= self.amounts[slot]
+                self.counts[slot] = 0
+                self.amounts[slot] = 0.0
+        self.head = max(self.head, index)
+
+    def add(self, ts, amount, count=1):
+        index = int(ts // self.width)
+        if index <= self.head - self.buckets:
+            return      # sudah di luar jendela
+        self.advance(ts)
+        slot = index % self.buckets
+        self.counts[slot] += count
+        self.amounts[slot] += amount
+        self.count += count
+        self.amount += amount
+
+
+class UserState:
+
+    __slots__ = ("windows", "new_payees", "payees")
+
+    def __init__(self, specs):
+        self.windows = [RingWindow(width, buckets) for width, buckets, _, _ in specs]
+        self.new_payees = RingWindow(3600, 24)
+        self.payees = None      # dimuat saat transfer pertama (lookback panjang)
+
+
+class Hold:
+    """Reservasi limit untuk satu pembayaran; dilepas kalau commit() tidak dipanggil"""
+
+    def __init__(self, engine, user_id, amount, payee):
+        self.engine = engine
+        self.user_id = user_id
+        self.amount = amount
+        self.payee = payee
+        self.ts = time.time()
+        self.new_payee = False
+        self.blocked_by = None
+        self._committed = False
+
+    def commit(self):
+        self._committed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self.blocked_by and not self._committed:
+            self.engine.release(self)
+        return False
+
+
+class VelocityEngine:
+
+    def __init__(self, app=None):
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("VELOCITY_ENABLED", True)
+        self.max_users = app.config.get("VELOCITY_MAX_USERS", 100000)
+        self.max_payees = app.config.get("VELOCITY_MAX_PAYEES_PER_USER", 1000)
+        self.payee_lookback_days = app.config.get("VELOCITY_PAYEE_LOOKBACK_DAYS", 90)
+        self.new_payee_max_amount = app.config.get("VELOCITY_NEW_PAYEE_MAX_AMOUNT", 0)
+        self.new_payees_per_day = app.config.get("VELOCITY_NEW_PAYEES_PER_DAY", 0)
+        # (lebar bucket, jumlah bucket, max count, max amount); 0 = tanpa batas
+        self.specs = [
+            (5, 12, app.config.get("VELOCITY_MAX_COUNT_PER_MINUTE", 0),
+             app.config.get("VELOCITY_MAX_AMOUNT_PER_MINUTE", 0)),
+            (300, 12, app.config.get("VELOCITY_MAX_COUNT_PER_HOUR", 0),
+             app.config.get("VELOCITY_MAX_AMOUNT_PER_HOUR", 0)),
+            (3600, 24, app.config.get("VELOCITY_MAX_COUNT_PER_DAY", 0),
+             app.config.get("VELOCITY_MAX_AMOUNT_PER_DAY", 0)),
+        ]
+        self._names = ("per_minute", "per_hour", "per_day")
+
+    # ------------------------------
+    # STATE (rebuild dari DB)
+    # ------------------------------
+    def _outgoing(self, since, user_id=None):
+        query = (
+            select(Transaction.user_id, Transaction.amount, Transaction.created_at)
+            .where(
+                Transaction.type.in_(OUTGOING_TYPES),
+                Transaction.status == "SUCCESS",
+                Transaction.created_at >= since,
+            )
+        )
+        if user_id is not None:
+            query = query.where(Transaction.user_id == user_id)
+        return db.session.execute(query.execution_options(yield_per=10000))
+
+    def _transfers(self, since, user_id=None):
+        query = (
+            select(Transaction.user_id, Transaction.amount, Transaction.created_at, Transaction.counterparty_wallet_id)
+            .where(
+                Transaction.type == "TRANSFER",
+                Transaction.status == "SUCCESS",
+                Transaction.counterparty_wallet_id.isnot(None),
+                Transaction.created_at >= since,
+            )
+            .order_by(Transaction.created_at, Transaction.id)
+        )
+        if user_id is not None:
+            query = query.where(Transaction.user_id == user_id)
+        return db.session.execute(query.execution_options(yield_per=10000))
+
+    def _apply_payees(self, states, rows, cutoff):
+        """Payee dikenal + new_payees dari transfer urut waktu; hanya untuk user di `states`"""
+        offset = time.time() - datetime.utcnow().timestamp()
+        for user_id, amount, created_at, payee in rows:
+            state = states.get(user_id)
+            if state is None:
+                continue
+            if state.payees is None:
+                state.payees = OrderedDict()
+            if payee not in state.payees and created_at >= cutoff:
+                state.new_payees.add(created_at.timestamp() + offset, amount)
+            state.payees[payee] = True
+            state.payees.move_to_end(payee)
+            while len(state.payees) > self.max_payees:
+                state.payees.popitem(last=False)
+
+    def _rebuild(self, user_id=None):
+        """State dari DB: jendela 24 jam + payee selama lookback; return {user_id: UserState}"""
+        now = datetime.utcnow()
+        cutoff = now - timedelta(days=1)
+        states = {}
+        self._apply_rows(states, self._outgoing(cutoff, user_id))
+        if states:
+            since = cutoff - timedelta(days=self.payee_lookback_days)
+            self._apply_payees(states, self._transfers(since, user_id), cutoff)
+        return states
+
+    def _apply_rows(self, states, rows):
+        offset = time.time() - datetime.utcnow().timestamp()
+        for user_id, amount, created_at in rows:
+            state = states.get(user_id)
+            if state is None:
+                state = states[user_id] = UserState(self.specs)
+            ts = created_at.timestamp() + offset
+            for window in state.windows:
+                window.add(ts, amount)
+
+    def load(self):
+        """Isi state dari DB sekali per proses (lihat _rebuild()); request bersamaan menunggu yang pertama"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            states = self._rebuild()
+            with self._lock:
+                for user_id, state in states.items():
+                    self._put(user_id, state)
+                self._loaded = True
+
+    def _put(self, user_id, state):
+        self._users[user_id] = state
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+            self.evictions += 1
+
+    def _state(self, user_id, need_payees):
+        """State user; query DB hanya kalau user pernah ter-evict atau payee belum dimuat"""
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is not None:
+                self._users.move_to_end(user_id)
+            missing = state is None and self.evictions > 0
+            if state is None and not missing:
+                state = UserState(self.specs)
+                self._put(user_id, state)
+        if missing:
+            loaded = self._rebuild(user_id)
+            with self._lock:
+                state = self._users.get(user_id) or loaded.get(user_id) or UserState(self.specs)
+                self._put(user_id, state)
+
+        if need_payees and state.payees is None:
+            payees = self._load_payees(user_id)
+            with self._lock:
+                if state.payees is None:
+                    state.payees = payees
+        return state
+
+    def _load_payees(self, user_id):
+        since = datetime.utcnow() - timedelta(days=self.payee_lookback_days)
+        recent = db.session.execute(
+            select(Transaction.counterparty_wallet_id)
+            .where(
+                Transaction.user_id == user_id,
+                Transaction.type == "TRANSFER",
+                Transaction.status == "SUCCESS",
+                Transaction.counterparty_wallet_id.isnot(None),
+                Transaction.created_at >= since,
+            )
+            .order_by(Transaction.created_at.desc())
+            .limit(self.max_payees * 10)
+        ).scalars()
+        payees = OrderedDict()
+        for payee in recent:
+            if len(payees) < self.max_payees:
+                payees.setdefault(payee, True)
+        return payees
+
+    # ------------------------------
+    # CHECK + RESERVE
+    # ------------------------------
+    def hold(self, user_id, amount, payee=None):
+        """
+        Cek semua rule lalu langsung reservasi limitnya (supaya request paralel
+        tidak lolos bersamaan). Pakai sebagai context manager; panggil commit()
+        kalau transaksi berhasil, selain itu reservasi dilepas otomatis.
+        """
+        hold = Hold(self, user_id, amount, payee)
+        if not self.enabled:
+            hold.commit()
+            return hold
+
+        self.load()
+        state = self._state(user_id, need_payees=payee is not None)
+
+        with self._lock:
+            for window, (_, _, max_count, max_amount), name in zip(state.windows, self.specs, self._names):
+                window.advance(hold.ts)
+                if max_count and window.count + 1 > max_count:
+                    hold.blocked_by = f"max_count_{name}"
+                    return hold
+                if max_amount and window.amount + amount > max_amount:
+                    hold.blocked_by = f"max_amount_{name}"
+                    return hold
+
+            if payee is not None and payee not in state.payees:
+                hold.new_payee = True
+                if self.new_payee_max_amount and amount > self.new_payee_max_amount:
+                    hold.blocked_by = "new_payee_max_amount"
+                    return hold
+                state.new_payees.advance(hold.ts)
+                if self.new_payees_per_day and state.new_payees.count + 1 > self.new_payees_per_day:
+                    hold.blocked_by = "new_payees_per_day"
+                    return hold
+
+            for window in state.windows:
+                window.add(hold.ts, amount)
+            if payee is not None:
+                if hold.new_payee:
+                    state.new_payees.add(hold.ts, amount)
+                state.payees[payee] = True
+                state.payees.move_to_end(payee)
+                while len(state.payees) > self.max_payees:
+                    state.payees.popitem(last=False)
+        return hold
+
+    def release(self, hold):
+        """Batalkan reservasi (transaksi gagal setelah lolos rule)"""
+        with self._lock:
+            state = self._users.get(hold.user_id)
+            if state is None:
+                return
+            for window in state.windows:
+                window.add(hold.ts, -hold.amount, count=-1)
+            if hold.new_payee:
+                state.new_payees.add(hold.ts, -hold.amount, count=-1)
+                if state.payees is not None:
+                    state.payees.pop(hold.payee, None)
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._users), "evictions": self.evictions, "loaded": self._loaded}
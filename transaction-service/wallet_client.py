@@ -0,0 +1,265 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from coalesce import CoalescingLookup
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+class WalletNotFound(Exception):
+    pass
+
+
+class WalletServiceError(Exception):
+    """wallet-service tidak bisa dihubungi / membalas error"""
+    pass
+
+
+class ApplyCancelled(Exception):
+    """apply_id sudah dibatalkan (cancel) sebelum / sesudah diterapkan"""
+    pass
+
+
+_ERRORS = {
+    "INSUFFICIENT_BALANCE": InsufficientBalance,
+    "WALLET_NOT_FOUND": WalletNotFound,
+    "CANCELLED": ApplyCancelled,
+}
+
+
+# ============================================================
+#                 WALLET CLIENT (transaction-service)
+# ============================================================
+# Saldo tinggal di wallet-service. Client ini:
+# - memakai satu Session dengan pool koneksi keep-alive + timeout per call
+# - menggabungkan lookup bersamaan (wallet sama = satu request, wallet beda
+#   yang datang berdekatan = satu multi-get /internal/wallets?ids=...)
+# - menyimpan identitas wallet (id, user_id, status) sebentar di LRU
+# - mengirim banyak grup delta saldo dalam satu POST /internal/wallets/apply
+#
+# apply() mengembalikan per grup: {wallet_id: saldo baru} atau instance
+# InsufficientBalance / WalletNotFound / ApplyCancelled (tidak di-raise,
+# supaya satu grup gagal tidak menggagalkan grup lain dalam batch).
+#
+# Setiap grup membawa apply_id (write_id). wallet-service men-dedupe id yang
+# sama, jadi apply boleh dikirim ulang setelah timeout / HTTP 5xx (hasil
+# pertama di-replay), dan cancel(ids) bisa membatalkan apply yang hasilnya
+# tidak diketahui: yang sudah masuk dibalik, yang belum sampai ditolak.
+
+class _WalletLookupMixin(ABC):
+
+    def _init_lookup(self, cache_size, cache_ttl, coalesce_window):
+        self._lookup = CoalescingLookup(self.get_wallets, cache_size, cache_ttl, coalesce_window)
+
+    def get_wallet(self, wallet_id):
+        """
+        dict wallet (id, user_id, balance, status) atau None; lookup bersamaan digabung.
+        Hasil di-cache sebentar: balance bisa basi, saldo terbaru ada di hasil apply().
+        """
+        return self._lookup.get(wallet_id)
+
+    @abstractmethod
+    def get_wallets(self, wallet_ids):
+        """{wallet_id: dict} untuk wallet yang ada; dipakai batch lookup get_wallet()"""
+
+
+class HttpWalletClient(_WalletLookupMixin):
+
+    def __init__(self, base_url, pool_size=20, connect_timeout=1.0, read_timeout=5.0,
+                 apply_retries=3, cache_size=10000, cache_ttl=30.0, coalesce_window=0.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.apply_retries = apply_retries
+        self._init_lookup(cache_size, cache_ttl, coalesce_window)
+
+        # Retry hanya untuk gagal connect (request belum terkirim), aman untuk POST
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.05),
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method, path, **kwargs):
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise WalletServiceError(str(e)) from e
+        return response
+
+    def get_wallets(self, wallet_ids):
+        """Satu round-trip untuk banyak wallet: {wallet_id: dict}"""
+        wallet_ids = sorted(set(wallet_ids))
+        found = {}
+        for start in range(0, len(wallet_ids), 500):
+            chunk = wallet_ids[start:start + 500]
+            response = self._request("GET", "/internal/wallets", params={"ids": ",".join(map(str, chunk))})
+            if response.status_code != 200:
+                raise WalletServiceError(f"wallet lookup failed: HTTP {response.status_code}")
+            for wallet in response.json()["items"]:
+                found[wallet["id"]] = wallet
+        return found
+
+    def iter_wallets(self, page_size=500):
+        """Semua wallet, per halaman keyset GET /wallets/"""
+        after = None
+        while True:
+            response = self._request("GET", "/wallets/", params={"after": after, "limit": page_size})
+            if response.status_code != 200:
+                raise WalletServiceError(f"wallet list failed: HTTP {response.status_code}")
+            page = response.json()
+            yield from page["items"]
+            after = page.get("next_cursor")
+            if after is None:
+                return
+
+    def _post_retrying(self, path, body, idempotent):
+        """
+        POST dengan retry. 409 (wallet sibuk, belum ada yang di-commit) selalu
+        aman diulang; timeout / 5xx hanya kalau request idempotent (punya id).
+        """
+        for attempt in range(self.apply_retries + 1):
+            last = attempt == self.apply_retries
+            try:
+                response = self._request("POST", path, json=body)
+            except WalletServiceError:
+                if not idempotent or last:
+                    raise
+            else:
+                retry = response.status_code == 409 or (idempotent and response.status_code >= 500)
+                if not retry or last:
+                    return response
+            time.sleep(0.01 * (2 ** attempt))
+
+    def apply(self, groups, ids=None):
+        """
+        groups: list of list (wallet_id, delta), satu POST untuk semua grup.
+        ids: apply_id per grup (dedupe di wallet-service; wajib agar retry aman).
+        """
+        ids = ids or [None] * len(groups)
+        body = {"groups": [
+            {"id": apply_id, "deltas": [{"wallet_id": wallet_id, "delta": delta} for wallet_id, delta in group]}
+            for apply_id, group in zip(ids, groups)
+        ]}
+        response = self._post_retrying("/internal/wallets/apply", body, idempotent=all(ids))
+        if response.status_code != 200:
+            raise WalletServiceError(f"wallet apply failed: HTTP {response.status_code}")
+
+        outcomes = []
+        for result in response.json()["results"]:
+            if result["status"] == "SUCCESS":
+                outcomes.append({int(k): v for k, v in result["balances"].items()})
+            else:
+                error = _ERRORS.get(result["error"])
+                if error is None:
+                    outcomes.append(WalletServiceError(f"{result['error']} (wallet {result.get('wallet_id')})"))
+                else:
+                    outcomes.append(error(result.get("wallet_id")))
+        return outcomes
+
+    def cancel(self, ids):
+        """Batalkan apply_id: {id: REVERSED / CANCELLED / FAILED}; aman diulang"""
+        response = self._post_retrying("/internal/wallets/apply/cancel", {"ids": list(ids)}, idempotent=True)
+        if response.status_code != 200:
+            raise WalletServiceError(f"wallet cancel failed: HTTP {response.status_code}")
+        return response.json()["results"]
+
+
+class LocalWalletClient(_WalletLookupMixin):
+    """Stand-in in-memory untuk development / test tanpa wallet-service"""
+
+    def __init__(self):
+        self._init_lookup(cache_size=0, cache_ttl=0, coalesce_window=0)
+        self._wallets = {}
+        self._applied = {}      # apply_id -> (status, group, balances)
+        self._lock = threading.Lock()
+
+    def add_wallet(self, wallet_id, user_id, balance=0.0, status="ACTIVE"):
+        with self._lock:
+            self._wallets[wallet_id] = {
+                "id": wallet_id, "user_id": user_id, "balance": balance, "status": status,
+            }
+        return self._wallets[wallet_id]
+
+    def get_wallets(self, wallet_ids):
+        with self._lock:
+            return {i: dict(self._wallets[i]) for i in wallet_ids if i in self._wallets}
+
+    def iter_wallets(self, page_size=500):
+        with self._lock:
+            wallets = [dict(self._wallets[i]) for i in sorted(self._wallets)]
+        return iter(wallets)
+
+    def apply(self, groups, ids=None):
+        outcomes = []
+        with self._lock:
+            for apply_id, group in zip(ids or [None] * len(groups), groups):
+                if apply_id in self._applied:
+                    status, _, balances = self._applied[apply_id]
+                    outcomes.append(dict(balances) if status == "APPLIED" else ApplyCancelled(None))
+                    continue
+
+                missing = [wallet_id for wallet_id, _ in group if wallet_id not in self._wallets]
+                if missing:
+                    outcomes.append(WalletNotFound(missing[0]))
+                    continue
+
+                balances = {wallet_id: self._wallets[wallet_id]["balance"] for wallet_id, _ in group}
+                failed = None
+                for wallet_id, delta in sorted(group, key=lambda d: d[1]):
+                    if balances[wallet_id] + delta < 0:
+                        failed = InsufficientBalance(wallet_id)
+                        break
+                    balances[wallet_id] += delta
+                if failed is not None:
+                    outcomes.append(failed)
+                    continue
+
+                for wallet_id, balance in balances.items():
+                    self._wallets[wallet_id]["balance"] = balance
+                if apply_id:
+                    self._applied[apply_id] = ("APPLIED", group, dict(balances))
+                outcomes.append(balances)
+        return outcomes
+
+    def cancel(self, ids):
+        results = {}
+        with self._lock:
+            for apply_id in ids:
+                status, group, balances = self._applied.get(apply_id, (None, None, None))
+                if status is None:
+                    self._applied[apply_id] = ("CANCELLED", None, None)
+                    results[apply_id] = "CANCELLED"
+                elif status != "APPLIED":
+                    results[apply_id] = status
+                elif any(self._wallets[w]["balance"] - d < 0 for w, d in group):
+                    results[apply_id] = "FAILED"
+                else:
+                    for wallet_id, delta in group:
+                        self._wallets[wallet_id]["balance"] -= delta
+                    self._applied[apply_id] = ("REVERSED", group, balances)
+                    results[apply_id] = "REVERSED"
+        return results
+
+
+def build_wallet_client(config):
+    """Pilih client dari WALLET_CLIENT: http (default) atau local"""
+    if config.WALLET_CLIENT == "local":
+        return LocalWalletClient()
+    return HttpWalletClient(
+        config.WALLET_SERVICE_URL,
+        pool_size=config.WALLET_CLIENT_POOL_SIZE,
+        connect_timeout=config.WALLET_CLIENT_CONNECT_TIMEOUT,
+        read_timeout=config.WALLET_CLIENT_READ_TIMEOUT,
+        cache_ttl=config.WALLET_CLIENT_CACHE_TTL,
+        coalesce_window=config.WALLET_CLIENT_COALESCE_MS / 1000.0,
+    )
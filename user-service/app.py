@@ -1,15 +1,32 @@
-from flask import Flask, request, jsonify
-from flask_restx import Api, Resource, fields
+import os
+import shutil
+
+from flask import Flask, request, jsonify, g
+from flask_restx import Api, Resource, fields, reqparse
 from flask_cors import CORS
 from config import Config
-from models import db, User
-import bcrypt
+from models import db, User, UserImportJob
+from cache import UserCache
+from pagination import sorted_keyset_page
+from search import apply_search, approximate_total, ensure_search_index
+from bulk_import import WalletCreator, run_import_job, start_import_job
+from passwords import PasswordHasher, HasherBusy
+from tokens import TokenIssuer, TokenVerifier, InvalidToken, generate_signing_key
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 db.init_app(app)
 CORS(app)
+password_hasher = PasswordHasher(app)
+token_issuer = TokenIssuer(app)
+# Verifikasi lokal: key + daftar pencabutan langsung dari issuer di proses ini
+token_verifier = TokenVerifier(
+    token_issuer.public_key,
+    token_issuer.revocations,
+    issuer=Config.JWT_ISSUER,
+    refresh_interval=Config.AUTH_REVOCATION_REFRESH_SECONDS,
+)
 
 api = Api(
     app,
@@ -21,6 +38,31 @@ api = Api(
 
 user_ns = api.namespace("users", description="User operations")
 
+user_cache = UserCache(max_size=Config.USER_CACHE_MAX_SIZE, ttl=Config.USER_CACHE_TTL)
+
+
+def get_users_cached(user_ids):
+    """{user_id: User.to_dict()}; yang tidak ada di cache diambil dengan satu query IN"""
+    found, missing, epoch = user_cache.get_many(user_ids)
+    for start in range(0, len(missing), 500):
+        fetched = {
+            user.id: user.to_dict()
+            for user in User.query.filter(User.id.in_(missing[start:start + 500]))
+        }
+        user_cache.put_many(fetched, epoch)
+        found.update(fetched)
+    return found
+
+
+@api.errorhandler(HasherBusy)
+def handle_hasher_busy(error):
+    return {"message": "Server busy, please retry"}, 503, {"Retry-After": "1"}
+
+
+@api.errorhandler(InvalidToken)
+def handle_invalid_token(error):
+    return {"message": str(error)}, 401, {"WWW-Authenticate": "Bearer"}
+
 
 # ============================
 # SWAGGER MODELS
@@ -34,6 +76,30 @@ user_model = api.model("User", {
     "status": fields.String(),
 })
 
+user_page_model = api.model("UserPage", {
+    "items": fields.List(fields.Nested(user_model)),
+    "next_cursor": fields.String(description="Pass as `after` to fetch the next page"),
+    "total": fields.Integer(description="Approximate number of matching users"),
+    "total_exact": fields.Boolean(description="False when total is an estimate or capped"),
+})
+
+USER_SORT_COLUMNS = {
+    "id": User.id,
+    "name": db.func.lower(User.name),
+    "email": db.func.lower(User.email),
+    "created_at": User.created_at,
+}
+
+user_list_parser = reqparse.RequestParser()
+user_list_parser.add_argument("q", type=str, location="args", help="Search name/email")
+user_list_parser.add_argument("match", type=str, location="args", choices=("contains", "prefix"), default="contains")
+user_list_parser.add_argument("role", type=str, location="args")
+user_list_parser.add_argument("status", type=str, location="args")
+user_list_parser.add_argument("sort", type=str, location="args", choices=tuple(USER_SORT_COLUMNS), default="id")
+user_list_parser.add_argument("order", type=str, location="args", choices=("asc", "desc"), default="asc")
+user_list_parser.add_argument("limit", type=int, location="args", help="Page size")
+user_list_parser.add_argument("after", type=str, location="args", help="Cursor from the previous page")
+
 register_model = api.model("RegisterUser", {
     "name": fields.String(required=True),
     "email": fields.String(required=True),
@@ -45,6 +111,10 @@ login_model = api.model("Login", {
     "password": fields.String(required=True)
 })
 
+refresh_model = api.model("RefreshToken", {
+    "refresh_token": fields.String(required=True)
+})
+
 admin_create_model = api.model("AdminCreateUser", {
     "name": fields.String(required=True),
     "email": fields.String(required=True),
@@ -58,11 +128,31 @@ admin_create_model = api.model("AdminCreateUser", {
 # ROLE HELPERS
 # ============================
 
+def get_claims():
+    """
+    Claims dari 'Authorization: Bearer <token>' terbitan user-service; None kalau
+    tidak ada token atau token milik api-gateway (identitas lewat header X-User-*)
+    """
+    if "claims" not in g:
+        auth = request.headers.get("Authorization", "")
+        g.claims = token_verifier.claims(auth[7:]) if auth.startswith("Bearer ") else None
+    return g.claims
+
 def get_role():
-    return request.headers.get("X-Role", None)
+    claims = get_claims()
+    if claims is not None:
+        return claims["role"]
+    if not Config.AUTH_TRUST_HEADERS:
+        return None
+    # api-gateway mengirim X-User-Role (huruf kecil)
+    role = request.headers.get("X-Role") or request.headers.get("X-User-Role")
+    return role.upper() if role else None
 
 def get_user_id():
-    return request.headers.get("X-User-ID", None)
+    claims = get_claims()
+    if claims is not None:
+        return claims["sub"]
+    return request.headers.get("X-User-ID", None) if Config.AUTH_TRUST_HEADERS else None
 
 def require_admin():
     if get_role() != "ADMIN":
@@ -86,7 +176,7 @@ class UserList(Resource):
         """Register normal user"""
         data = request.json
 
-        hashed = bcrypt.hashpw(data["password"].encode(), bcrypt.gensalt()).decode()
+        hashed = password_hasher.hash(data["password"])
 
         user = User(
             name=data["name"],
@@ -107,11 +197,35 @@ class UserList(Resource):
 @user_ns.route("/admin/all")
 class AdminUserList(Resource):
 
-    @user_ns.marshal_list_with(user_model)
+    @user_ns.expect(user_list_parser)
+    @user_ns.marshal_with(user_page_model)
     def get(self):
-        """Admin: View all users"""
+        """Admin: list users (keyset pagination, sort, search by name/email)"""
         require_admin()
-        return User.query.all()
+        args = user_list_parser.parse_args()
+
+        query, id_column = apply_search(User.query, args["q"], args["match"])
+        if args["role"]:
+            query = query.filter(User.role == args["role"])
+        if args["status"]:
+            query = query.filter(User.status == args["status"])
+
+        sort_expr = id_column if args["sort"] == "id" else USER_SORT_COLUMNS[args["sort"]]
+        try:
+            users, next_cursor = sorted_keyset_page(
+                query, sort_expr, id_column,
+                descending=args["order"] == "desc",
+                after=args["after"],
+                limit=args["limit"] or Config.PAGE_SIZE_DEFAULT,
+                max_limit=Config.PAGE_SIZE_MAX,
+                is_datetime=args["sort"] == "created_at",
+            )
+        except ValueError as e:
+            api.abort(400, str(e))
+
+        filtered = bool(args["q"] or args["role"] or args["status"])
+        total, exact = approximate_total(query, filtered, cap=Config.USER_COUNT_CAP)
+        return {"items": users, "next_cursor": next_cursor, "total": total, "total_exact": exact}
 
 
 # ============================
@@ -128,7 +242,7 @@ class AdminCreateUser(Resource):
         require_admin()
 
         data = request.json
-        hashed = bcrypt.hashpw(data["password"].encode(), bcrypt.gensalt()).decode()
+        hashed = password_hasher.hash(data["password"])
 
         user = User(
             name=data["name"],
@@ -143,6 +257,86 @@ class AdminCreateUser(Resource):
         return user, 201
 
 
+# ============================
+# ADMIN: BULK IMPORT
+# ============================
+
+@user_ns.route("/admin/import")
+class AdminImportUsers(Resource):
+
+    @user_ns.doc(params={
+        "format": "csv (default) or ndjson; detected from the upload when omitted",
+        "create_wallets": "true to create an empty wallet for every imported user",
+    })
+    def post(self):
+        """
+        Admin: bulk import users from a CSV (header `name,email,password`, optional
+        `password_hash,role,status`) or NDJSON upload, as multipart `file` or raw body.
+        Runs in the background; returns 202 with the job `status_url`.
+        """
+        require_admin()
+
+        if request.mimetype == "multipart/form-data":
+            if "file" not in request.files:
+                return {"error": "Upload file is required"}, 400
+            upload = request.files["file"]
+            stream, filename, mimetype = upload.stream, upload.filename or "", upload.mimetype
+        else:
+            stream, filename, mimetype = request.stream, "", request.mimetype
+
+        fmt = request.args.get("format")
+        if not fmt:
+            ndjson = mimetype in ("application/x-ndjson", "application/jsonl") or filename.endswith((".ndjson", ".jsonl"))
+            fmt = "ndjson" if ndjson else "csv"
+        if fmt not in ("csv", "ndjson"):
+            return {"error": "format must be csv or ndjson"}, 400
+
+        job = UserImportJob(
+            format=fmt,
+            create_wallets=request.args.get("create_wallets", "false").lower() == "true",
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        # Simpan upload dulu; request selesai tanpa menunggu hashing
+        os.makedirs(Config.USER_IMPORT_DIR, exist_ok=True)
+        path = import_path(job.id)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(stream, f)
+
+        start_import_job(app, job.id, path, password_hasher, **import_options(job))
+        return {
+            "message": "Import accepted",
+            "job_id": job.id,
+            "status_url": api.url_for(AdminImportJob, job_id=job.id)
+        }, 202
+
+
+@user_ns.route("/admin/import/<int:job_id>")
+@user_ns.param("job_id", "Import job ID")
+class AdminImportJob(Resource):
+
+    def get(self, job_id):
+        """Admin: bulk import job status and summary (updated after every chunk)"""
+        require_admin()
+        job = db.session.get(UserImportJob, job_id)
+        if job is None:
+            return {"error": "Import job not found"}, 404
+        return job.to_dict(), 200
+
+
+def import_path(job_id):
+    return os.path.join(Config.USER_IMPORT_DIR, f"{job_id}.upload")
+
+
+def import_options(job):
+    return {
+        "wallets": WalletCreator(Config.WALLET_SERVICE_URL) if job.create_wallets else None,
+        "chunk_size": Config.USER_IMPORT_CHUNK_SIZE,
+        "max_rows": Config.USER_IMPORT_MAX_ROWS,
+    }
+
+
 # ============================
 # ADMIN: GET USER BY ID & DELETE USER
 # ============================
@@ -161,10 +355,23 @@ class AdminUserDetail(Resource):
         require_admin()
         user = User.query.get_or_404(user_id)
         db.session.delete(user)
+        token_issuer.revoke_user(user_id)
         db.session.commit()
+        user_cache.invalidate(user_id)
         return {"message": "User deleted"}
 
 
+@user_ns.route("/admin/<int:user_id>/revoke-tokens")
+class AdminRevokeTokens(Resource):
+
+    def post(self, user_id):
+        """Admin mencabut semua session (access + refresh token) user"""
+        require_admin()
+        token_issuer.revoke_user(user_id)
+        db.session.commit()
+        return {"message": "Tokens revoked"}
+
+
 # ============================
 # USER: PROFILE / ME
 # ============================
@@ -196,24 +403,110 @@ class UserLogin(Resource):
         if not user:
             api.abort(404, "User not found")
 
-        if not bcrypt.checkpw(data["password"].encode(), user.password.encode()):
+        if not password_hasher.verify(data["password"], user.password):
             api.abort(401, "Invalid password")
 
+        # Hash dengan cost lama di-upgrade ke BCRYPT_ROUNDS saat login berhasil
+        if password_hasher.needs_rehash(user.password):
+            try:
+                user.password = password_hasher.hash(data["password"])
+                db.session.commit()
+                user_cache.invalidate(user.id)
+            except HasherBusy:
+                pass    # Coba lagi di login berikutnya
+
+        tokens = token_issuer.issue(user)
+        db.session.commit()
+
         return {
             "message": "Login successful",
             "user_id": user.id,
             "role": user.role,
-            "status": user.status
+            "status": user.status,
+            **tokens
         }
 
 
+# ============================
+# TOKEN REFRESH / LOGOUT
+# ============================
+
+def refresh_token_from_body():
+    data = request.get_json(silent=True)
+    token = data.get("refresh_token") if isinstance(data, dict) else None
+    if not isinstance(token, str) or not token:
+        api.abort(400, "refresh_token is required")
+    return token
+
+
+@user_ns.route("/token/refresh")
+class TokenRefresh(Resource):
+
+    @user_ns.expect(refresh_model)
+    def post(self):
+        """Tukar refresh token dengan pasangan token baru (refresh token lama jadi tidak berlaku)"""
+        user_id = token_issuer.rotate(refresh_token_from_body())
+        user = db.session.get(User, user_id)
+        if user is None:
+            db.session.rollback()
+            raise InvalidToken("User no longer exists")
+
+        tokens = token_issuer.issue(user)
+        db.session.commit()
+        return tokens
+
+
+@user_ns.route("/logout")
+class UserLogout(Resource):
+
+    @user_ns.expect(refresh_model)
+    def post(self):
+        """Cabut refresh token; access token habis sendiri (umurnya pendek)"""
+        token_issuer.revoke_refresh(refresh_token_from_body())
+        db.session.commit()
+        return {"message": "Logged out"}
+
+
 # ============================
 # INTERNAL API (OTHER SERVICES)
 # ============================
 
 @app.route("/internal/users/<int:user_id>")
 def internal_user(user_id):
-    return User.query.get_or_404(user_id).to_dict()
+    user = get_users_cached([user_id]).get(user_id)
+    if user is None:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify(user)
+
+
+@app.route("/internal/users")
+def internal_users():
+    """Multi-get by user id: /internal/users?ids=1,2,3"""
+    try:
+        ids = sorted({int(i) for i in request.args.get("ids", "").split(",") if i})
+    except ValueError:
+        return jsonify({"error": "ids must be comma separated integers"}), 400
+    if len(ids) > Config.USER_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Limited to {Config.USER_BATCH_MAX_ITEMS} ids"}), 413
+
+    found = get_users_cached(ids)
+    return jsonify({"items": [found[i] for i in ids if i in found]})
+
+
+@app.route("/internal/cache/stats")
+def user_cache_stats():
+    return jsonify(user_cache.stats())
+
+
+@app.route("/internal/auth/revocations")
+def internal_token_revocations():
+    """Daftar pencabutan untuk TokenVerifier di service lain (inkremental lewat ?since=)"""
+    return token_issuer.revocations(request.args.get("since", 0, type=int))
+
+
+@app.route("/.well-known/jwks.json")
+def jwks():
+    return token_issuer.jwks()
 
 
 # ============================
@@ -225,12 +518,61 @@ def health():
     return {"service": Config.SERVICE_NAME, "status": "running"}
 
 
+# ============================
+# CLI
+# ============================
+
+@app.cli.command("prune-tokens")
+def prune_tokens():
+    """Hapus refresh token kadaluarsa + entri pencabutan yang sudah tidak relevan"""
+    expired, stale = token_issuer.prune()
+    print(f"Pruned {expired} refresh tokens, {stale} revocations")
+
+
+@app.cli.command("generate-signing-key")
+def generate_signing_key_command():
+    """Buat private key Ed25519 di JWT_PRIVATE_KEY_FILE (kalau belum ada)"""
+    if generate_signing_key(Config.JWT_PRIVATE_KEY_FILE):
+        print(f"✔ Signing key written to {Config.JWT_PRIVATE_KEY_FILE}")
+    else:
+        print(f"Signing key already exists at {Config.JWT_PRIVATE_KEY_FILE}")
+
+
+@app.cli.command("resume-user-imports")
+def resume_user_imports():
+    """Jalankan ulang import yang terhenti (mis. restart); baris yang sudah masuk terhitung duplikat"""
+    jobs = UserImportJob.query.filter(UserImportJob.status.in_(("PENDING", "RUNNING"))).all()
+    for job in jobs:
+        path = import_path(job.id)
+        if not os.path.exists(path):
+            job.status, job.error = "FAILED", "Upload file is gone, upload again"
+            db.session.commit()
+            continue
+        run_import_job(job.id, path, password_hasher, **import_options(job))
+        print(f"Import job {job.id}: {db.session.get(UserImportJob, job.id).status}")
+
+
+@app.cli.command("create-search-index")
+def create_search_index():
+    """Buat (ulang) index pencarian substring name/email untuk admin"""
+    db.create_all()
+    ensure_search_index(rebuild=True)
+    print("✔ User search index ready")
+
+
 # ============================
 # AUTO CREATE DB
 # ============================
 
 if __name__ == "__main__":
+    if not Config.JWT_PRIVATE_KEY:
+        # Development: key dibuat sekali saat start, bukan saat modul di-import
+        generate_signing_key(Config.JWT_PRIVATE_KEY_FILE)
     with app.app_context():
         db.create_all()
         print("✔ User DB Created")
+        try:
+            ensure_search_index()
+        except Exception as e:
+            print(f"WARNING: substring search index unavailable ({e}), falling back to LIKE scans")
     app.run(host="0.0.0.0", port=Config.PORT, debug=True)
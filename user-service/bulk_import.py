@@ -0,0 +1,292 @@
+import csv
+import io
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, User, UserImportJob
+
+
+class TooManyRows(Exception):
+    pass
+
+
+# ============================================================
+#                 BULK USER IMPORT (onboarding partner)
+# ============================================================
+# Upload (CSV / NDJSON) dibaca per baris langsung dari stream dan diproses
+# per chunk, jadi memori tidak ikut membesar dengan ukuran file:
+# 1. validasi + normalisasi email (lower), duplikat dalam file dibuang
+# 2. email yang sudah terdaftar dibuang dengan satu query per chunk
+#    (index lower(email)), SEBELUM hashing supaya CPU tidak terbuang
+# 3. password di-hash paralel di process pool import (PasswordHasher.hash_many);
+#    kolom password_hash (bcrypt) dari sistem lama dipakai apa adanya
+# 4. insert executemany per chunk, ON CONFLICT (email) DO NOTHING untuk
+#    registrasi yang masuk bersamaan; satu commit per chunk
+# 5. opsional: wallet dibuat lewat satu call wallet-service per chunk, untuk
+#    user baru DAN user lama di file itu (bulk-create melewati yang sudah
+#    punya wallet), jadi upload ulang memperbaiki wallet yang gagal dibuat
+# Chunk yang sudah commit tetap ada kalau import berhenti di tengah; upload
+# ulang file yang sama aman (baris yang sudah masuk terhitung duplikat).
+# Import berjalan sebagai UserImportJob di background (upload disimpan ke
+# USER_IMPORT_DIR), status + summary per chunk di GET /users/admin/import/<id>.
+
+ROLES = ("USER", "ADMIN")
+MAX_REPORTED_ERRORS = 100
+
+
+def csv_rows(stream):
+    """Baca CSV (header: name,email,password[,password_hash,role,status]) dari stream upload"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline=""))
+    for i, row in enumerate(reader, start=1):
+        yield i, row
+
+
+def ndjson_rows(stream):
+    """Satu object JSON per baris; baris kosong dilewati"""
+    for i, line in enumerate(io.TextIOWrapper(stream, encoding="utf-8"), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield i, row if isinstance(row, dict) else None
+
+
+def _validate(data):
+    """Return (record, error)"""
+    if data is None:
+        return None, "Row must be a JSON object"
+
+    name = (data.get("name") or "").strip()
+    email = (data.get("email") or "").strip().lower()
+    password = data.get("password") or ""
+    password_hash = (data.get("password_hash") or "").strip()
+    role = (data.get("role") or "USER").strip().upper()
+    status = (data.get("status") or "ACTIVE").strip().upper()
+
+    if not name or not email:
+        return None, "name and email are required"
+    if "@" not in email or len(email) > 120 or len(name) > 120:
+        return None, "Invalid name or email"
+    if role not in ROLES:
+        return None, f"role must be one of {', '.join(ROLES)}"
+    if password_hash:
+        if not password_hash.startswith(("$2a$", "$2b$", "$2y$")):
+            return None, "password_hash must be a bcrypt hash"
+    elif not password:
+        return None, "password or password_hash is required"
+
+    return {
+        "name": name,
+        "email": email,
+        "password": password,
+        "password_hash": password_hash,
+        "role": role,
+        "status": status,
+    }, None
+
+
+def _insert_users(rows):
+    """executemany insert; return [(id, email)] hanya untuk baris yang benar-benar masuk"""
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(User).on_conflict_do_nothing(index_elements=["email"])
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(User).on_conflict_do_nothing(index_elements=["email"])
+    else:
+        stmt = User.__table__.insert()
+    return db.session.execute(stmt.returning(User.id, User.email), rows).all()
+
+
+class WalletCreator:
+    """Buat wallet untuk banyak user dalam satu call ke wallet-service"""
+
+    def __init__(self, base_url, timeout=(1.0, 30.0)):
+        self.url = base_url.rstrip("/") + "/internal/wallets/bulk-create"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=2))
+
+    def create(self, user_ids):
+        response = self.session.post(self.url, json={"user_ids": user_ids}, timeout=self.timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"wallet-service returned HTTP {response.status_code}")
+        return response.json()["created"]
+
+
+class UserImporter:
+
+    def __init__(self, hasher, wallets=None, chunk_size=1000, max_rows=200000, on_progress=None):
+        self.hasher = hasher
+        self.wallets = wallets
+        self.chunk_size = chunk_size
+        self.max_rows = max_rows
+        self.on_progress = on_progress
+        self.seen = set()
+        self.summary = {
+            "total_rows": 0,
+            "created": 0,
+            "duplicates": 0,
+            "invalid": 0,
+            "wallets_created": 0,
+            "wallet_errors": 0,
+            "errors": [],
+        }
+
+    def _error(self, row_number, email, error):
+        if len(self.summary["errors"]) < MAX_REPORTED_ERRORS:
+            self.summary["errors"].append({"row": row_number, "email": email, "error": error})
+
+    def run(self, rows):
+        chunk = []
+        for row_number, data in rows:
+            self.summary["total_rows"] += 1
+            if self.summary["total_rows"] > self.max_rows:
+                raise TooManyRows(self.max_rows)
+
+            record, error = _validate(data)
+            if error:
+                self.summary["invalid"] += 1
+                self._error(row_number, (data or {}).get("email"), error)
+                continue
+            if record["email"] in self.seen:
+                self.summary["duplicates"] += 1
+                continue
+            self.seen.add(record["email"])
+
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+
+        if chunk:
+            self._flush(chunk)
+        return self.summary
+
+    def _progress(self):
+        if self.on_progress is not None:
+            self.on_progress(self.summary)
+
+    def _flush(self, chunk):
+        # Email yang sudah terdaftar dibuang sebelum hashing
+        emails = [record["email"] for record in chunk]
+        existing = dict(db.session.execute(
+            select(func.lower(User.email), User.id).where(func.lower(User.email).in_(emails))
+        ).all())
+        db.session.rollback()       # Jangan tahan transaksi baca selama hashing
+        fresh = [record for record in chunk if record["email"] not in existing]
+        self.summary["duplicates"] += len(chunk) - len(fresh)
+        if not fresh:
+            self._create_wallets(list(existing.values()))
+            self._progress()
+            return
+
+        to_hash = [record for record in fresh if not record["password_hash"]]
+        for record, hashed in zip(to_hash, self.hasher.hash_many([r["password"] for r in to_hash])):
+            record["password_hash"] = hashed
+
+        now = datetime.utcnow()
+        inserted = _insert_users([
+            {
+                "name": record["name"],
+                "email": record["email"],
+                "password": record["password_hash"],
+                "role": record["role"],
+                "status": record["status"],
+                "balance": 0.0,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for record in fresh
+        ])
+        db.session.commit()
+        self.summary["created"] += len(inserted)
+        self.summary["duplicates"] += len(fresh) - len(inserted)
+
+        self._create_wallets([user_id for user_id, _ in inserted] + list(existing.values()))
+        self._progress()
+
+    def _create_wallets(self, user_ids):
+        if self.wallets is None or not user_ids:
+            return
+        try:
+            self.summary["wallets_created"] += self.wallets.create(user_ids)
+        except Exception as e:
+            self.summary["wallet_errors"] += len(user_ids)
+            self._error(None, None, f"Wallet creation failed for {len(user_ids)} users: {e}"[:255])
+
+
+# ============================================================
+#                 IMPORT JOB (BACKGROUND)
+# ============================================================
+
+def _update_job(job_id, status, summary, error=None):
+    job = db.session.get(UserImportJob, job_id)
+    job.status = status
+    job.summary = json.dumps(summary)
+    job.error = error[:255] if error else None
+    db.session.commit()
+
+
+def run_import_job(job_id, path, hasher, wallets=None, chunk_size=1000, max_rows=200000):
+    """Proses upload yang disimpan di `path`; file dihapus setelah job selesai"""
+    job = db.session.get(UserImportJob, job_id)
+    fmt = job.format
+    job.status = "RUNNING"
+    db.session.commit()
+
+    importer = UserImporter(
+        hasher, wallets, chunk_size=chunk_size, max_rows=max_rows,
+        on_progress=lambda summary: _update_job(job_id, "RUNNING", summary),
+    )
+    try:
+        with open(path, "rb") as stream:
+            importer.run(csv_rows(stream) if fmt == "csv" else ndjson_rows(stream))
+    except TooManyRows:
+        db.session.rollback()
+        _update_job(job_id, "FAILED", importer.summary, f"Import limited to {max_rows} rows")
+    except UnicodeDecodeError:
+        db.session.rollback()
+        _update_job(job_id, "FAILED", importer.summary, "Upload must be UTF-8")
+    except Exception as e:
+        db.session.rollback()
+        _update_job(job_id, "FAILED", importer.summary, str(e))
+        raise
+    else:
+        _update_job(job_id, "COMPLETED", importer.summary)
+    finally:
+        if db.session.get(UserImportJob, job_id).status != "RUNNING":
+            os.remove(path)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def start_import_job(app, job_id, path, hasher, wallets=None, chunk_size=1000, max_rows=200000):
+    """Antrekan run_import_job di pool USER_IMPORT_JOB_WORKERS thread"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get("USER_IMPORT_JOB_WORKERS", 1), thread_name_prefix="user-import"
+            )
+
+    def target():
+        with app.app_context():
+            try:
+                run_import_job(job_id, path, hasher, wallets, chunk_size, max_rows)
+            except Exception:
+                app.logger.exception("User import job %s failed", job_id)
+
+    return _executor.submit(target)
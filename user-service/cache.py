@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# ============================
+#       USER CACHE
+# ============================
+# User.to_dict() per user_id untuk jalur internal (/internal/users), dibaca
+# dan diisi per batch. Setiap invalidate() (delete user, rehash password)
+# menaikkan epoch; get_many() mengembalikan epoch saat baca, dan put_many()
+# membuang user yang di-invalidate setelah epoch itu, jadi hasil query yang
+# kalah balapan dengan delete tidak masuk cache lagi.
+# Catatan invalidate hanya disimpan untuk max_size user terakhir; epoch baca
+# yang lebih tua dari catatan tertua (_horizon) tidak mengisi cache sama sekali.
+
+class UserCache:
+    """User dict per user_id, kedaluwarsa setelah `ttl` detik"""
+
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._invalidated = OrderedDict()
+        self._epoch = 0
+        self._horizon = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, user_ids):
+        """Return (found, missing, epoch); epoch diteruskan ke put_many()"""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._users.get(user_id)
+                if entry is not None and entry[0] >= now:
+                    self._users.move_to_end(user_id)
+                    found[user_id] = entry[1]
+                else:
+                    if entry is not None:
+                        del self._users[user_id]
+                    missing.append(user_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+            return found, missing, self._epoch
+
+    def put_many(self, users, epoch):
+        """Simpan {user_id: dict} hasil query yang dimulai pada `epoch`"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if epoch < self._horizon:
+                return
+            for user_id, user in users.items():
+                if self._invalidated.get(user_id, 0) > epoch:
+                    continue
+                self._users[user_id] = (expires_at, user)
+                self._users.move_to_end(user_id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._epoch += 1
+            self._users.pop(user_id, None)
+            self._invalidated[user_id] = self._epoch
+            self._invalidated.move_to_end(user_id)
+            while len(self._invalidated) > self.max_size:
+                _, self._horizon = self._invalidated.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._users),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
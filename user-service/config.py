@@ -31,6 +31,49 @@ class Config:
     # Default port = 3000 (set beda di tiap service)
     PORT = int(os.getenv("PORT", 3000))
 
+    # === PASSWORD HASHING ===
+    # Hash lama dengan cost berbeda di-rehash otomatis saat login
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+    # 0 = hash di thread request (development)
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+    PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 32))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 5.0))
+
+    # === AUTH TOKENS ===
+    # Access token JWT EdDSA (Ed25519). Production: isi JWT_PRIVATE_KEY (PEM);
+    # kalau kosong, key dibaca dari JWT_PRIVATE_KEY_FILE (dibuat oleh
+    # `flask generate-signing-key` atau saat start `python app.py`)
+    JWT_PRIVATE_KEY = os.getenv("JWT_PRIVATE_KEY")
+    JWT_PRIVATE_KEY_FILE = os.getenv("JWT_PRIVATE_KEY_FILE", os.path.join(INSTANCE_DIR, "jwt_ed25519.pem"))
+    JWT_ISSUER = os.getenv("JWT_ISSUER", "user-service")
+    ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", 900))
+    REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", 30 * 86400))
+    AUTH_REVOCATION_REFRESH_SECONDS = float(os.getenv("AUTH_REVOCATION_REFRESH_SECONDS", 10))
+    # Header X-Role / X-User-ID dari gateway masih dipercaya kalau tidak ada Bearer token
+    AUTH_TRUST_HEADERS = os.getenv("AUTH_TRUST_HEADERS", "true").lower() == "true"
+
+    # === USER CACHE (jalur /internal/users) ===
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 30))
+    USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", 10000))
+    USER_BATCH_MAX_ITEMS = int(os.getenv("USER_BATCH_MAX_ITEMS", 1000))
+
+    # === ADMIN USER LIST ===
+    PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 50))
+    PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 500))
+    # Count hasil pencarian berhenti di sini (total_exact = false)
+    USER_COUNT_CAP = int(os.getenv("USER_COUNT_CAP", 10000))
+
+    # === BULK IMPORT ===
+    # Pool hashing terpisah dari login (default: seperempat core, supaya
+    # import besar tidak membuat login 503 karena CPU habis)
+    PASSWORD_IMPORT_WORKERS = int(os.getenv("PASSWORD_IMPORT_WORKERS", max(1, (os.cpu_count() or 1) // 4)))
+    USER_IMPORT_CHUNK_SIZE = int(os.getenv("USER_IMPORT_CHUNK_SIZE", 1000))
+    USER_IMPORT_MAX_ROWS = int(os.getenv("USER_IMPORT_MAX_ROWS", 200000))
+    # Import berjalan di background; upload disimpan di sini sampai job selesai
+    USER_IMPORT_DIR = os.getenv("USER_IMPORT_DIR", os.path.join(INSTANCE_DIR, "imports"))
+    USER_IMPORT_JOB_WORKERS = int(os.getenv("USER_IMPORT_JOB_WORKERS", 1))
+    WALLET_SERVICE_URL = os.getenv("WALLET_SERVICE_URL", "http://localhost:3004")
+
     # === CORS ===
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
 
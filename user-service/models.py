@@ -1,3 +1,4 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import bcrypt
@@ -7,6 +8,12 @@ db = SQLAlchemy()
 
 class User(db.Model):
     __tablename__ = "users"  # FIX: harus pakai __tablename__
+    __table_args__ = (
+        # Sort + prefix search admin (lower(kolom), id) untuk keyset pagination
+        db.Index("ix_users_name_lower", db.func.lower(db.text("name")), "id"),
+        db.Index("ix_users_email_lower", db.func.lower(db.text("email")), "id"),
+        db.Index("ix_users_created_at", "created_at", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
@@ -57,3 +64,60 @@ class User(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
+
+
+# ============================
+# AUTH TOKENS
+# ============================
+
+class RefreshToken(db.Model):
+    """Refresh token opaque; yang disimpan hanya hash SHA-256-nya"""
+    __tablename__ = "refresh_tokens"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# ============================
+# BULK IMPORT JOB
+# ============================
+
+class UserImportJob(db.Model):
+    """Upload bulk import admin; diproses di background, lihat bulk_import.run_import_job"""
+    __tablename__ = "user_import_jobs"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+
+    # PENDING → RUNNING → COMPLETED / FAILED
+    status = db.Column(db.String(20), default="PENDING")
+    format = db.Column(db.String(10), nullable=False)           # csv / ndjson
+    create_wallets = db.Column(db.Boolean, default=False)
+    summary = db.Column(db.Text, nullable=True)                 # JSON, diperbarui per chunk
+    error = db.Column(db.String(255), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "format": self.format,
+            "create_wallets": self.create_wallets,
+            "summary": json.loads(self.summary) if self.summary else None,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class TokenRevocation(db.Model):
+    """Access token user ini dengan iat <= not_before dianggap dicabut"""
+    __tablename__ = "token_revocations"
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    not_before = db.Column(db.Integer, nullable=False, index=True)     # epoch detik
@@ -0,0 +1,53 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+# ============================
+#   SORTED KEYSET PAGINATION
+# ============================
+# ORDER BY (sort_expr, id) dengan cursor (nilai sort terakhir, id terakhir),
+# jadi halaman ke-1000 sama murahnya dengan halaman pertama (tanpa OFFSET).
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor, is_datetime=False):
+    """Return (value, id); ValueError kalau cursor tidak valid"""
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if is_datetime and value is not None:
+            value = datetime.fromisoformat(value)
+        return value, int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def sorted_keyset_page(query, sort_expr, id_column, descending=False, after=None,
+                       limit=50, max_limit=500, is_datetime=False):
+    """Satu halaman urut (sort_expr, id); `after` = cursor dari halaman sebelumnya"""
+    limit = max(1, min(limit, max_limit))
+    if after:
+        value, row_id = decode_cursor(after, is_datetime)
+        if sort_expr is id_column:
+            query = query.filter(id_column < row_id if descending else id_column > row_id)
+        elif descending:
+            query = query.filter(or_(sort_expr < value, and_(sort_expr == value, id_column < row_id)))
+        else:
+            query = query.filter(or_(sort_expr > value, and_(sort_expr == value, id_column > row_id)))
+
+    order = [sort_expr] if sort_expr is id_column else [sort_expr, id_column]
+    query = query.order_by(*(c.desc() for c in order) if descending else order)
+
+    rows = query.add_columns(sort_expr, id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        _, last_value, last_id = rows[-1]
+        next_cursor = encode_cursor(last_value, last_id)
+    return [row for row, _, _ in rows], next_cursor
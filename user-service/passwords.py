@@ -0,0 +1,125 @@
+import itertools
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Pool hashing penuh / timeout; dijawab 503 supaya client retry"""
+    pass
+
+
+# ============================
+# PASSWORD HASHING (OFF-THREAD)
+# ============================
+# bcrypt sengaja mahal (~250ms di cost 12). Dijalankan di process pool
+# terbatas supaya thread request tidak ikut terbakar CPU-nya. Jumlah request
+# yang boleh antre dibatasi; kelebihannya langsung ditolak (HasherBusy).
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode()
+
+
+def _hash_batch(passwords, rounds):
+    return [_hash(password, rounds) for password in passwords]
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_cost(hashed):
+    """Cost bcrypt dari hash ($2b$12$...), None kalau format tidak dikenal"""
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+
+    def __init__(self, app=None):
+        self._pool = None
+        self._import_pool = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get("BCRYPT_ROUNDS", 12)
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) - 1))
+        self.max_queue = app.config.get("PASSWORD_HASH_MAX_QUEUE", 32)
+        self.timeout = app.config.get("PASSWORD_HASH_TIMEOUT", 5.0)
+        self.import_workers = app.config.get("PASSWORD_IMPORT_WORKERS", max(1, (os.cpu_count() or 1) // 4))
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _import_executor(self):
+        if self._import_pool is None:
+            with self._lock:
+                if self._import_pool is None:
+                    self._import_pool = ProcessPoolExecutor(max_workers=self.import_workers)
+        return self._import_pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)        # Tanpa pool (development)
+
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                raise HasherBusy("Password hashing is saturated")
+            self._in_flight += 1
+        try:
+            future = self._executor().submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        # Slot dilepas saat job benar-benar selesai, bukan saat request menyerah
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HasherBusy("Password hashing timed out")
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    def hash(self, password):
+        return self._run(_hash, password.encode(), self.rounds)
+
+    def hash_many(self, passwords):
+        """
+        Hash banyak password sekaligus (bulk import) di pool terpisah, jadi
+        tidak memakan slot / antrean login. Password dikirim per batch supaya
+        overhead IPC kecil; urutan hasil = urutan input.
+        """
+        if not passwords:
+            return []
+        if not self.import_workers:
+            return _hash_batch([p.encode() for p in passwords], self.rounds)
+
+        size = max(1, math.ceil(len(passwords) / (self.import_workers * 4)))
+        batches = [[p.encode() for p in passwords[i:i + size]] for i in range(0, len(passwords), size)]
+        results = self._import_executor().map(_hash_batch, batches, itertools.repeat(self.rounds))
+        return [hashed for batch in results for hashed in batch]
+
+    def verify(self, password, hashed):
+        return self._run(_check, password.encode(), hashed.encode())
+
+    def needs_rehash(self, hashed):
+        return hash_cost(hashed) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "in_flight": self._in_flight, "max_queue": self.max_queue}
@@ -0,0 +1,179 @@
+from sqlalchemy import column, func, literal_column, or_, select, table, text
+
+from models import db, User
+
+
+# ============================================================
+#                 USER SEARCH INDEX (admin)
+# ============================================================
+# Prefix  : range scan di index (lower(name), id) / (lower(email), id),
+#           jadi "and" -> lower(name) >= 'and' AND lower(name) < 'and\uffff'.
+# Substring (>= 3 karakter): index trigram.
+#   - SQLite  : tabel FTS5 external-content `users_search` (tokenize=trigram)
+#               yang disinkron trigger insert/update/delete di `users`. Query
+#               di-join dan diurutkan lewat users_search.rowid supaya FTS5
+#               bisa berhenti di LIMIT (tanpa materialisasi semua match).
+#   - Postgres: GIN pg_trgm di lower(name) & lower(email), dipakai LIKE '%q%'.
+# Kalau index trigram tidak tersedia (SQLite tanpa FTS5), substring jatuh ke
+# LIKE biasa (full scan).
+
+MIN_TRIGRAM_LENGTH = 3
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5(
+        name, email, content='users', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS users_search_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_search(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_search_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_search(users_search, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_search_au AFTER UPDATE OF name, email ON users BEGIN
+        INSERT INTO users_search(users_search, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+        INSERT INTO users_search(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+]
+
+_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_users_name_trgm ON users USING gin (lower(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (lower(email) gin_trgm_ops)",
+]
+
+_trigram_available = {}
+
+# Bukan bagian metadata: dibuat oleh ensure_search_index, bukan db.create_all()
+users_search = table("users_search", column("rowid"))
+
+
+def ensure_user_indexes():
+    """
+    Index models.User (termasuk index fungsional lower(name) / lower(email))
+    tidak dibuat db.create_all() di tabel users yang sudah ada; buat yang hilang.
+    Return nama index yang dibuat.
+    """
+    # Dicek lewat katalog: inspector SQLAlchemy melewati index ekspresi
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        existing = db.session.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'users'")
+        ).scalars()
+    elif dialect == "postgresql":
+        existing = db.session.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = 'users'")
+        ).scalars()
+    else:
+        existing = []
+    existing = set(existing)
+    db.session.rollback()
+
+    created = []
+    for index in User.__table__.indexes:
+        if index.name not in existing:
+            index.create(db.engine)
+            created.append(index.name)
+    return created
+
+
+def ensure_search_index(rebuild=False):
+    """Buat index sort/prefix + index substring sesuai dialect; return True kalau index trigram aktif"""
+    ensure_user_indexes()
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == "sqlite":
+            exists = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_search'")
+            ).scalar()
+            for statement in _SQLITE_DDL:
+                db.session.execute(text(statement))
+            # Tabel baru / rebuild: isi dari baris users yang sudah ada
+            if rebuild or not exists:
+                db.session.execute(text("INSERT INTO users_search(users_search) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for statement in _POSTGRES_DDL:
+                db.session.execute(text(statement))
+        else:
+            return False
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _trigram_available.pop(dialect, None)
+        raise
+    _trigram_available[dialect] = True
+    return True
+
+
+def _has_trigram_index():
+    dialect = db.engine.dialect.name
+    if dialect not in _trigram_available:
+        if dialect == "sqlite":
+            found = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_search'")
+            ).scalar()
+        elif dialect == "postgresql":
+            found = db.session.execute(
+                text("SELECT 1 FROM pg_indexes WHERE tablename = 'users' AND indexname = 'ix_users_name_trgm'")
+            ).scalar()
+        else:
+            found = False
+        _trigram_available[dialect] = bool(found)
+    return _trigram_available[dialect]
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# ------------------------------
+# FILTER
+# ------------------------------
+def apply_search(query, q, match="contains"):
+    """
+    Filter query User dengan pencarian di name/email (case-insensitive).
+    Return (query, id_column): kolom id yang sebaiknya dipakai untuk ORDER BY / keyset.
+    """
+    q = (q or "").strip().lower()
+    if not q:
+        return query, User.id
+
+    if match == "prefix" or len(q) < MIN_TRIGRAM_LENGTH:
+        upper = q + "\uffff"
+        return query.filter(or_(
+            (func.lower(User.name) >= q) & (func.lower(User.name) < upper),
+            (func.lower(User.email) >= q) & (func.lower(User.email) < upper),
+        )), User.id
+
+    if db.engine.dialect.name == "sqlite" and _has_trigram_index():
+        phrase = '"' + q.replace('"', '""') + '"'
+        query = (
+            query.join(users_search, users_search.c.rowid == User.id)
+            .filter(literal_column("users_search").op("MATCH")(phrase))
+        )
+        return query, users_search.c.rowid
+
+    pattern = f"%{_escape_like(q)}%"
+    return query.filter(or_(
+        func.lower(User.name).like(pattern, escape="\\"),
+        func.lower(User.email).like(pattern, escape="\\"),
+    )), User.id
+
+
+# ------------------------------
+# APPROXIMATE TOTAL
+# ------------------------------
+def approximate_total(query, filtered, cap=10000):
+    """
+    (total, exact). Tanpa filter di Postgres: estimasi planner (pg_class.reltuples).
+    Selain itu count dibatasi `cap` baris, jadi tidak pernah scan seluruh tabel.
+    """
+    if not filtered and db.engine.dialect.name == "postgresql":
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'users'")
+        ).scalar()
+        if estimate and estimate > 0:
+            return int(estimate), False
+
+    capped = query.with_entities(User.id).order_by(None).limit(cap + 1).subquery()
+    count = db.session.execute(select(func.count()).select_from(capped)).scalar()
+    return min(count, cap), count <= cap
@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Config dibaca saat import: DATABASE_URL & file key harus di-set sebelum app di-import
+_tmpdir = tempfile.mkdtemp(prefix="user-service-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'user.db')}"
+os.environ["JWT_PRIVATE_KEY_FILE"] = os.path.join(_tmpdir, "jwt_ed25519.pem")
+os.environ["USER_IMPORT_DIR"] = os.path.join(_tmpdir, "imports")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app, user_cache  # noqa: E402
+from models import db, User  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config["TESTING"] = True
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_cache._users.clear()
+        user_cache._invalidated.clear()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_users(app):
+    def make(count):
+        users = [User(name=f"user {i}", email=f"user{i}@example.com", password="x") for i in range(count)]
+        db.session.add_all(users)
+        db.session.flush()
+        ids = [user.id for user in users]
+        db.session.commit()
+        return ids
+    return make
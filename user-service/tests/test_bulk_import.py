@@ -0,0 +1,109 @@
+import json
+import os
+
+from bulk_import import UserImporter, run_import_job
+from config import Config
+from models import db, User, UserImportJob
+
+LEGACY_HASH = "$2b$04$" + "a" * 53
+
+
+class _Hasher:
+    """hash_many tanpa bcrypt; `during` dipanggil di tengah hashing (meniru registrasi bersamaan)"""
+
+    def __init__(self, during=None):
+        self.hashed = []
+        self.during = during
+
+    def hash_many(self, passwords):
+        self.hashed.extend(passwords)
+        if self.during is not None:
+            self.during()
+        return [f"$2b$04$hashed-{password}" for password in passwords]
+
+
+class _Wallets:
+
+    def __init__(self):
+        self.calls = []
+
+    def create(self, user_ids):
+        self.calls.append(sorted(user_ids))
+        return len(user_ids)
+
+
+def _rows(*records):
+    return list(enumerate(records, start=1))
+
+
+def _emails():
+    return sorted(email for (email,) in db.session.query(User.email))
+
+
+def test_duplicates_in_file_and_database_are_skipped_before_hashing(app, make_users):
+    make_users(1)       # user0@example.com
+    hasher = _Hasher()
+
+    summary = UserImporter(hasher, chunk_size=2).run(_rows(
+        {"name": "Ana", "email": "Ana@Example.com", "password": "a1"},
+        {"name": "Ana again", "email": "ana@example.com ", "password": "a2"},
+        {"name": "Existing", "email": "USER0@example.com", "password": "x1"},
+        {"name": "Budi", "email": "budi@example.com", "password_hash": LEGACY_HASH},
+        {"name": "", "email": "nobody@example.com", "password": "n1"},
+        None,
+    ))
+
+    assert (summary["created"], summary["duplicates"], summary["invalid"]) == (2, 2, 2)
+    assert [error["row"] for error in summary["errors"]] == [5, 6]
+    # Hanya baris baru tanpa password_hash yang di-hash
+    assert hasher.hashed == ["a1"]
+    assert _emails() == ["ana@example.com", "budi@example.com", "user0@example.com"]
+    assert User.query.filter_by(email="budi@example.com").one().password == LEGACY_HASH
+
+
+def test_concurrent_registration_is_absorbed_by_on_conflict(app):
+    def register():
+        db.session.add(User(name="Racer", email="race@example.com", password="x"))
+        db.session.commit()
+
+    summary = UserImporter(_Hasher(during=register)).run(_rows(
+        {"name": "Race", "email": "race@example.com", "password": "r1"},
+        {"name": "Citra", "email": "citra@example.com", "password": "c1"},
+    ))
+
+    assert (summary["created"], summary["duplicates"]) == (1, 1)
+    assert User.query.filter_by(email="race@example.com").one().name == "Racer"
+    assert _emails() == ["citra@example.com", "race@example.com"]
+
+
+def test_reupload_creates_wallets_for_existing_users(app, make_users):
+    existing = make_users(1)[0]
+    wallets = _Wallets()
+
+    summary = UserImporter(_Hasher(), wallets).run(_rows(
+        {"name": "Existing", "email": "user0@example.com", "password": "x1"},
+        {"name": "Dewi", "email": "dewi@example.com", "password": "d1"},
+    ))
+
+    created = User.query.filter_by(email="dewi@example.com").one().id
+    assert wallets.calls == [sorted([existing, created])]
+    assert (summary["created"], summary["duplicates"], summary["wallets_created"]) == (1, 1, 2)
+
+
+def test_import_job_reads_upload_and_removes_it(app):
+    job = UserImportJob(format="csv")
+    db.session.add(job)
+    db.session.commit()
+    os.makedirs(Config.USER_IMPORT_DIR, exist_ok=True)
+    path = os.path.join(Config.USER_IMPORT_DIR, f"{job.id}.upload")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("name,email,password,role\nEka,eka@example.com,e1,admin\nEka,EKA@example.com,e2,\n")
+
+    run_import_job(job.id, path, _Hasher(), chunk_size=1)
+
+    job = db.session.get(UserImportJob, job.id)
+    assert job.status == "COMPLETED"
+    assert json.loads(job.summary)["created"] == 1
+    assert json.loads(job.summary)["duplicates"] == 1
+    assert User.query.filter_by(email="eka@example.com").one().role == "ADMIN"
+    assert not os.path.exists(path)
@@ -0,0 +1,104 @@
+from sqlalchemy import event
+
+from app import get_users_cached, user_cache
+from cache import UserCache
+from models import db
+
+ADMIN = {"X-User-Role": "admin"}
+
+
+def _count_selects():
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_execute)
+    return statements, lambda: event.remove(db.engine, "before_cursor_execute", before_execute)
+
+
+def test_multi_get_is_one_query(client, make_users):
+    ids = make_users(5)
+    statements, stop = _count_selects()
+    try:
+        response = client.get(f"/internal/users?ids={ids[3]},{ids[0]},999,{ids[3]}")
+    finally:
+        stop()
+
+    assert response.status_code == 200
+    assert [user["id"] for user in response.get_json()["items"]] == sorted([ids[0], ids[3]])
+    assert "password" not in response.get_json()["items"][0]
+    assert len(statements) == 1
+
+
+def test_second_lookup_is_served_from_cache(client, make_users):
+    ids = make_users(3)
+    client.get("/internal/users?ids=" + ",".join(map(str, ids)))
+
+    statements, stop = _count_selects()
+    try:
+        response = client.get(f"/internal/users/{ids[1]}")
+    finally:
+        stop()
+
+    assert response.get_json()["email"] == "user1@example.com"
+    assert statements == []
+    assert user_cache.stats()["hits"] == 1
+
+
+def test_invalid_ids_and_unknown_user(client):
+    assert client.get("/internal/users?ids=1,x").status_code == 400
+    assert client.get("/internal/users/12345").status_code == 404
+
+
+def test_delete_invalidates_cache(client, make_users):
+    user_id = make_users(1)[0]
+    assert client.get(f"/internal/users/{user_id}").status_code == 200
+
+    assert client.delete(f"/users/admin/{user_id}", headers=ADMIN).status_code == 200
+
+    assert client.get(f"/internal/users/{user_id}").status_code == 404
+
+
+def test_fill_racing_an_invalidate_is_dropped(app, make_users):
+    user_id = make_users(1)[0]
+    _, missing, epoch = user_cache.get_many([user_id])
+    assert missing == [user_id]
+
+    # delete() commit + invalidate terjadi di antara query dan put_many()
+    user_cache.invalidate(user_id)
+    user_cache.put_many({user_id: {"id": user_id, "name": "stale"}}, epoch)
+
+    assert user_cache.get_many([user_id])[1] == [user_id]
+    assert get_users_cached([user_id])[user_id]["name"] == "user 0"
+
+
+def test_invalidation_records_are_bounded():
+    cache = UserCache(max_size=2, ttl=30)
+    _, _, epoch = cache.get_many([1])
+    for user_id in range(10, 15):
+        cache.invalidate(user_id)
+
+    assert len(cache._invalidated) == 2
+    # Catatan invalidate sebelum epoch ini sudah dibuang: isi cache ditolak
+    cache.put_many({1: {"id": 1}}, epoch)
+    assert cache.get_many([1])[1] == [1]
+
+    _, _, epoch = cache.get_many([1])
+    cache.put_many({1: {"id": 1}}, epoch)
+    assert cache.get_many([1])[0] == {1: {"id": 1}}
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    import cache as cache_module
+
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = UserCache(max_size=10, ttl=30)
+    cache.put_many({1: {"id": 1}}, cache.get_many([1])[2])
+
+    now[0] += 29
+    assert 1 in cache.get_many([1])[0]
+    now[0] += 2
+    assert cache.get_many([1])[1] == [1]
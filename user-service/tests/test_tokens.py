@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import g
+
+from app import token_issuer, token_verifier
+from config import Config
+from models import db, RefreshToken, User
+from tokens import generate_signing_key
+
+ADMIN = {"X-User-Role": "admin"}
+
+
+@pytest.fixture
+def user_id(app, make_users):
+    generate_signing_key(Config.JWT_PRIVATE_KEY_FILE)
+    # Daftar pencabutan disinkron ulang di tiap test
+    token_verifier._revoked, token_verifier._since, token_verifier._next_sync = {}, 0, 0.0
+    return make_users(1)[0]
+
+
+def _login(user_id):
+    tokens = token_issuer.issue(db.session.get(User, user_id))
+    db.session.commit()
+    return tokens
+
+
+def _refresh(client, refresh_token):
+    return client.post("/users/token/refresh", json={"refresh_token": refresh_token})
+
+
+def _me(client, tokens):
+    # Fixture app memegang app context, jadi g (dan claims request sebelumnya) ikut terbawa
+    g.pop("claims", None)
+    token_verifier._next_sync = 0.0
+    return client.get("/users/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+
+
+def test_refresh_rotates_the_token(client, user_id):
+    first = _login(user_id)
+    assert _me(client, first).get_json()["id"] == user_id
+
+    response = _refresh(client, first["refresh_token"])
+    assert response.status_code == 200
+    second = response.get_json()
+    assert second["refresh_token"] != first["refresh_token"]
+    assert _me(client, second).status_code == 200
+
+    # Refresh token baru bisa dirotasi lagi; yang lama sudah terpakai
+    assert _refresh(client, second["refresh_token"]).status_code == 200
+    assert RefreshToken.query.filter(RefreshToken.revoked_at.is_(None)).count() == 1
+
+
+def test_reusing_a_rotated_token_revokes_every_session(client, user_id):
+    stolen = _login(user_id)
+    other_device = _login(user_id)
+    rotated = _refresh(client, stolen["refresh_token"]).get_json()
+
+    response = _refresh(client, stolen["refresh_token"])
+    assert response.status_code == 401
+    assert "reuse" in response.get_json()["message"]
+
+    # Semua refresh token user dicabut, access token yang sudah terbit ikut ditolak
+    assert _refresh(client, rotated["refresh_token"]).status_code == 401
+    assert _refresh(client, other_device["refresh_token"]).status_code == 401
+    assert _me(client, rotated).status_code == 401
+    assert str(user_id) in token_issuer.revocations()["revocations"]
+
+
+def test_logout_revokes_only_that_refresh_token(client, user_id):
+    phone = _login(user_id)
+    laptop = _login(user_id)
+
+    assert client.post("/users/logout", json={"refresh_token": phone["refresh_token"]}).status_code == 200
+
+    assert _refresh(client, laptop["refresh_token"]).status_code == 200
+    assert _me(client, phone).status_code == 200
+    assert _refresh(client, phone["refresh_token"]).status_code == 401
+
+
+def test_admin_revoke_rejects_issued_access_tokens(client, user_id):
+    tokens = _login(user_id)
+
+    assert client.post(f"/users/admin/{user_id}/revoke-tokens", headers=ADMIN).status_code == 200
+
+    assert _me(client, tokens).status_code == 401
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_expired_refresh_token_is_rejected_and_pruned(client, user_id):
+    tokens = _login(user_id)
+    RefreshToken.query.update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+    assert token_issuer.prune() == (1, 0)
+    assert RefreshToken.query.count() == 0
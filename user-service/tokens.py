@@ -0,0 +1,326 @@
+import base64
+import hashlib
+import logging
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from sqlalchemy import select, update
+
+from models import db, RefreshToken, TokenRevocation
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "EdDSA"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64url(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _hash_refresh(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# ============================================================
+#                 TOKEN ISSUER (user-service)
+# ============================================================
+# Access token = JWT EdDSA (Ed25519) berumur pendek, berisi sub/role/status.
+# Service lain memverifikasi lokal pakai public key dari /.well-known/jwks.json,
+# tanpa memanggil /internal/users per request.
+# Refresh token = string acak (hanya hash-nya disimpan), dirotasi tiap dipakai;
+# refresh token lama yang dipakai ulang = dicuri -> semua token user dicabut.
+# Pencabutan access token: satu baris per user (not_before), cukup disimpan
+# selama umur access token, jadi daftarnya tetap kecil.
+
+def generate_signing_key(path):
+    """Buat file private key Ed25519 (CLI / startup); return False kalau sudah ada"""
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    generated = Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(generated)
+    try:
+        os.link(tmp, path)      # atomic; proses lain yang menang dipakai bersama
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp)
+    logger.warning("Generated new token signing key at %s", path)
+    return True
+
+
+class TokenIssuer:
+
+    def __init__(self, app=None):
+        self._key = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.issuer = app.config.get("JWT_ISSUER", "user-service")
+        self.access_ttl = app.config.get("ACCESS_TOKEN_TTL", 900)
+        self.refresh_ttl = app.config.get("REFRESH_TOKEN_TTL", 30 * 86400)
+        self.key_pem = app.config.get("JWT_PRIVATE_KEY")
+        self.key_file = app.config.get("JWT_PRIVATE_KEY_FILE")
+
+    def _load(self):
+        """Key dibaca saat pertama dipakai (bukan saat import); tidak pernah dibuat di sini"""
+        if self._key is not None:
+            return self._key
+        with self._lock:
+            if self._key is None:
+                pem = self.key_pem
+                if not pem and self.key_file and os.path.exists(self.key_file):
+                    with open(self.key_file, "rb") as f:
+                        pem = f.read()
+                if not pem:
+                    raise RuntimeError(
+                        "Token signing key missing: set JWT_PRIVATE_KEY or run `flask generate-signing-key`"
+                    )
+                if isinstance(pem, str):
+                    pem = pem.encode()
+                private_key = serialization.load_pem_private_key(pem, password=None)
+
+                raw = private_key.public_key().public_bytes(
+                    serialization.Encoding.Raw, serialization.PublicFormat.Raw
+                )
+                kid = _b64url(hashlib.sha256(raw).digest()[:12])
+                self._jwk = {"kty": "OKP", "crv": "Ed25519", "x": _b64url(raw), "kid": kid,
+                             "alg": ALGORITHM, "use": "sig"}
+                self._public_keys = {kid: private_key.public_key()}
+                self.kid = kid
+                self._key = private_key
+        return self._key
+
+    @property
+    def private_key(self):
+        return self._load()
+
+    def public_key(self, kid):
+        self._load()
+        return self._public_keys.get(kid)
+
+    def jwks(self):
+        self._load()
+        return {"keys": [self._jwk]}
+
+    # ------------------------------
+    # ISSUE / REFRESH
+    # ------------------------------
+    def access_token(self, user):
+        now = int(time.time())
+        claims = {
+            "iss": self.issuer,
+            "sub": str(user.id),
+            "role": user.role,
+            "status": user.status,
+            "iat": now,
+            "exp": now + self.access_ttl,
+            "jti": secrets.token_hex(8),
+        }
+        private_key = self.private_key
+        return jwt.encode(claims, private_key, algorithm=ALGORITHM, headers={"kid": self.kid})
+
+    def issue(self, user):
+        """Pasangan access + refresh token baru; caller yang commit"""
+        refresh = secrets.token_urlsafe(32)
+        db.session.add(RefreshToken(
+            user_id=user.id,
+            token_hash=_hash_refresh(refresh),
+            expires_at=datetime.utcnow() + timedelta(seconds=self.refresh_ttl),
+        ))
+        return {
+            "access_token": self.access_token(user),
+            "refresh_token": refresh,
+            "token_type": "Bearer",
+            "expires_in": self.access_ttl,
+        }
+
+    def rotate(self, refresh_token):
+        """Tandai refresh token terpakai; return user_id pemiliknya"""
+        token_hash = _hash_refresh(refresh_token or "")
+        row = db.session.execute(
+            select(RefreshToken.user_id, RefreshToken.expires_at).where(RefreshToken.token_hash == token_hash)
+        ).first()
+        if row is None or row.expires_at < datetime.utcnow():
+            raise InvalidToken("Invalid or expired refresh token")
+
+        # Conditional update: dari dua refresh bersamaan hanya satu yang menang
+        used = db.session.execute(
+            update(RefreshToken)
+            .where(RefreshToken.token_hash == token_hash, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not used:
+            self.revoke_user(row.user_id)
+            db.session.commit()
+            raise InvalidToken("Refresh token reuse detected, all sessions revoked")
+        return row.user_id
+
+    # ------------------------------
+    # REVOCATION
+    # ------------------------------
+    def revoke_refresh(self, refresh_token):
+        db.session.execute(
+            update(RefreshToken)
+            .where(RefreshToken.token_hash == _hash_refresh(refresh_token or ""), RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    def revoke_user(self, user_id):
+        """Cabut semua token user (access yang sudah terbit + semua refresh); caller yang commit"""
+        db.session.merge(TokenRevocation(user_id=user_id, not_before=int(time.time())))
+        db.session.execute(
+            update(RefreshToken)
+            .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    def revocations(self, since=0):
+        """Perubahan daftar pencabutan sejak `since` (epoch detik), untuk sinkron inkremental"""
+        now = int(time.time())
+        floor = max(since, now - self.access_ttl)
+        rows = db.session.execute(
+            select(TokenRevocation.user_id, TokenRevocation.not_before)
+            .where(TokenRevocation.not_before >= floor)
+        ).all()
+        return {"revocations": {str(user_id): not_before for user_id, not_before in rows},
+                "now": now, "ttl": self.access_ttl}
+
+    def prune(self):
+        """Hapus refresh token kadaluarsa + pencabutan yang access token-nya sudah pasti expired"""
+        now = datetime.utcnow()
+        expired = RefreshToken.query.filter(RefreshToken.expires_at < now).delete(synchronize_session=False)
+        stale = TokenRevocation.query.filter(
+            TokenRevocation.not_before < int(time.time()) - self.access_ttl
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return expired, stale
+
+
+# ============================================================
+#                 TOKEN VERIFIER (semua service)
+# ============================================================
+# Hanya bergantung pada PyJWT + requests, bisa dipakai service lain:
+#     verifier = TokenVerifier.from_service(USER_SERVICE_URL)
+#     claims = verifier.verify(token)
+#     claims = verifier.claims(token)   # None untuk token gateway (bukan EdDSA)
+# Public key di-cache per kid (fetch ulang hanya kalau kid tidak dikenal).
+# Daftar pencabutan disinkron inkremental paling sering tiap
+# `refresh_interval` detik; kalau user-service tidak bisa dihubungi, daftar
+# terakhir tetap dipakai.
+
+class TokenVerifier:
+
+    def __init__(self, key_source, revocation_source, issuer="user-service", refresh_interval=10.0, leeway=5):
+        self.key_source = key_source
+        self.revocation_source = revocation_source
+        self.issuer = issuer
+        self.refresh_interval = refresh_interval
+        self.leeway = leeway
+        self._revoked = {}
+        self._since = 0
+        self._next_sync = 0.0
+        self._sync_lock = threading.Lock()
+
+    @classmethod
+    def from_service(cls, base_url, issuer="user-service", refresh_interval=10.0, timeout=2.0):
+        base_url = base_url.rstrip("/")
+        jwks = jwt.PyJWKClient(f"{base_url}/.well-known/jwks.json", cache_keys=True, timeout=timeout)
+        session = requests.Session()
+        keys = {}
+
+        def key_source(kid):
+            if kid not in keys:
+                try:
+                    keys[kid] = jwks.get_signing_key(kid).key
+                except jwt.PyJWKClientError:
+                    return None
+            return keys[kid]
+
+        def revocation_source(since):
+            response = session.get(f"{base_url}/internal/auth/revocations", params={"since": since}, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+        return cls(key_source, revocation_source, issuer=issuer, refresh_interval=refresh_interval)
+
+    def _sync(self):
+        if time.monotonic() < self._next_sync:
+            return
+        # Satu thread yang sinkron, thread lain lanjut pakai daftar yang ada
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                feed = self.revocation_source(self._since)
+            except Exception:
+                logger.exception("Token revocation sync failed")
+                self._next_sync = time.monotonic() + self.refresh_interval
+                return
+
+            revoked = dict(self._revoked)
+            revoked.update({int(user_id): not_before for user_id, not_before in feed["revocations"].items()})
+            horizon = feed["now"] - feed["ttl"] - self.leeway
+            self._revoked = {user_id: nb for user_id, nb in revoked.items() if nb >= horizon}
+            self._since = feed["now"]
+            self._next_sync = time.monotonic() + self.refresh_interval
+        finally:
+            self._sync_lock.release()
+
+    def claims(self, token):
+        """
+        Claims kalau token diterbitkan user-service (EdDSA); None untuk token lain
+        (mis. JWT HS256 dari api-gateway: gateway sudah memverifikasinya dan
+        meneruskan identitas lewat header X-User-*).
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+        if header.get("alg") != ALGORITHM:
+            return None
+        return self.verify(token)
+
+    def verify(self, token):
+        """Claims access token; InvalidToken kalau tanda tangan/exp/issuer salah atau dicabut"""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = self.key_source(kid)
+            if key is None:
+                raise InvalidToken("Unknown signing key")
+            claims = jwt.decode(
+                token, key,
+                algorithms=[ALGORITHM],
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={"require": ["exp", "iat", "sub"]},
+            )
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+        self._sync()
+        not_before = self._revoked.get(int(claims["sub"]))
+        if not_before is not None and claims["iat"] <= not_before:
+            raise InvalidToken("Token has been revoked")
+        return claims
@@ -1,9 +1,16 @@
 from flask import Flask, request, jsonify
-from flask_restx import Api, Resource, fields
+from flask_restx import Api, Resource, fields, marshal, reqparse
 from flask_cors import CORS
-from models import db, Wallet
+from models import db, Wallet, AppliedDelta
 from config import Config
-from datetime import datetime
+from pagination import keyset_page, stream_ndjson
+from cache import build_cache
+from schema import add_missing_columns
+from balance import (
+    credit, debit, apply_batch, apply_groups, cancel_applies, prune_applied,
+    run_transaction, compact_slots, set_balance_slots, create_wallets,
+    WalletNotFound, InsufficientBalance, ConcurrentUpdateError
+)
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -21,6 +28,24 @@ api = Api(
 
 wallet_ns = api.namespace("wallets", description="Wallet operations")
 
+wallet_cache = build_cache(Config)
+
+
+def get_wallet_cached(user_id):
+    """Read-through: cache dulu, kalau miss baca DB lalu simpan ke cache"""
+    cached = wallet_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    token = wallet_cache.token(user_id)
+    wallet = Wallet.query.filter_by(user_id=user_id).first()
+    if not wallet:
+        return None
+
+    data = wallet.to_dict()
+    wallet_cache.set(user_id, data, token)
+    return data
+
 
 # ============================
 #     SWAGGER MODELS
@@ -28,12 +53,26 @@ wallet_ns = api.namespace("wallets", description="Wallet operations")
 wallet_model = api.model("Wallet", {
     "id": fields.Integer(readOnly=True),
     "user_id": fields.Integer(required=True),
-    "balance": fields.Float(),
+    "balance": fields.Float(attribute="total_balance"),
+    "balance_slots": fields.Integer(readOnly=True),
     "status": fields.String(),
     "created_at": fields.String(),
     "updated_at": fields.String(),
 })
 
+wallet_page_model = api.model("WalletPage", {
+    "items": fields.List(fields.Nested(wallet_model)),
+    "next_cursor": fields.Integer(description="Pass as `after` to fetch the next page"),
+})
+
+wallet_list_parser = reqparse.RequestParser()
+wallet_list_parser.add_argument("limit", type=int, location="args", help="Page size")
+wallet_list_parser.add_argument("after", type=int, location="args", help="Return wallets with id greater than this cursor")
+wallet_list_parser.add_argument("status", type=str, location="args")
+wallet_list_parser.add_argument("user_id", type=int, location="args")
+wallet_list_parser.add_argument("format", type=str, location="args", choices=("json", "ndjson"), default="json",
+                                help="ndjson streams every matching wallet")
+
 topup_model = api.model("Topup", {
     "user_id": fields.Integer(required=True),
     "amount": fields.Float(required=True)
@@ -44,6 +83,27 @@ deduct_model = api.model("Deduct", {
     "amount": fields.Float(required=True)
 })
 
+slots_model = api.model("BalanceSlots", {
+    "slots": fields.Integer(required=True, description="0 disables sharding")
+})
+
+batch_operation_model = api.model("BatchOperation", {
+    "user_id": fields.Integer(required=True),
+    "type": fields.String(required=True, enum=["TOPUP", "DEDUCT"]),
+    "amount": fields.Float(required=True)
+})
+
+batch_model = api.model("Batch", {
+    "operations": fields.List(fields.Nested(batch_operation_model), required=True)
+})
+
+
+def require_legacy_balance_endpoints():
+    """Perubahan saldo lewat transaction-service supaya tercatat di ledger"""
+    if not Config.LEGACY_BALANCE_ENDPOINTS_ENABLED:
+        api.abort(410, "Deprecated: use transaction-service (/transactions/topup, /transactions/payment) "
+                       "so the change is recorded in the ledger")
+
 
 # ============================
 #         ENDPOINTS
@@ -53,11 +113,35 @@ deduct_model = api.model("Deduct", {
 class WalletList(Resource):
 
     @wallet_ns.doc("list_all_wallets")
-    @wallet_ns.marshal_list_with(wallet_model)
+    @wallet_ns.expect(wallet_list_parser)
+    @wallet_ns.response(200, "Success", wallet_page_model)
     def get(self):
-        """Get all wallets"""
-        wallets = Wallet.query.all()
-        return wallets
+        """List wallets (keyset pagination, or NDJSON stream)"""
+        args = wallet_list_parser.parse_args()
+
+        query = Wallet.query
+        if args["status"]:
+            query = query.filter(Wallet.status == args["status"])
+        if args["user_id"] is not None:
+            query = query.filter(Wallet.user_id == args["user_id"])
+
+        if args["format"] == "ndjson":
+            return stream_ndjson(
+                query, Wallet.id, lambda w: marshal(w, wallet_model),
+                after=args["after"], limit=args["limit"],
+                batch_size=Config.STREAM_BATCH_SIZE
+            )
+
+        wallets, next_cursor = keyset_page(
+            query, Wallet.id,
+            after=args["after"],
+            limit=args["limit"] or Config.PAGE_SIZE_DEFAULT,
+            max_limit=Config.PAGE_SIZE_MAX
+        )
+        return {
+            "items": marshal(wallets, wallet_model),
+            "next_cursor": next_cursor
+        }
 
 
     @wallet_ns.doc("create_wallet")
@@ -66,6 +150,8 @@ class WalletList(Resource):
     def post(self):
         """Create new wallet"""
         data = request.json
+        if data.get("balance"):
+            require_legacy_balance_endpoints()
         new_wallet = Wallet(
             user_id=data["user_id"],
             balance=data.get("balance", 0.0),
@@ -73,6 +159,7 @@ class WalletList(Resource):
         )
         db.session.add(new_wallet)
         db.session.commit()
+        wallet_cache.delete(new_wallet.user_id)
         return new_wallet, 201
 
 
@@ -81,36 +168,68 @@ class WalletList(Resource):
 class WalletByUser(Resource):
 
     @wallet_ns.doc("get_wallet_by_user")
-    @wallet_ns.marshal_with(wallet_model)
+    @wallet_ns.response(200, "Success", wallet_model)
     def get(self, user_id):
         """Get wallet by user_id"""
-        wallet = Wallet.query.filter_by(user_id=user_id).first()
+        wallet = get_wallet_cached(user_id)
         if not wallet:
             api.abort(404, "Wallet not found")
         return wallet
 
 
+@wallet_ns.route("/<int:user_id>/slots")
+@wallet_ns.param("user_id", "User ID associated with the wallet")
+class WalletSlots(Resource):
+
+    @wallet_ns.doc("set_wallet_balance_slots")
+    @wallet_ns.expect(slots_model)
+    def put(self, user_id):
+        """Enable/disable sharded balance for a high-traffic wallet"""
+        slots = (request.json or {}).get("slots")
+        if not isinstance(slots, int) or not 0 <= slots <= Config.BALANCE_SLOTS_MAX:
+            api.abort(400, f"slots must be an integer between 0 and {Config.BALANCE_SLOTS_MAX}")
+
+        try:
+            set_balance_slots(user_id, slots)
+        except WalletNotFound:
+            api.abort(404, "Wallet not found")
+
+        db.session.commit()
+        wallet_cache.delete(user_id)
+
+        return jsonify({
+            "message": "Balance slots updated",
+            "user_id": user_id,
+            "balance_slots": slots
+        })
+
+
 @wallet_ns.route("/topup")
 class WalletTopup(Resource):
 
     @wallet_ns.doc("topup_wallet")
     @wallet_ns.expect(topup_model)
+    @wallet_ns.deprecated
     def post(self):
-        """Top-up Wallet"""
+        """Top-up Wallet (deprecated, bypasses the ledger; use transaction-service /transactions/topup)"""
+        require_legacy_balance_endpoints()
         data = request.json
-        wallet = Wallet.query.filter_by(user_id=data["user_id"]).first()
 
-        if not wallet:
+        try:
+            new_balance = credit(data["user_id"], data["amount"], Config.BALANCE_MAX_RETRIES)
+        except WalletNotFound:
             api.abort(404, "Wallet not found")
+        except ConcurrentUpdateError:
+            db.session.rollback()
+            api.abort(409, "Wallet is busy, please retry")
 
-        wallet.balance += data["amount"]
-        wallet.updated_at = datetime.utcnow()
         db.session.commit()
+        wallet_cache.delete(data["user_id"])
 
         return jsonify({
             "message": "Top-up successful",
-            "user_id": wallet.user_id,
-            "new_balance": wallet.balance
+            "user_id": data["user_id"],
+            "new_balance": new_balance
         })
 
 
@@ -119,25 +238,66 @@ class WalletDeduct(Resource):
 
     @wallet_ns.doc("deduct_wallet_balance")
     @wallet_ns.expect(deduct_model)
+    @wallet_ns.deprecated
     def post(self):
-        """Deduct balance for payments"""
+        """Deduct balance for payments (deprecated, bypasses the ledger; use transaction-service /transactions/payment)"""
+        require_legacy_balance_endpoints()
         data = request.json
-        wallet = Wallet.query.filter_by(user_id=data["user_id"]).first()
 
-        if not wallet:
+        try:
+            new_balance = debit(data["user_id"], data["amount"], Config.BALANCE_MAX_RETRIES)
+        except WalletNotFound:
             api.abort(404, "Wallet not found")
-
-        if wallet.balance < data["amount"]:
+        except InsufficientBalance:
             api.abort(400, "Insufficient balance")
+        except ConcurrentUpdateError:
+            db.session.rollback()
+            api.abort(409, "Wallet is busy, please retry")
 
-        wallet.balance -= data["amount"]
-        wallet.updated_at = datetime.utcnow()
         db.session.commit()
+        wallet_cache.delete(data["user_id"])
 
         return jsonify({
             "message": "Balance deduction successful",
-            "user_id": wallet.user_id,
-            "new_balance": wallet.balance
+            "user_id": data["user_id"],
+            "new_balance": new_balance
+        })
+
+
+@wallet_ns.route("/batch")
+class WalletBatch(Resource):
+
+    @wallet_ns.doc("batch_wallet_operations")
+    @wallet_ns.expect(batch_model)
+    @wallet_ns.deprecated
+    def post(self):
+        """Apply many top-ups / deductions in one transaction (deprecated, bypasses the ledger)"""
+        require_legacy_balance_endpoints()
+        data = request.json or {}
+        operations = data.get("operations")
+
+        if not isinstance(operations, list) or not operations:
+            api.abort(400, "operations must be a non-empty list")
+        if len(operations) > Config.WALLET_BATCH_MAX_ITEMS:
+            api.abort(413, f"Batch limited to {Config.WALLET_BATCH_MAX_ITEMS} operations")
+
+        try:
+            results = apply_batch(operations, Config.BALANCE_MAX_RETRIES)
+        except ConcurrentUpdateError:
+            db.session.rollback()
+            api.abort(409, "Wallets changed during batch, please retry")
+
+        db.session.commit()
+        for user_id in {r["user_id"] for r in results if r["status"] == "SUCCESS"}:
+            wallet_cache.delete(user_id)
+
+        succeeded = sum(1 for r in results if r["status"] == "SUCCESS")
+        return jsonify({
+            "message": "Batch processed",
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results
         })
 
 
@@ -146,10 +306,125 @@ class WalletDeduct(Resource):
 # ================
 @app.route("/internal/wallets/<int:user_id>")
 def get_wallet_internal(user_id):
-    wallet = Wallet.query.filter_by(user_id=user_id).first()
+    wallet = get_wallet_cached(user_id)
     if not wallet:
         return jsonify({"error": "Wallet not found"}), 404
-    return jsonify(wallet.to_dict())
+    return jsonify(wallet)
+
+
+@app.route("/internal/wallets")
+def get_wallets_internal():
+    """Multi-get by wallet id: /internal/wallets?ids=1,2,3"""
+    try:
+        ids = sorted({int(i) for i in request.args.get("ids", "").split(",") if i})
+    except ValueError:
+        return jsonify({"error": "ids must be comma separated integers"}), 400
+    if len(ids) > Config.WALLET_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Limited to {Config.WALLET_BATCH_MAX_ITEMS} ids"}), 413
+
+    items = []
+    for start in range(0, len(ids), 500):
+        items.extend(w.to_dict() for w in Wallet.query.filter(Wallet.id.in_(ids[start:start + 500])))
+    return jsonify({"items": items})
+
+
+@app.route("/internal/wallets/bulk-create", methods=["POST"])
+def bulk_create_wallets_internal():
+    """
+    Buat wallet kosong untuk banyak user sekaligus (bulk import user-service).
+    Body: {"user_ids": [1, 2, 3]}; user yang sudah punya wallet dilewati.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        user_ids = sorted({int(i) for i in data.get("user_ids") or []})
+    except (TypeError, ValueError):
+        return jsonify({"error": "user_ids must be a list of integers"}), 400
+    if len(user_ids) > Config.WALLET_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Limited to {Config.WALLET_BATCH_MAX_ITEMS} user_ids"}), 413
+
+    created = create_wallets(user_ids)
+    db.session.commit()
+    return jsonify({"created": created, "existing": len(user_ids) - created})
+
+
+@app.route("/internal/wallets/apply", methods=["POST"])
+def apply_wallet_groups_internal():
+    """
+    Terapkan banyak grup delta saldo (per wallet_id) dalam satu transaksi.
+    Body: {"groups": [{"id": "<apply_id>", "deltas": [{"wallet_id": 1, "delta": -10}, ...]}, ...]}
+    Grup dengan id yang sudah pernah diterapkan di-replay (saldo tidak berubah lagi).
+    Format lama (grup = list delta tanpa id) masih diterima.
+    """
+    data = request.get_json(silent=True) or {}
+    groups = data.get("groups")
+    if not isinstance(groups, list) or not groups:
+        return jsonify({"error": "groups must be a non-empty list"}), 400
+    try:
+        parsed = []
+        for group in groups:
+            apply_id, deltas = (group.get("id"), group["deltas"]) if isinstance(group, dict) else (None, group)
+            if apply_id is not None and (not isinstance(apply_id, str) or not 0 < len(apply_id) <= 64):
+                return jsonify({"error": "group id must be a string of at most 64 characters"}), 400
+            parsed.append((apply_id, [(int(d["wallet_id"]), float(d["delta"])) for d in deltas]))
+        groups = parsed
+    except (TypeError, KeyError, ValueError):
+        return jsonify({"error": "each delta needs wallet_id and delta"}), 400
+    if sum(len(group) for _, group in groups) > Config.WALLET_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Limited to {Config.WALLET_BATCH_MAX_ITEMS} deltas"}), 413
+
+    try:
+        results, owners = run_transaction(
+            lambda: apply_groups(groups, Config.BALANCE_MAX_RETRIES),
+            Config.BALANCE_MAX_RETRIES,
+            Config.BALANCE_RETRY_BACKOFF,
+        )
+    except ConcurrentUpdateError:
+        return jsonify({"error": "Wallet is busy, please retry"}), 409
+
+    for user_id in owners.values():
+        wallet_cache.delete(user_id)
+    return jsonify({"results": results})
+
+
+@app.route("/internal/wallets/apply/cancel", methods=["POST"])
+def cancel_wallet_applies_internal():
+    """
+    Batalkan apply berdasarkan id (kompensasi dari transaction-service).
+    Body: {"ids": [...]}; status per id: REVERSED, CANCELLED, atau FAILED (perlu rekonsiliasi manual).
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not all(isinstance(i, str) and 0 < len(i) <= 64 for i in ids):
+        return jsonify({"error": "ids must be a list of strings"}), 400
+    if len(ids) > Config.WALLET_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Limited to {Config.WALLET_BATCH_MAX_ITEMS} ids"}), 413
+
+    try:
+        outcomes, owners = run_transaction(
+            lambda: cancel_applies(ids, Config.BALANCE_MAX_RETRIES),
+            Config.BALANCE_MAX_RETRIES,
+            Config.BALANCE_RETRY_BACKOFF,
+        )
+    except ConcurrentUpdateError:
+        return jsonify({"error": "Wallet is busy, please retry"}), 409
+
+    for user_id in owners.values():
+        wallet_cache.delete(user_id)
+    return jsonify({"results": outcomes})
+
+
+@app.route("/internal/wallets/apply/<apply_id>")
+def get_wallet_apply_internal(apply_id):
+    """Status satu apply_id: APPLIED / REVERSED / CANCELLED, 404 kalau belum pernah sampai"""
+    record = db.session.get(AppliedDelta, apply_id)
+    if record is None:
+        return jsonify({"error": "Apply not found"}), 404
+    return jsonify({"id": record.apply_id, "status": record.status})
+
+
+@app.route("/internal/cache/stats")
+def wallet_cache_stats():
+    return jsonify(wallet_cache.stats())
 
 
 # ================
@@ -170,10 +445,34 @@ def health_check():
 def create_db():
     with app.app_context():
         db.create_all()
+        for column in add_missing_columns():
+            print(f"Added column {column}")
         print("Wallet database created!")
 
 
+@app.cli.command("prune-applied-deltas")
+def prune_applied_deltas():
+    """Hapus catatan dedupe apply_id yang lebih tua dari APPLY_DEDUPE_RETENTION_DAYS"""
+    with app.app_context():
+        count = prune_applied(Config.APPLY_DEDUPE_RETENTION_DAYS)
+        db.session.commit()
+        print(f"Pruned {count} applied delta record(s)")
+
+
+@app.cli.command("compact-balances")
+def compact_balances():
+    """Gabungkan saldo slot wallet sharded ke baris utama (jalankan via cron)"""
+    with app.app_context():
+        wallets = Wallet.query.filter(Wallet.balance_slots > 0).all()
+        for wallet in wallets:
+            compact_slots(wallet.id)
+            db.session.commit()
+            wallet_cache.delete(wallet.user_id)
+        print(f"Compacted {len(wallets)} sharded wallet(s)")
+
+
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        add_missing_columns()
     app.run(host="0.0.0.0", port=Config.PORT, debug=True)
\ No newline at end of file
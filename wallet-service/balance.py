@@ -0,0 +1,579 @@
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from models import db, Wallet, WalletBalanceSlot, AppliedDelta
+
+
+class WalletNotFound(Exception):
+    pass
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+class ConcurrentUpdateError(Exception):
+    pass
+
+
+# ============================
+#   BALANCE MUTATION ENGINE
+# ============================
+# Saldo diubah lewat satu statement UPDATE bersyarat, bukan read-modify-write
+# di Python. Fungsi di sini tidak melakukan commit; caller yang commit.
+
+def _supports_returning():
+    return getattr(db.engine.dialect, "update_returning", False)
+
+
+def _wallet_info(user_id):
+    """Return (id, balance_slots) atau None kalau wallet tidak ada"""
+    return db.session.execute(
+        select(Wallet.id, Wallet.balance_slots).where(Wallet.user_id == user_id)
+    ).first()
+
+
+# ============================
+#   SHARDED (HOT) WALLETS
+# ============================
+# Wallet dengan balance_slots > 0 menyebar kredit ke beberapa baris
+# WalletBalanceSlot supaya tidak rebutan satu baris. Saldo total =
+# Wallet.balance + SUM(slot). Debit selalu dari baris utama; kalau kurang,
+# slot di-compact dulu ke baris utama.
+
+def slot_total(wallet_id):
+    return db.session.execute(
+        select(func.coalesce(func.sum(WalletBalanceSlot.balance), 0.0))
+        .where(WalletBalanceSlot.wallet_id == wallet_id)
+    ).scalar_one()
+
+
+def _total_balance(wallet_id):
+    main = db.session.execute(
+        select(Wallet.balance).where(Wallet.id == wallet_id)
+    ).scalar_one()
+    return (main or 0.0) + slot_total(wallet_id)
+
+
+def _credit_slot(wallet_id, slots, delta):
+    result = db.session.execute(
+        update(WalletBalanceSlot)
+        .where(
+            WalletBalanceSlot.wallet_id == wallet_id,
+            WalletBalanceSlot.slot == random.randrange(slots),
+        )
+        .values(balance=WalletBalanceSlot.balance + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        # Slot baru saja diubah oleh set_balance_slots
+        raise ConcurrentUpdateError(wallet_id)
+    return _total_balance(wallet_id)
+
+
+def compact_slots(wallet_id):
+    """Pindahkan saldo slot ke baris utama, return jumlah yang dipindahkan"""
+    rows = db.session.execute(
+        select(WalletBalanceSlot.id, WalletBalanceSlot.balance)
+        .where(WalletBalanceSlot.wallet_id == wallet_id, WalletBalanceSlot.balance != 0)
+    ).all()
+    if not rows:
+        return 0.0
+
+    # Kurangi slot sebesar nilai yang dibaca (bukan set 0), supaya kredit
+    # yang masuk bersamaan tidak hilang
+    slot_table = WalletBalanceSlot.__table__
+    db.session.execute(
+        slot_table.update()
+        .where(slot_table.c.id == bindparam("slot_id"))
+        .values(balance=slot_table.c.balance - bindparam("moved")),
+        [{"slot_id": slot_id, "moved": moved} for slot_id, moved in rows]
+    )
+
+    total = sum(moved for _, moved in rows)
+    db.session.execute(
+        update(Wallet)
+        .where(Wallet.id == wallet_id)
+        .values(
+            balance=Wallet.balance + total,
+            version=Wallet.version + 1,
+            updated_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return total
+
+
+def set_balance_slots(user_id, slots):
+    """Aktifkan (slots > 0) atau matikan (slots = 0) mode sharded untuk satu wallet"""
+    info = _wallet_info(user_id)
+    if info is None:
+        raise WalletNotFound(user_id)
+
+    wallet_id, current = info
+    if slots == current:
+        return
+    compact_slots(wallet_id)
+
+    db.session.execute(
+        delete(WalletBalanceSlot).where(WalletBalanceSlot.wallet_id == wallet_id)
+    )
+    if slots:
+        db.session.execute(
+            insert(WalletBalanceSlot),
+            [{"wallet_id": wallet_id, "slot": i, "balance": 0.0} for i in range(slots)]
+        )
+    db.session.execute(
+        update(Wallet)
+        .where(Wallet.id == wallet_id)
+        .values(balance_slots=slots, version=Wallet.version + 1, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+# ============================
+#   SINGLE WALLET MUTATION
+# ============================
+
+def _apply_returning(user_id, delta):
+    stmt = (
+        update(Wallet)
+        .where(Wallet.user_id == user_id)
+        .values(
+            balance=Wallet.balance + delta,
+            version=Wallet.version + 1,
+            updated_at=datetime.utcnow(),
+        )
+        .returning(Wallet.id, Wallet.balance, Wallet.balance_slots)
+        .execution_options(synchronize_session=False)
+    )
+    if delta > 0:
+        # Wallet sharded dikredit lewat slot, bukan baris utama
+        stmt = stmt.where(Wallet.balance_slots == 0)
+    else:
+        stmt = stmt.where(Wallet.balance >= -delta)
+
+    row = db.session.execute(stmt).first()
+    if row is not None:
+        wallet_id, new_balance, slots = row
+        return new_balance + slot_total(wallet_id) if slots else new_balance
+
+    info = _wallet_info(user_id)
+    if info is None:
+        raise WalletNotFound(user_id)
+
+    wallet_id, slots = info
+    if not slots:
+        if delta > 0:
+            raise ConcurrentUpdateError(user_id)
+        raise InsufficientBalance(user_id)
+    if delta > 0:
+        return _credit_slot(wallet_id, slots, delta)
+
+    if not compact_slots(wallet_id):
+        raise InsufficientBalance(user_id)
+    row = db.session.execute(stmt).first()
+    if row is None:
+        raise InsufficientBalance(user_id)
+    return row[1] + slot_total(wallet_id)
+
+
+def _apply_optimistic(user_id, delta, max_retries):
+    compacted = False
+    for _ in range(max_retries):
+        row = db.session.execute(
+            select(Wallet.id, Wallet.balance, Wallet.version, Wallet.balance_slots)
+            .where(Wallet.user_id == user_id)
+        ).first()
+        if row is None:
+            raise WalletNotFound(user_id)
+
+        wallet_id, current, version, slots = row
+        if slots and delta > 0:
+            return _credit_slot(wallet_id, slots, delta)
+
+        if delta < 0 and current < -delta:
+            if slots and not compacted:
+                compacted = True
+                compact_slots(wallet_id)
+                continue
+            raise InsufficientBalance(user_id)
+
+        result = db.session.execute(
+            update(Wallet)
+            .where(Wallet.user_id == user_id, Wallet.version == version)
+            .values(
+                balance=Wallet.balance + delta,
+                version=version + 1,
+                updated_at=datetime.utcnow(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            new_balance = current + delta
+            return new_balance + slot_total(wallet_id) if slots else new_balance
+
+    raise ConcurrentUpdateError(user_id)
+
+
+def apply_delta(user_id, delta, max_retries=5):
+    """Tambah (delta > 0) atau kurangi (delta < 0) saldo, return saldo baru"""
+    if _supports_returning():
+        return _apply_returning(user_id, delta)
+    return _apply_optimistic(user_id, delta, max_retries)
+
+
+def credit(user_id, amount, max_retries=5):
+    return apply_delta(user_id, amount, max_retries)
+
+
+def debit(user_id, amount, max_retries=5):
+    return apply_delta(user_id, -amount, max_retries)
+
+
+# ============================
+#      BATCH OPERATIONS
+# ============================
+BATCH_OP_TYPES = ("TOPUP", "DEDUCT")
+_IN_CHUNK = 500
+
+
+def validate_batch(operations):
+    """Validasi semua operasi sekaligus, return (valid per user_id, hasil per item)"""
+    results = [None] * len(operations)
+    by_user = {}
+
+    for i, op in enumerate(operations):
+        user_id = op.get("user_id") if isinstance(op, dict) else None
+        op_type = str(op.get("type", "")).upper() if isinstance(op, dict) else ""
+        amount = op.get("amount") if isinstance(op, dict) else None
+
+        error = None
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
+            error = "Invalid user_id"
+        elif op_type not in BATCH_OP_TYPES:
+            error = "Invalid type, expected TOPUP or DEDUCT"
+        elif not isinstance(amount, (int, float)) or isinstance(amount, bool) or amount <= 0:
+            error = "Amount must be a positive number"
+
+        if error:
+            results[i] = {"index": i, "user_id": user_id, "status": "FAILED", "error": error}
+            continue
+
+        delta = amount if op_type == "TOPUP" else -amount
+        by_user.setdefault(user_id, []).append((i, op_type, delta))
+
+    return by_user, results
+
+
+def _load_wallets(user_ids):
+    wallets = {}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), _IN_CHUNK):
+        chunk = user_ids[start:start + _IN_CHUNK]
+        slots = (
+            select(WalletBalanceSlot.wallet_id, func.sum(WalletBalanceSlot.balance).label("total"))
+            .group_by(WalletBalanceSlot.wallet_id)
+            .subquery()
+        )
+        rows = db.session.execute(
+            select(Wallet.user_id, Wallet.balance, Wallet.version, slots.c.total)
+            .outerjoin(slots, slots.c.wallet_id == Wallet.id)
+            .where(Wallet.user_id.in_(chunk))
+        )
+        for user_id, balance, version, slot_balance in rows:
+            # Saldo slot ikut dihitung; baris utama boleh negatif selama total >= 0
+            wallets[user_id] = ((balance or 0.0) + (slot_balance or 0.0), version)
+    return wallets
+
+
+def _plan_batch(by_user, results):
+    """Jalankan operasi per user secara berurutan di memori, hitung delta bersih"""
+    wallets = _load_wallets(by_user.keys())
+    updates = []
+
+    for user_id, ops in by_user.items():
+        if user_id not in wallets:
+            for i, op_type, _ in ops:
+                results[i] = {"index": i, "user_id": user_id, "type": op_type,
+                              "status": "FAILED", "error": "Wallet not found"}
+            continue
+
+        start, version = wallets[user_id]
+        running = start
+        for i, op_type, delta in ops:
+            if running + delta < 0:
+                results[i] = {"index": i, "user_id": user_id, "type": op_type,
+                              "status": "FAILED", "error": "Insufficient balance"}
+                continue
+            running += delta
+            results[i] = {"index": i, "user_id": user_id, "type": op_type,
+                          "status": "SUCCESS", "balance": running}
+
+        if running != start:
+            updates.append({"uid": user_id, "v": version, "delta": running - start})
+
+    return updates
+
+
+def apply_batch(operations, max_retries=5):
+    """
+    Terapkan banyak topup/deduct dalam satu transaksi.
+    Setiap wallet hanya di-UPDATE sekali (delta bersih), dijaga kolom version.
+    Tidak commit; return list hasil per item sesuai urutan input.
+    """
+    by_user, base_results = validate_batch(operations)
+
+    table = Wallet.__table__
+    stmt = (
+        table.update()
+        .where(table.c.user_id == bindparam("uid"), table.c.version == bindparam("v"))
+        .values(
+            balance=table.c.balance + bindparam("delta"),
+            version=table.c.version + 1,
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+    for _ in range(max_retries):
+        results = list(base_results)
+        updates = _plan_batch(by_user, results)
+        if not updates:
+            return results
+
+        if db.engine.dialect.supports_sane_multi_rowcount:
+            applied = db.session.execute(stmt, updates).rowcount
+        else:
+            applied = sum(db.session.execute(stmt, u).rowcount for u in updates)
+
+        if applied == len(updates):
+            return results
+
+        # Ada wallet yang berubah di tengah jalan, ulangi dari awal
+        db.session.rollback()
+
+    raise ConcurrentUpdateError("batch")
+
+
+# ============================
+#   GROUPED MUTATION (INTERNAL)
+# ============================
+# Dipakai transaction-service: banyak grup delta per wallet_id dalam satu
+# request. Satu grup (mis. dua leg transfer) atomik lewat savepoint.
+#
+# Grup boleh membawa apply_id. Hasilnya dicatat di applied_deltas dalam
+# savepoint yang sama dengan perubahan saldo, jadi:
+# - kirim ulang apply_id yang sama (timeout, retry) = replay, saldo tidak berubah lagi
+# - cancel_applies() membalik apply yang sudah masuk, atau memasang tombstone
+#   CANCELLED untuk apply yang belum sampai (request terlambat ikut ditolak)
+
+def _owners(wallet_ids):
+    owners = {}
+    for start in range(0, len(wallet_ids), _IN_CHUNK):
+        chunk = wallet_ids[start:start + _IN_CHUNK]
+        query = select(Wallet.id, Wallet.user_id).where(Wallet.id.in_(chunk)).order_by(Wallet.id)
+        if db.engine.dialect.name != "sqlite":
+            # Kunci urut id supaya dua request berlawanan arah tidak deadlock
+            query = query.with_for_update()
+        owners.update(db.session.execute(query).all())
+    return owners
+
+
+def _applied(apply_ids):
+    records = {}
+    apply_ids = sorted(set(apply_ids))
+    for start in range(0, len(apply_ids), _IN_CHUNK):
+        chunk = apply_ids[start:start + _IN_CHUNK]
+        records.update(
+            (record.apply_id, record)
+            for record in AppliedDelta.query.filter(AppliedDelta.apply_id.in_(chunk))
+        )
+    return records
+
+
+def _replay(record):
+    """Hasil grup untuk apply_id yang sudah pernah diproses"""
+    if record.status == "APPLIED":
+        return {"status": "SUCCESS", "balances": json.loads(record.balances), "replayed": True}
+    return {"status": "FAILED", "error": "CANCELLED", "wallet_id": None}
+
+
+def apply_groups(groups, max_retries=5):
+    """
+    groups: list of (apply_id atau None, list (wallet_id, delta)). Tidak commit.
+    Return (hasil per grup, {wallet_id: user_id}) untuk invalidasi cache.
+    """
+    owners = _owners(sorted({wallet_id for _, group in groups for wallet_id, _ in group}))
+    seen = _applied(apply_id for apply_id, _ in groups if apply_id)
+    results = []
+
+    for apply_id, group in groups:
+        if apply_id in seen:
+            results.append(_replay(seen[apply_id]))
+            continue
+
+        missing = [wallet_id for wallet_id, _ in group if wallet_id not in owners]
+        if missing:
+            results.append({"status": "FAILED", "error": "WALLET_NOT_FOUND", "wallet_id": missing[0]})
+            continue
+
+        balances = {}
+        current = None
+        try:
+            with db.session.begin_nested():
+                # Debit dulu supaya grup gagal sebelum ada kredit yang diterapkan
+                for current, delta in sorted(group, key=lambda d: d[1]):
+                    balances[current] = apply_delta(owners[current], delta, max_retries)
+                if apply_id:
+                    db.session.add(AppliedDelta(
+                        apply_id=apply_id,
+                        status="APPLIED",
+                        deltas=json.dumps(group),
+                        balances=json.dumps({str(k): v for k, v in balances.items()}),
+                    ))
+                    db.session.flush()
+        except InsufficientBalance:
+            results.append({"status": "FAILED", "error": "INSUFFICIENT_BALANCE", "wallet_id": current})
+            continue
+        except IntegrityError:
+            # apply_id yang sama baru saja diproses request lain: savepoint dibatalkan, replay
+            record = db.session.get(AppliedDelta, apply_id)
+            if record is None:
+                raise ConcurrentUpdateError(apply_id)
+            seen[apply_id] = record
+            results.append(_replay(record))
+            continue
+
+        results.append({
+            "status": "SUCCESS",
+            "balances": {str(wallet_id): balance for wallet_id, balance in balances.items()},
+        })
+        if apply_id:
+            seen[apply_id] = db.session.get(AppliedDelta, apply_id)
+
+    return results, owners
+
+
+def cancel_applies(apply_ids, max_retries=5):
+    """
+    Batalkan apply_id: yang sudah APPLIED dibalik (REVERSED), yang belum ada
+    diberi tombstone CANCELLED. Idempotent. Tidak commit.
+    Return ({apply_id: status}, {wallet_id: user_id}).
+    """
+    outcomes, touched = {}, {}
+    for apply_id in sorted(set(apply_ids)):
+        query = select(AppliedDelta).where(AppliedDelta.apply_id == apply_id)
+        if db.engine.dialect.name != "sqlite":
+            query = query.with_for_update()
+        record = db.session.execute(query).scalar()
+
+        if record is None:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(AppliedDelta(apply_id=apply_id, status="CANCELLED"))
+                    db.session.flush()
+                outcomes[apply_id] = "CANCELLED"
+                continue
+            except IntegrityError:
+                # Apply aslinya masuk bersamaan; baca ulang lalu balik
+                record = db.session.execute(query).scalar()
+
+        if record.status != "APPLIED":
+            outcomes[apply_id] = record.status
+            continue
+
+        group = [(wallet_id, -delta) for wallet_id, delta in json.loads(record.deltas)]
+        owners = _owners(sorted(wallet_id for wallet_id, _ in group))
+        try:
+            with db.session.begin_nested():
+                for wallet_id, delta in sorted(group, key=lambda d: d[1]):
+                    if wallet_id not in owners:
+                        raise WalletNotFound(wallet_id)
+                    apply_delta(owners[wallet_id], delta, max_retries)
+                record.status = "REVERSED"
+                db.session.flush()
+        except (InsufficientBalance, WalletNotFound):
+            # Dana sudah terpakai / wallet hilang: perlu rekonsiliasi manual
+            outcomes[apply_id] = "FAILED"
+            continue
+        outcomes[apply_id] = "REVERSED"
+        touched.update(owners)
+
+    return outcomes, touched
+
+
+# SQLSTATE serialization_failure / deadlock_detected (Postgres)
+_RETRYABLE_PGCODES = ("40001", "40P01")
+
+
+def _is_retryable(exc):
+    if isinstance(exc, IntegrityError) or not isinstance(exc, DBAPIError):
+        return False
+    if getattr(exc.orig, "pgcode", None) in _RETRYABLE_PGCODES:
+        return True
+    return "database is locked" in str(exc.orig)
+
+
+def run_transaction(fn, max_retries=5, backoff=0.01):
+    """
+    Jalankan fn() lalu commit. Deadlock / serialization failure / "database is
+    locked" membatalkan seluruh transaksi, jadi fn() diulang dari awal setelah
+    rollback (exponential backoff + jitter). Aman untuk apply_groups dan
+    cancel_applies karena apply_id yang sudah masuk di-replay.
+    Retry habis -> ConcurrentUpdateError.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            result = fn()
+            db.session.commit()
+            return result
+        except DBAPIError as e:
+            db.session.rollback()
+            if not _is_retryable(e):
+                raise
+            if attempt == max_retries:
+                raise ConcurrentUpdateError("transaction") from e
+            time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def prune_applied(older_than_days):
+    """Hapus catatan apply_id yang lebih tua dari retensi dedupe; return jumlah baris"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    return db.session.execute(
+        delete(AppliedDelta).where(AppliedDelta.created_at < cutoff)
+    ).rowcount
+
+
+# ============================
+#   BULK PROVISIONING (INTERNAL)
+# ============================
+
+def create_wallets(user_ids):
+    """
+    Insert wallet kosong untuk user yang belum punya, per 500 id. Tidak commit.
+    Return jumlah wallet yang dibuat.
+    """
+    created = 0
+    for start in range(0, len(user_ids), 500):
+        chunk = user_ids[start:start + 500]
+        existing = set(db.session.execute(
+            select(Wallet.user_id).where(Wallet.user_id.in_(chunk))
+        ).scalars())
+        now = datetime.utcnow()
+        rows = [
+            {"user_id": user_id, "balance": 0.0, "status": "ACTIVE", "version": 0,
+             "balance_slots": 0, "created_at": now, "updated_at": now}
+            for user_id in chunk if user_id not in existing
+        ]
+        if rows:
+            db.session.execute(insert(Wallet), rows)
+            created += len(rows)
+    return created
@@ -0,0 +1,235 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+# ============================
+#       WALLET CACHE
+# ============================
+# Cache dict wallet (Wallet.to_dict()) dengan key user_id.
+# Diisi saat read (read-through) dan di-invalidate setelah commit di jalur tulis.
+# Pembaca mengambil token() sebelum baca DB; set() dengan token yang sudah
+# kedaluwarsa (ada delete() di antaranya) dibuang, jadi nilai lama tidak
+# menimpa invalidate yang lebih baru.
+#
+# LRUCache per proses: delete() hanya sampai ke worker yang memproses tulis,
+# worker lain bisa menyajikan saldo lama sampai TTL habis (WALLET_CACHE_TTL,
+# default 5 detik). Deploy multi-worker yang butuh saldo segar pakai backend
+# shared (redis).
+
+class LRUCache:
+    """In-process LRU cache dengan TTL per entry"""
+
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        # Generasi per key, dibatasi max_size; key yang dibuang dianggap
+        # bergenerasi _floor (>= generasi apa pun yang pernah dibuang)
+        self._generation = OrderedDict()
+        self._counter = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                self._evict(key)
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _token(self, key):
+        return self._generation.get(key, self._floor)
+
+    def _forget(self, key):
+        generation = self._generation.pop(key, None)
+        if generation is not None:
+            self._floor = max(self._floor, generation)
+
+    def _evict(self, key):
+        del self._data[key]
+        self._forget(key)
+        self.evictions += 1
+
+    def token(self, key):
+        """Ambil token sebelum baca DB, supaya set() tidak menimpa invalidate yang lebih baru"""
+        with self._lock:
+            return self._token(key)
+
+    def set(self, key, value, token=None):
+        with self._lock:
+            if token is not None and token != self._token(key):
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._evict(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            self._counter += 1
+            self._generation[key] = self._counter
+            self._generation.move_to_end(key)
+            self._data.pop(key, None)
+            while len(self._generation) > self.max_size:
+                self._forget(next(iter(self._generation)))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generation.clear()
+            self._floor = self._counter
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "lru",
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class LocalSharedClient:
+    """Stand-in lokal untuk client Redis (subset get/set/delete/incr/expire) saat dev & testing"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            expires_at = time.monotonic() + ex if ex else None
+            self._data[name] = (value, expires_at)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._data.pop(name, None) is not None)
+
+    def incr(self, name):
+        with self._lock:
+            value, expires_at = self._data.get(name, (b"0", None))
+            if expires_at is not None and expires_at < time.monotonic():
+                value, expires_at = b"0", None
+            value = str(int(value) + 1).encode()
+            self._data[name] = (value, expires_at)
+            return int(value)
+
+    def expire(self, name, seconds):
+        with self._lock:
+            if name not in self._data:
+                return False
+            self._data[name] = (self._data[name][0], time.monotonic() + seconds)
+            return True
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SharedCache:
+    """
+    Cache bersama antar worker di atas client bergaya Redis.
+    Nilai disimpan di key per generasi (wallet:<key>:<gen>); delete() = INCR
+    wallet:gen:<key> (atomik) lalu hapus nilai generasi lama. set() dengan
+    token lama menulis ke key generasi lama yang tidak dibaca siapa pun,
+    jadi tidak butuh WATCH / script untuk compare-and-set.
+    """
+
+    def __init__(self, client, ttl=30, prefix="wallet:", generation_ttl=86400):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        # Counter generasi ikut kedaluwarsa (jauh lebih lama dari ttl nilai)
+        self.generation_ttl = max(generation_ttl, ttl * 10)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _value_key(self, key, generation):
+        return f"{self.prefix}{key}:{generation}"
+
+    def get(self, key):
+        raw = self.client.get(self._value_key(key, self.token(key)))
+        if raw is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(raw)
+
+    def token(self, key):
+        return int(self.client.get(f"{self.prefix}gen:{key}") or 0)
+
+    def set(self, key, value, token=None):
+        if token is None:
+            token = self.token(key)
+        self.client.set(self._value_key(key, token), json.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        name = f"{self.prefix}gen:{key}"
+        generation = self.client.incr(name)
+        self.client.expire(name, self.generation_ttl)
+        self.client.delete(self._value_key(key, generation - 1))
+
+    def clear(self):
+        self.client.flushdb()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "shared",
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def build_cache(config):
+    """Pilih backend dari WALLET_CACHE_BACKEND: lru (default), local-shared, redis"""
+    backend = config.WALLET_CACHE_BACKEND
+    ttl = config.WALLET_CACHE_TTL
+
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("WALLET_CACHE_BACKEND=redis requires the 'redis' package")
+        return SharedCache(redis.Redis.from_url(config.WALLET_CACHE_URL), ttl=ttl)
+
+    if backend == "local-shared":
+        return SharedCache(LocalSharedClient(), ttl=ttl)
+
+    return LRUCache(max_size=config.WALLET_CACHE_MAX_SIZE, ttl=ttl)
@@ -14,5 +14,37 @@ class Config:
     PORT = int(os.getenv("PORT", 3004))
     SERVICE_NAME = "wallet-service"
 
+    # Retry untuk optimistic update saldo (backend tanpa RETURNING)
+    BALANCE_MAX_RETRIES = int(os.getenv("BALANCE_MAX_RETRIES", 5))
+    # Backoff awal (detik) saat transaksi apply/cancel kena deadlock / serialization failure
+    BALANCE_RETRY_BACKOFF = float(os.getenv("BALANCE_RETRY_BACKOFF", 0.01))
+
+    # Endpoint lama yang mengubah saldo langsung (topup / deduct / batch, saldo awal
+    # saat create) tidak tercatat di ledger transaction-service. Tetap aktif sampai
+    # semua caller (job cashback / settlement) pindah ke transaction-service;
+    # set "false" setelah itu supaya endpoint ini membalas 410 Gone
+    LEGACY_BALANCE_ENDPOINTS_ENABLED = os.getenv("LEGACY_BALANCE_ENDPOINTS_ENABLED", "true").lower() == "true"
+
+    # Lama catatan apply_id (dedupe /internal/wallets/apply) disimpan sebelum di-prune
+    APPLY_DEDUPE_RETENTION_DAYS = int(os.getenv("APPLY_DEDUPE_RETENTION_DAYS", 7))
+
+    # Maksimum slot saldo untuk wallet sharded (merchant dengan traffic tinggi)
+    BALANCE_SLOTS_MAX = int(os.getenv("BALANCE_SLOTS_MAX", 64))
+
+    # Batas jumlah operasi per request POST /wallets/batch
+    WALLET_BATCH_MAX_ITEMS = int(os.getenv("WALLET_BATCH_MAX_ITEMS", 10000))
+
+    # Pagination untuk endpoint list
+    PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 100))
+    PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 1000))
+    STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 1000))
+
+    # Cache wallet per user_id: lru (in-process), local-shared, redis.
+    # lru = cache per worker, worker lain bisa melihat saldo lama sampai TTL habis
+    WALLET_CACHE_BACKEND = os.getenv("WALLET_CACHE_BACKEND", "lru")
+    WALLET_CACHE_TTL = int(os.getenv("WALLET_CACHE_TTL", 5))
+    WALLET_CACHE_MAX_SIZE = int(os.getenv("WALLET_CACHE_MAX_SIZE", 10000))
+    WALLET_CACHE_URL = os.getenv("WALLET_CACHE_URL", "redis://localhost:6379/0")
+
     # URL external (User Service)
     USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:3001")
\ No newline at end of file
@@ -1,22 +1,77 @@
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from datetime import datetime
 
 db = SQLAlchemy()
 
+
+# pysqlite tidak mengirim BEGIN sebelum SAVEPOINT, jadi savepoint pertama
+# (begin_nested di apply_groups / cancel_applies) langsung ter-commit saat
+# di-release dan rollback() sesudahnya tidak membatalkannya. BEGIN dikirim
+# sendiri supaya satu request = satu transaksi, termasuk saat di-retry.
+@event.listens_for(Engine, "connect")
+def _sqlite_disable_autobegin(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.isolation_level = None
+
+
+@event.listens_for(Engine, "begin")
+def _sqlite_begin(conn):
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("BEGIN")
+
 class Wallet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False, unique=True)  # External ID from User Service
     balance = db.Column(db.Float, default=0.0)
     status = db.Column(db.String(30), default='ACTIVE')  # ACTIVE, SUSPENDED
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Optimistic lock counter
+    balance_slots = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # > 0 = sharded (hot) wallet
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # selectin: list wallet memuat slot semua wallet dengan satu query IN, bukan satu query per wallet
+    slots = db.relationship('WalletBalanceSlot', lazy='selectin')
+
+    @property
+    def total_balance(self):
+        """Saldo utama + saldo slot (untuk wallet sharded)"""
+        if not self.balance_slots:
+            return self.balance
+        return (self.balance or 0.0) + sum(s.balance or 0.0 for s in self.slots)
+
     def to_dict(self):
         return {
             'id': self.id,
             'user_id': self.user_id,
-            'balance': self.balance,
+            'balance': self.total_balance,
+            'balance_slots': self.balance_slots,
             'status': self.status,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
-        }
\ No newline at end of file
+        }
+
+class WalletBalanceSlot(db.Model):
+    """Sub-saldo untuk wallet sharded; kredit disebar acak ke slot"""
+    __table_args__ = (db.UniqueConstraint('wallet_id', 'slot'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    wallet_id = db.Column(db.Integer, db.ForeignKey('wallet.id'), nullable=False, index=True)
+    slot = db.Column(db.Integer, nullable=False)
+    balance = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class AppliedDelta(db.Model):
+    """Hasil /internal/wallets/apply per apply_id, supaya kirim ulang tidak menerapkan delta dua kali"""
+    __tablename__ = 'applied_deltas'
+
+    apply_id = db.Column(db.String(64), primary_key=True)
+    # APPLIED, REVERSED (dibatalkan setelah diterapkan), CANCELLED (dibatalkan sebelum sampai)
+    status = db.Column(db.String(20), nullable=False)
+    deltas = db.Column(db.Text, nullable=True)      # JSON [[wallet_id, delta], ...]
+    balances = db.Column(db.Text, nullable=True)    # JSON {wallet_id: saldo baru}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,37 @@
+import json
+
+from flask import Response, stream_with_context
+
+
+# ============================
+#   KEYSET PAGINATION HELPERS
+# ============================
+
+def keyset_page(query, id_column, after=None, limit=100, max_limit=1000):
+    """Ambil satu halaman dengan id > after, return (rows, next_cursor)"""
+    limit = max(1, min(limit, max_limit))
+    if after is not None:
+        query = query.filter(id_column > after)
+
+    # Ambil satu baris ekstra untuk tahu apakah masih ada halaman berikutnya
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], id_column.key)
+    return rows, next_cursor
+
+
+def stream_ndjson(query, id_column, serialize, after=None, limit=None, batch_size=1000):
+    """Stream hasil query sebagai NDJSON memakai server-side cursor (yield_per)"""
+    if after is not None:
+        query = query.filter(id_column > after)
+    query = query.order_by(id_column)
+    if limit is not None:
+        query = query.limit(limit)
+
+    def generate():
+        for row in query.yield_per(batch_size):
+            yield json.dumps(serialize(row), default=str) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
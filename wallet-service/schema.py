@@ -0,0 +1,43 @@
+from sqlalchemy import inspect, text
+
+from models import db
+
+
+# ============================
+#   COLUMN MIGRATION
+# ============================
+# db.create_all() hanya membuat tabel baru. Kolom wallet yang ditambahkan
+# belakangan (version, balance_slots) tidak ada di instance/wallet.db lama,
+# sehingga semua query Wallet gagal "no such column". Kolom yang hilang
+# ditambahkan dengan ALTER TABLE ... ADD COLUMN (nullable / pakai server_default).
+
+def missing_columns():
+    """Return list Column yang ada di model tapi belum ada di database"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        missing.extend(c for c in table.columns if c.name not in existing)
+    return missing
+
+
+def add_missing_columns():
+    """ALTER TABLE untuk setiap kolom yang hilang; return list nama tabel.kolom"""
+    dialect = db.engine.dialect
+    added = []
+    with db.engine.begin() as conn:
+        for column in missing_columns():
+            ddl = f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column.type.compile(dialect)}"
+            if column.server_default is not None:
+                default = column.server_default.arg
+                default = default.text if hasattr(default, "text") else "'" + default.replace("'", "''") + "'"
+                ddl += f" DEFAULT {default}"
+            if not column.nullable and column.server_default is not None:
+                ddl += " NOT NULL"
+            conn.execute(text(ddl))
+            added.append(f"{column.table.name}.{column.name}")
+    return added
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Config dibaca saat import: DATABASE_URL harus di-set sebelum app di-import
+_tmpdir = tempfile.mkdtemp(prefix="wallet-service-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'wallet.db')}"
+os.environ.setdefault("WALLET_CACHE_BACKEND", "lru")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app, wallet_cache  # noqa: E402
+from models import db, Wallet  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config["TESTING"] = True
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        wallet_cache.clear()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_wallet(app):
+    def make(user_id, balance=0.0, **kwargs):
+        wallet = Wallet(user_id=user_id, balance=balance, **kwargs)
+        db.session.add(wallet)
+        db.session.flush()
+        wallet_id = wallet.id
+        # Commit tanpa membaca ulang: transaksi baca yang terbuka menahan lock SQLite
+        db.session.commit()
+        return wallet_id
+    return make
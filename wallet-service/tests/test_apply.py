@@ -0,0 +1,54 @@
+from models import db, Wallet, AppliedDelta
+
+
+def _apply(client, groups):
+    return client.post("/internal/wallets/apply", json={"groups": groups})
+
+
+def _balances():
+    db.session.expire_all()
+    return {w.id: w.balance for w in Wallet.query.order_by(Wallet.id)}
+
+
+def test_group_is_applied_once_per_id(client, make_wallet):
+    a, b = make_wallet(1, 100.0), make_wallet(2, 0.0)
+    group = {"id": "w-1", "deltas": [{"wallet_id": a, "delta": -40}, {"wallet_id": b, "delta": 40}]}
+
+    first = _apply(client, [group]).get_json()["results"][0]
+    replay = _apply(client, [group]).get_json()["results"][0]
+
+    assert first["status"] == replay["status"] == "SUCCESS"
+    assert replay["replayed"] is True
+    assert replay["balances"] == first["balances"]
+    assert _balances() == {a: 60.0, b: 40.0}
+
+
+def test_failed_group_leaves_no_partial_credit(client, make_wallet):
+    a, b = make_wallet(1, 10.0), make_wallet(2, 0.0)
+
+    result = _apply(client, [
+        {"id": "w-1", "deltas": [{"wallet_id": b, "delta": 50}, {"wallet_id": a, "delta": -50}]},
+        {"id": "w-2", "deltas": [{"wallet_id": b, "delta": 5}]},
+    ]).get_json()["results"]
+
+    assert [r["status"] for r in result] == ["FAILED", "SUCCESS"]
+    assert result[0]["error"] == "INSUFFICIENT_BALANCE"
+    assert _balances() == {a: 10.0, b: 5.0}
+    assert db.session.get(AppliedDelta, "w-1") is None
+
+
+def test_cancel_reverses_or_tombstones(client, make_wallet):
+    a = make_wallet(1, 100.0)
+    _apply(client, [{"id": "w-1", "deltas": [{"wallet_id": a, "delta": -30}]}])
+
+    outcomes = client.post("/internal/wallets/apply/cancel", json={"ids": ["w-1", "w-2"]}).get_json()
+    again = client.post("/internal/wallets/apply/cancel", json={"ids": ["w-1"]}).get_json()
+
+    assert outcomes["results"] == {"w-1": "REVERSED", "w-2": "CANCELLED"}
+    assert again["results"] == {"w-1": "REVERSED"}
+    assert _balances() == {a: 100.0}
+
+    # Apply yang datang setelah cancel ditolak, bukan diterapkan
+    late = _apply(client, [{"id": "w-2", "deltas": [{"wallet_id": a, "delta": -30}]}]).get_json()["results"][0]
+    assert (late["status"], late["error"]) == ("FAILED", "CANCELLED")
+    assert _balances() == {a: 100.0}
@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+import balance
+from config import Config
+from balance import credit, debit, InsufficientBalance, WalletNotFound, ConcurrentUpdateError
+from models import db, Wallet
+
+
+@pytest.fixture(params=["returning", "optimistic"])
+def engine_path(request, monkeypatch):
+    """Jalankan test di jalur UPDATE ... RETURNING dan jalur version check"""
+    if request.param == "optimistic":
+        monkeypatch.setattr(balance, "_supports_returning", lambda: False)
+    return request.param
+
+
+def _balance(user_id):
+    db.session.expire_all()
+    return Wallet.query.filter_by(user_id=user_id).one().balance
+
+
+def test_credit_and_debit_return_new_balance(engine_path, make_wallet):
+    make_wallet(1, 100.0)
+
+    assert credit(1, 50.0) == 150.0
+    assert debit(1, 30.0) == 120.0
+    db.session.commit()
+
+    wallet = Wallet.query.filter_by(user_id=1).one()
+    assert wallet.balance == 120.0
+    assert wallet.version == 2
+
+
+def test_debit_never_goes_negative(engine_path, make_wallet):
+    make_wallet(1, 10.0)
+
+    with pytest.raises(InsufficientBalance):
+        debit(1, 10.01)
+    db.session.rollback()
+
+    assert _balance(1) == 10.0
+    assert debit(1, 10.0) == 0.0
+
+
+def test_unknown_wallet(engine_path, app):
+    with pytest.raises(WalletNotFound):
+        credit(99, 1.0)
+    with pytest.raises(WalletNotFound):
+        debit(99, 1.0)
+
+
+def test_optimistic_path_gives_up_when_version_keeps_changing(app, make_wallet, monkeypatch):
+    make_wallet(1, 100.0)
+    monkeypatch.setattr(balance, "_supports_returning", lambda: False)
+
+    real_execute = db.session.execute
+
+    def execute(stmt, *args, **kwargs):
+        # Writer lain menaikkan version tepat sebelum UPDATE bersyarat kita
+        if getattr(stmt, "is_update", False):
+            real_execute(Wallet.__table__.update().values(version=Wallet.version + 1))
+        return real_execute(stmt, *args, **kwargs)
+
+    monkeypatch.setattr(db.session, "execute", execute)
+    with pytest.raises(ConcurrentUpdateError):
+        debit(1, 10.0, max_retries=3)
+
+
+def test_concurrent_debits_do_not_overdraw(app, make_wallet):
+    make_wallet(1, 100.0)
+    outcomes = []
+
+    def worker():
+        with app.app_context():
+            try:
+                debit(1, 10.0)
+                db.session.commit()
+                outcomes.append("ok")
+            except InsufficientBalance:
+                db.session.rollback()
+                outcomes.append("insufficient")
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(15)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert outcomes.count("ok") == 10
+    assert outcomes.count("insufficient") == 5
+    assert _balance(1) == 0.0
+
+
+def test_legacy_endpoints_stay_enabled_by_default(client, make_wallet):
+    make_wallet(1, 100.0)
+
+    assert client.post("/wallets/topup", json={"user_id": 1, "amount": 10}).status_code == 200
+    assert client.post("/wallets/deduct", json={"user_id": 1, "amount": 30}).status_code == 200
+    response = client.post("/wallets/batch", json={"operations": [
+        {"user_id": 1, "type": "TOPUP", "amount": 5},
+        {"user_id": 1, "type": "DEDUCT", "amount": 500},
+    ]})
+
+    assert response.status_code == 200
+    assert response.get_json()["succeeded"] == 1
+    assert _balance(1) == 85.0
+
+
+def test_legacy_endpoints_return_410_once_disabled(client, make_wallet, monkeypatch):
+    monkeypatch.setattr(Config, "LEGACY_BALANCE_ENDPOINTS_ENABLED", False)
+    make_wallet(1, 100.0)
+
+    response = client.post("/wallets/topup", json={"user_id": 1, "amount": 10})
+
+    assert response.status_code == 410
+    assert client.post("/wallets/", json={"user_id": 2, "balance": 50}).status_code == 410
+    assert _balance(1) == 100.0